@@ -0,0 +1,44 @@
+# backfill_phone_fields.py
+# One-off: compute phone_e164 / phone_tz / phone_valid for leads accepted before
+# those columns existed, so the dialer can read them instead of re-parsing.
+#
+#   python backfill_phone_fields.py
+#   python backfill_phone_fields.py --dry-run
+import sys
+
+from main import supabase, compute_phone_fields
+
+PAGE_SIZE = 500
+
+def backfill(dry_run: bool = False):
+    last_id = None
+    scanned = updated = no_phone = 0
+    while True:
+        q = (supabase.table("leads").select("*")
+             .is_("phone_e164", "null")
+             .order("id", desc=False)
+             .limit(PAGE_SIZE))
+        if last_id:
+            q = q.gt("id", last_id)
+        rows = q.execute().data or []
+        if not rows:
+            break
+        for row in rows:
+            last_id = row["id"]
+            scanned += 1
+            fields = compute_phone_fields(row)
+            if not fields.get("phone_e164"):
+                no_phone += 1
+                continue
+            if not dry_run:
+                try:
+                    supabase.table("leads").update(fields).eq("id", row["id"]).execute()
+                except Exception as e:
+                    print(f"[BACKFILL] update failed lead_id={row['id']}: {e}")
+                    continue
+            updated += 1
+        print(f"[BACKFILL] scanned={scanned} updated={updated} no_phone={no_phone}")
+    print(f"[BACKFILL] done scanned={scanned} updated={updated} no_phone={no_phone} dry_run={dry_run}")
+
+if __name__ == "__main__":
+    backfill(dry_run="--dry-run" in sys.argv)
@@ -2,7 +2,7 @@ import phonenumbers
 from phonenumbers import timezone as ph_timezone
 from datetime import datetime
 import pytz
-import requests
+import outbound_http
 import time
 from supabase import create_client, Client
 
@@ -55,7 +55,7 @@ def make_vapi_call(phone, lead):
         "Authorization": f"Bearer {VAPI_API_KEY}",
         "Content-Type": "application/json"
     }
-    resp = requests.post(url, json=payload, headers=headers)
+    resp = outbound_http.post(url, json=payload, headers=headers)
     print(f"Call to {phone} ({payload['metadata']['lead_name']}): {resp.status_code}, {resp.text}")
     return resp.status_code, resp.text
 
@@ -198,19 +198,21 @@ def bill_call_completion(
     lead_id: str,
     external_call_id: Optional[str],
     duration_seconds: int,
-    price_cents_per_minute: int = PRICE_CENTS_PER_MINUTE  # kept for signature compatibility (unused for billing)
+    price_cents_per_minute: int = PRICE_CENTS_PER_MINUTE,  # kept for signature compatibility (unused for billing)
+    user_id: Optional[str] = None,
 ) -> None:
     """
     Charges the shared domain of the lead's owner for a completed call.
     Now bills in CREDITS: ceil(duration_seconds / 60), min 1 credit.
+    Pass user_id when the caller already knows the owner to skip the lead lookup.
     """
     # Find the lead's user_id (owner) to resolve domain
-    user_id = None
-    try:
-        lres = supabase.table("leads").select("user_id").eq("id", lead_id).single().execute()
-        user_id = (getattr(lres, "data", None) or {}).get("user_id")
-    except Exception:
-        pass
+    if not user_id:
+        try:
+            lres = supabase.table("leads").select("user_id").eq("id", lead_id).single().execute()
+            user_id = (getattr(lres, "data", None) or {}).get("user_id")
+        except Exception:
+            pass
 
     domain = email_domain_of(supabase, user_id)
     if not domain:
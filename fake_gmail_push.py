@@ -0,0 +1,40 @@
+# fake_gmail_push.py
+# Local stand-in for Google Pub/Sub: POSTs a Gmail watch notification envelope
+# to /webhooks/gmail-push exactly the way a push subscription would.
+#
+#   python fake_gmail_push.py you@yourdomain.com 123456
+#   python fake_gmail_push.py you@yourdomain.com 123456 http://localhost:8080
+import os
+import sys
+import json
+import base64
+from uuid import uuid4
+from datetime import datetime, timezone
+
+import requests
+
+PUSH_PATH = "/webhooks/gmail-push"
+
+def build_envelope(email_address: str, history_id, subscription: str = "projects/local/subscriptions/gmail-push") -> dict:
+    data = json.dumps({"emailAddress": email_address, "historyId": int(history_id)}).encode("utf-8")
+    return {
+        "message": {
+            "data": base64.b64encode(data).decode("ascii"),
+            "messageId": str(uuid4()),
+            "publishTime": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        },
+        "subscription": subscription,
+    }
+
+def publish(base_url: str, email_address: str, history_id, token: str = "") -> requests.Response:
+    url = base_url.rstrip("/") + PUSH_PATH
+    params = {"token": token} if token else None
+    return requests.post(url, json=build_envelope(email_address, history_id), params=params, timeout=10)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("usage: python fake_gmail_push.py <email_address> <history_id> [base_url]")
+        sys.exit(2)
+    base = sys.argv[3] if len(sys.argv) > 3 else os.getenv("PUSH_BASE_URL", "http://localhost:8080")
+    resp = publish(base, sys.argv[1], sys.argv[2], token=os.getenv("GMAIL_PUSH_VERIFICATION_TOKEN", ""))
+    print(f"POST {base}{PUSH_PATH} -> {resp.status_code} {resp.text}")
@@ -1,19 +1,23 @@
 import os
 import re
 import json
-import requests
+import outbound_http
 from uuid import uuid4
 from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Tuple, Dict, Any
 
-from fastapi import FastAPI, Request, BackgroundTasks, HTTPException, Body
-from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Request, Response, BackgroundTasks, HTTPException, Body
+from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.schedulers.base import SchedulerAlreadyRunningError
+from apscheduler.executors.pool import ThreadPoolExecutor as SchedulerThreadPool
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
 import json
-from supabase import create_client, Client
+from supabase import Client
+from supabase_pool import pooled_client
+import pg_backend
 from datetime import datetime, timedelta, timezone
 import pytz
 import phonenumbers
@@ -31,6 +35,19 @@ from urllib.parse import urlencode
 import sys
 from fastapi import Query, BackgroundTasks, HTTPException
 import asyncio, os
+import threading
+import queue
+import time
+import zlib
+import hashlib
+import hmac
+import heapq
+import csv
+import codecs
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from uuid import uuid4
 # ---- env helper (add this near the top, after imports) ----
 import os
@@ -51,7 +68,7 @@ from credits import (
 )
 
 # Stripe credit top-up system
-from stripe_credits import router as stripe_router
+from stripe_credits import router as stripe_router, on_domain_credited
 
 # ---- Google libs ----
 try:
@@ -101,6 +118,28 @@ APIFY_TOKEN = os.getenv("APIFY_TOKEN", "").strip()
 APIFY_ACTOR_ID = "VYRyEF4ygTTkaIghe"  # pipelinelabs~lead-scraper-apollo-zoominfo-lusha
 if not APIFY_TOKEN:
     print("!!! WARNING: APIFY_TOKEN not set. NL scrape endpoint will fail.")
+APIFY_MAX_CONCURRENT_RUNS = int(os.getenv("APIFY_MAX_CONCURRENT_RUNS", "2"))
+APIFY_POLL_SECONDS = float(os.getenv("APIFY_POLL_SECONDS", "3"))
+APIFY_RUN_TIMEOUT_SECONDS = int(os.getenv("APIFY_RUN_TIMEOUT_SECONDS", "1800"))
+SCRAPE_PAGE_SIZE = int(os.getenv("SCRAPE_PAGE_SIZE", "500"))
+SCRAPE_JOB_RETENTION_MINUTES = int(os.getenv("SCRAPE_JOB_RETENTION_MINUTES", "360"))
+# The process running a job heartbeats its row; an unfinished job silent for longer is dead
+SCRAPE_JOB_HEARTBEAT_SECONDS = int(os.getenv("SCRAPE_JOB_HEARTBEAT_SECONDS", "30"))
+SCRAPE_JOB_STALE_SECONDS = max(4 * SCRAPE_JOB_HEARTBEAT_SECONDS, int(os.getenv("SCRAPE_JOB_STALE_SECONDS", "180")))
+SCRAPE_STREAM_GRACE_SECONDS = int(os.getenv("SCRAPE_STREAM_GRACE_SECONDS", "120"))
+SCRAPE_CACHE_TTL_SECONDS = int(os.getenv("SCRAPE_CACHE_TTL_SECONDS", "3600"))
+SCRAPE_CACHE_MAX_ENTRIES = int(os.getenv("SCRAPE_CACHE_MAX_ENTRIES", "256"))
+# Requested counts are rounded up to one of these before the actor runs, so near-identical
+# requests share a cache entry; above the last bucket counts round up to a multiple of it.
+SCRAPE_CACHE_COUNT_BUCKETS = sorted(
+    int(x) for x in os.getenv("SCRAPE_CACHE_COUNT_BUCKETS", "100,250,500,1000,2500,5000").split(",") if x.strip()
+)
+try:
+    from apify_client import ApifyClient
+    _APIFY_CLIENT_AVAILABLE = True
+except Exception as _e:
+    print("[APIFY] apify-client not available:", _e)
+    _APIFY_CLIENT_AVAILABLE = False
 
 TERMINAL_STATUSES = {"completed", "no-answer", "busy", "failed", "canceled"}
 
@@ -122,7 +161,73 @@ GOOGLE_SCOPES = [
 
 GOOGLE_TOKENS_TABLE = os.getenv("GOOGLE_TOKENS_TABLE", "google_oauth_tokens")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Gmail push: users.watch -> Pub/Sub push subscription -> POST /webhooks/gmail-push
+GMAIL_PUSH_ENABLED = _env("GMAIL_PUSH_ENABLED", "false").lower() == "true"
+GMAIL_PUSH_TOPIC = os.getenv("GMAIL_PUSH_TOPIC", "").strip()  # projects/<project>/topics/<topic>
+GMAIL_PUSH_VERIFICATION_TOKEN = os.getenv("GMAIL_PUSH_VERIFICATION_TOKEN", "").strip()
+GMAIL_WATCH_TABLE = os.getenv("GMAIL_WATCH_TABLE", "gmail_watch_state")
+# With push on, the inbox poller only runs as a slow safety net
+GMAIL_SAFETY_POLL_MINUTES = int(os.getenv("GMAIL_SAFETY_POLL_MINUTES", "30"))
+# The push endpoint is unauthenticated apart from the shared token, so push needs one
+if GMAIL_PUSH_ENABLED and not GMAIL_PUSH_VERIFICATION_TOKEN:
+    print("[Gmail Push] GMAIL_PUSH_VERIFICATION_TOKEN is not set; push disabled, polling every 2m")
+    GMAIL_PUSH_ENABLED = False
+
+# Pool of clients behind a Client-shaped proxy; each thread uses the client pinned to it
+supabase: Client = pooled_client(SUPABASE_URL, SUPABASE_KEY)
+
+# ---------------------------------------------------
+# Read replica routing (dashboard reads; freshness-guarded)
+# ---------------------------------------------------
+SUPABASE_READ_URL = os.getenv("SUPABASE_READ_URL", "").strip()
+SUPABASE_READ_KEY = os.getenv("SUPABASE_READ_KEY", "").strip() or SUPABASE_KEY
+# A key written in this process within this many seconds is read from the primary (replica lag budget)
+READ_REPLICA_FRESHNESS_SECONDS = float(os.getenv("READ_REPLICA_FRESHNESS_SECONDS", "5"))
+READ_REPLICA_TRACKED_KEYS = 20000
+
+supabase_read: Optional[Client] = pooled_client(SUPABASE_READ_URL, SUPABASE_READ_KEY) if SUPABASE_READ_URL else None
+_wrote_in_request: ContextVar[bool] = ContextVar("wrote_in_request", default=False)
+_recent_writes: "OrderedDict[str, float]" = OrderedDict()
+_recent_writes_lock = threading.Lock()
+_read_route_counts = {"replica": 0, "primary": 0, "primary_fresh": 0}
+
+def note_write(*keys):
+    """Record a write so reads in the same request, and reads of these keys for a short while, stay on the primary."""
+    _wrote_in_request.set(True)
+    now = time.monotonic()
+    with _recent_writes_lock:
+        for k in keys:
+            if k:
+                _recent_writes[str(k)] = now
+                _recent_writes.move_to_end(str(k))
+        while len(_recent_writes) > READ_REPLICA_TRACKED_KEYS:
+            _recent_writes.popitem(last=False)
+
+def read_db(*keys) -> Client:
+    """Client for a read-mostly path: the replica unless it could miss a recent write."""
+    if supabase_read is None:
+        _read_route_counts["primary"] += 1
+        return supabase
+    fresh = _wrote_in_request.get()
+    if not fresh and keys:
+        cutoff = time.monotonic() - READ_REPLICA_FRESHNESS_SECONDS
+        with _recent_writes_lock:
+            fresh = any(_recent_writes.get(str(k), 0) > cutoff for k in keys if k)
+    if fresh:
+        _read_route_counts["primary_fresh"] += 1
+        return supabase
+    _read_route_counts["replica"] += 1
+    return supabase_read
+
+def read_routing_metrics() -> dict:
+    with _recent_writes_lock:
+        tracked = len(_recent_writes)
+    return {"replica_configured": supabase_read is not None, "tracked_keys": tracked, **_read_route_counts}
+
+# Hot-path queries can bypass PostgREST: DATA_BACKEND=postgres + DATABASE_URL (see pg_backend.py)
+DATA_BACKEND = _env("DATA_BACKEND", "postgrest").lower()
+_pg = pg_backend.get_backend() if DATA_BACKEND == "postgres" else None
+print(f"[ENV] DATA_BACKEND={DATA_BACKEND} (direct postgres {'on' if _pg else 'off'})")
 
 app = FastAPI()
 app.add_middleware(
@@ -133,6 +238,162 @@ app.add_middleware(
 # Attach Stripe router
 app.include_router(stripe_router)
 
+# ---------------------------------------------------
+# Blocking work from async handlers
+# ---------------------------------------------------
+# supabase-py, googleapiclient, requests and smtplib are all synchronous; async routes hand
+# them to this pool so a slow PostgREST/Google call never stalls the event loop.
+BLOCKING_IO_WORKERS = int(os.getenv("BLOCKING_IO_WORKERS", "16"))
+_blocking_pool = ThreadPoolExecutor(max_workers=max(1, BLOCKING_IO_WORKERS), thread_name_prefix="blocking-io")
+
+async def run_blocking(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(_blocking_pool, partial(fn, *args, **kwargs))
+
+# ---------------------------------------------------
+# Read-through response cache + conditional GET (ETag / If-None-Match)
+# ---------------------------------------------------
+READ_CACHE_MAX_ENTRIES = int(os.getenv("READ_CACHE_MAX_ENTRIES", "5000"))
+READ_CACHE_TTLS = {
+    "lead": float(os.getenv("LEAD_CACHE_TTL_SECONDS", "5")),
+    "oauth_status": float(os.getenv("OAUTH_STATUS_CACHE_TTL_SECONDS", "60")),
+    "credits": float(os.getenv("CREDITS_CACHE_TTL_SECONDS", "10")),
+    "credits_domain": float(os.getenv("CREDITS_DOMAIN_CACHE_TTL_SECONDS", "600")),
+    "campaign_instructions": float(os.getenv("CAMPAIGN_INSTRUCTIONS_CACHE_TTL_SECONDS", "60")),
+    "admin": float(os.getenv("ADMIN_CACHE_TTL_SECONDS", "30")),
+}
+
+# (namespace, key) -> (expires_monotonic, etag, payload)
+_read_cache: "OrderedDict[Tuple[str, str], Tuple[float, str, Any]]" = OrderedDict()
+_read_cache_lock = threading.Lock()
+
+def _payload_etag(payload) -> str:
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+def read_cache_get(ns: str, key: str) -> Optional[Tuple[str, Any]]:
+    now = time.monotonic()
+    with _read_cache_lock:
+        hit = _read_cache.get((ns, key))
+        if not hit:
+            return None
+        if hit[0] < now:
+            _read_cache.pop((ns, key), None)
+            return None
+        _read_cache.move_to_end((ns, key))
+        return hit[1], hit[2]
+
+def read_cache_put(ns: str, key: str, payload) -> str:
+    etag = _payload_etag(payload)
+    ttl = READ_CACHE_TTLS.get(ns, 0)
+    if ttl > 0:
+        with _read_cache_lock:
+            _read_cache[(ns, key)] = (time.monotonic() + ttl, etag, payload)
+            _read_cache.move_to_end((ns, key))
+            while len(_read_cache) > READ_CACHE_MAX_ENTRIES:
+                _read_cache.popitem(last=False)
+    return etag
+
+def read_cache_invalidate(ns: str, key: Optional[str] = None):
+    """Drop one key, or the whole namespace when key is None."""
+    with _read_cache_lock:
+        if key is not None:
+            _read_cache.pop((ns, str(key)), None)
+            return
+        for k in [k for k in _read_cache if k[0] == ns]:
+            _read_cache.pop(k, None)
+
+def cached_read(ns: str, key: str, loader):
+    """(etag, payload) from cache, or from loader() which may return None to mean "don't cache"."""
+    hit = read_cache_get(ns, key)
+    if hit:
+        return hit
+    payload = loader()
+    if payload is None:
+        return None, None
+    return read_cache_put(ns, key, payload), payload
+
+# Cross-process invalidation: writers append (ns, key) to cache_invalidations and every
+# process polls it. Entries that must not outlive a change made elsewhere (admin grants)
+# are only trusted while the poller is current (cache_invalidations_live()).
+CACHE_INVALIDATIONS_TABLE = os.getenv("CACHE_INVALIDATIONS_TABLE", "cache_invalidations")
+CACHE_INVALIDATION_POLL_SECONDS = float(os.getenv("CACHE_INVALIDATION_POLL_SECONDS", "2"))
+CACHE_INVALIDATION_RETENTION_SECONDS = 3600
+
+_invalidation_state = {"last_id": None, "ok_at": 0.0, "applied": 0}
+_invalidation_thread: Optional[threading.Thread] = None
+_invalidation_lock = threading.Lock()
+_recent_invalidations: Dict[Tuple[str, Optional[str]], float] = {}  # (ns, key) -> monotonic applied at
+
+def invalidated_since(ns: str, key: str, since: float) -> bool:
+    """Whether (ns, key) was invalidated after `since`: a value loaded before then may be stale."""
+    with _invalidation_lock:
+        return any(_recent_invalidations.get(k, 0.0) >= since for k in ((ns, key), (ns, None)))
+
+def publish_cache_invalidation(ns: str, key: Optional[str] = None):
+    """Drop (ns, key) here and in every other process."""
+    read_cache_invalidate(ns, key)
+    try:
+        supabase.table(CACHE_INVALIDATIONS_TABLE).insert({"ns": ns, "key": key}).execute()
+    except Exception as e:
+        print(f"[CACHE] could not publish invalidation {ns}:{key}:", e)
+
+def _cache_invalidation_loop():
+    while True:
+        try:
+            last_id = _invalidation_state["last_id"]
+            if last_id is None:
+                res = supabase.table(CACHE_INVALIDATIONS_TABLE).select("id").order("id", desc=True).limit(1).execute()
+                rows = getattr(res, "data", None) or []
+                _invalidation_state["last_id"] = int(rows[0]["id"]) if rows else 0
+            else:
+                res = (supabase.table(CACHE_INVALIDATIONS_TABLE).select("id,ns,key")
+                       .gt("id", last_id).order("id").limit(500).execute())
+                now = time.monotonic()
+                for r in getattr(res, "data", None) or []:
+                    read_cache_invalidate(r["ns"], r.get("key"))
+                    with _invalidation_lock:
+                        _recent_invalidations[(r["ns"], r.get("key"))] = now
+                    _invalidation_state["last_id"] = int(r["id"])
+                    _invalidation_state["applied"] += 1
+                with _invalidation_lock:
+                    for k in [k for k, t in _recent_invalidations.items() if now - t > 60]:
+                        _recent_invalidations.pop(k, None)
+            _invalidation_state["ok_at"] = time.monotonic()
+        except Exception as e:
+            print("[CACHE] invalidation poll failed:", e)
+        time.sleep(max(0.2, CACHE_INVALIDATION_POLL_SECONDS))
+
+def start_cache_invalidation_listener():
+    global _invalidation_thread
+    with _invalidation_lock:
+        if _invalidation_thread is None:
+            _invalidation_thread = threading.Thread(target=_cache_invalidation_loop,
+                                                    name="cache-invalidations", daemon=True)
+            _invalidation_thread.start()
+
+def cache_invalidations_live() -> bool:
+    """True while the poller has caught up recently, i.e. remote invalidations reach us."""
+    return time.monotonic() - _invalidation_state["ok_at"] < 3 * CACHE_INVALIDATION_POLL_SECONDS
+
+def prune_cache_invalidations():
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=CACHE_INVALIDATION_RETENTION_SECONDS)).isoformat()
+    supabase.table(CACHE_INVALIDATIONS_TABLE).delete().lt("created_at", cutoff).execute()
+
+def conditional_response(request: Request, etag: str, payload):
+    """304 when the client already holds this ETag, else the JSON payload with the ETag attached."""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    inm = request.headers.get("if-none-match") or ""
+    if etag in [t.strip() for t in inm.split(",")] or inm.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(payload, headers=headers)
+
+# Stripe top-ups land in stripe_credits.py; drop the cached balance there too
+def _on_stripe_topup(domain: str):
+    note_write(domain)
+    read_cache_invalidate("credits", domain)
+
+on_domain_credited(_on_stripe_topup)
+
 def _get_request_user_id(req: Request) -> Optional[str]:
     hdr = req.headers.get("X-User-Id")
     if hdr: return hdr.strip()
@@ -185,25 +446,96 @@ def _extract_sheet_id(sheet_url: str) -> str | None:
     m = re.search(r"/spreadsheets/d/([a-zA-Z0-9-_]+)", sheet_url)
     return m.group(1) if m else None
 
+SHEET_CONNECT_TIMEOUT_SECONDS = float(os.getenv("SHEET_CONNECT_TIMEOUT_SECONDS", "10"))
+SHEET_READ_TIMEOUT_SECONDS = float(os.getenv("SHEET_READ_TIMEOUT_SECONDS", "60"))
+SHEET_STREAM_CHUNK_BYTES = 64 * 1024
+
+def _probe_sheet_gid(sid: str, gid) -> Optional[Tuple[Any, bytes]]:
+    """Open one export URL with a streamed body; returns (response, first_bytes) if it is CSV."""
+    export = f"https://docs.google.com/spreadsheets/d/{sid}/export?" + urlencode({"format": "csv", "gid": gid})
+    try:
+        r = outbound_http.get(export, stream=True, timeout=(SHEET_CONNECT_TIMEOUT_SECONDS, SHEET_READ_TIMEOUT_SECONDS))
+    except Exception as e:
+        print(f"[SHEET] probe gid={gid} failed:", e)
+        return None
+    first = b""
+    if r.status_code == 200:
+        try:
+            first = next(r.iter_content(SHEET_STREAM_CHUNK_BYTES), b"")
+        except Exception:
+            first = b""
+    head = first[:40].lower()
+    # crude HTML sniff; CSV shouldn't begin with html
+    if r.status_code != 200 or not first or b"<!doctype html" in head or b"<html" in head:
+        r.close()
+        return None
+    return r, first
+
+def _open_sheet_csv_stream(sheet_url: str, gid_candidates=(0, 1837663021)):
+    """
+    Probe all gid candidates at once and return (byte_iterator, gid) for the first candidate
+    (in the given order) that serves CSV, or None. The body is not read past the first chunk.
+    """
+    sid = _extract_sheet_id(sheet_url)
+    if not sid:
+        return None
+    gids = list(gid_candidates)
+    with ThreadPoolExecutor(max_workers=max(1, len(gids)), thread_name_prefix="sheet-probe") as pool:
+        results = list(pool.map(lambda g: _probe_sheet_gid(sid, g), gids))
+    chosen = None
+    for gid, res in zip(gids, results):
+        if res is None:
+            continue
+        if chosen is None:
+            chosen = (gid, res)
+        else:
+            res[0].close()
+    if chosen is None:
+        return None
+    gid, (resp, first) = chosen
+
+    def body():
+        try:
+            yield first
+            for part in resp.iter_content(SHEET_STREAM_CHUNK_BYTES):
+                if part:
+                    yield part
+        finally:
+            resp.close()
+    return body(), gid
+
 def _download_csv_from_sheet(sheet_url: str, gid_candidates=(0, 1837663021)) -> tuple[bytes, int] | None:
     """
     Returns (csv_bytes, gid) when accessible, otherwise None.
     NOTE: This only works if the sheet is shared "Anyone with link -> Viewer" AND allows download/print/copy,
     or if it's 'Published to the web' as CSV. Otherwise Google returns HTML.
     """
-    sid = _extract_sheet_id(sheet_url)
-    if not sid:
+    opened = _open_sheet_csv_stream(sheet_url, gid_candidates)
+    if not opened:
         return None
-    for gid in gid_candidates:
-        export = f"https://docs.google.com/spreadsheets/d/{sid}/export?format=csv&gid={gid}"
-        r = requests.get(export, timeout=60)
-        head = (r.content or b"")[:40].lower()
-        # crude HTML sniff; CSV shouldn't begin with html
-        if b"<!doctype html" in head or b"<html" in head:
-            continue
-        if r.status_code == 200 and r.content:
-            return (r.content, gid)
-    return None
+    parts, gid = opened
+    return (b"".join(parts), gid)
+
+def _iter_csv_rows(byte_iter):
+    """Decode a CSV byte stream incrementally and yield rows (lists of str)."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+
+    def lines():
+        buf = ""
+        for part in byte_iter:
+            buf += decoder.decode(part)
+            cut = buf.rfind("\n")
+            if cut >= 0:
+                # split on \n only (str.splitlines also breaks on \x0b, \x0c, \u2028 ... inside
+                # cells) and keep line endings so csv can reassemble quoted multi-line cells
+                for line in buf[:cut].split("\n"):
+                    yield line + "\n"
+                buf = buf[cut + 1:]
+        buf += decoder.decode(b"", final=True)
+        if buf:
+            yield buf
+
+    yield from csv.reader(lines())
 
 # ===================================================
 # Campaign rules (merge overrides with sane defaults)
@@ -379,15 +711,58 @@ def get_local_tz_for_phone(phone) -> Optional[pytz.BaseTzInfo]:
     except Exception:
         return None
 
-def in_call_window_now(phone, start_hour: int, end_hour: int) -> bool:
-    tz = get_local_tz_for_phone(phone)
+def compute_phone_fields(lead) -> Dict:
+    """
+    Resolve the lead's phone once and return the columns we persist on the lead:
+    phone_e164, phone_tz and phone_valid. Returns {} when the lead has no phone at all, so
+    callers never overwrite stored values with nulls for lack of input. A phone that doesn't
+    parse returns nulls with phone_valid False, clearing values left from an earlier number.
+    """
+    raw = get_valid_phone(lead)
+    if not raw:
+        return {}
+    try:
+        number = phonenumbers.parse(str(raw), None)
+    except Exception:
+        return {"phone_e164": None, "phone_tz": None, "phone_valid": False}
+    tz_name = None
+    for name in ph_timezone.time_zones_for_number(number) or []:
+        if name in pytz.all_timezones_set:
+            tz_name = name
+            break
+    return {
+        "phone_e164": phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164),
+        "phone_tz": tz_name,
+        "phone_valid": bool(phonenumbers.is_valid_number(number)),
+    }
+
+def lead_phone_and_tz(lead) -> Tuple[Optional[str], Optional[pytz.BaseTzInfo]]:
+    """
+    Phone + timezone for dialing and window checks. Reads the precomputed columns when
+    present and only falls back to alias search + parsing for leads not yet backfilled.
+    A number already known to be invalid gives (None, None), so it is never dialed.
+    """
+    if lead.get("phone_valid") is False:
+        return None, None
+    e164 = lead.get("phone_e164")
+    if e164:
+        tz_name = lead.get("phone_tz")
+        try:
+            return e164, (pytz.timezone(tz_name) if tz_name else None)
+        except Exception:
+            return e164, None
+    phone = get_valid_phone(lead)
+    return phone, (get_local_tz_for_phone(phone) if phone else None)
+
+def in_call_window_now(phone, start_hour: int, end_hour: int, tz: Optional[pytz.BaseTzInfo] = None) -> bool:
+    tz = tz or get_local_tz_for_phone(phone)
     if not tz:
         return False
     now_local = datetime.now(tz)
     return start_hour <= now_local.hour < end_hour
 
-def next_window_start(phone, start_hour: int, end_hour: int) -> Optional[datetime]:
-    tz = get_local_tz_for_phone(phone)
+def next_window_start(phone, start_hour: int, end_hour: int, tz: Optional[pytz.BaseTzInfo] = None) -> Optional[datetime]:
+    tz = tz or get_local_tz_for_phone(phone)
     if not tz:
         return None
     now_local = datetime.now(tz)
@@ -564,19 +939,31 @@ def log_call_to_supabase(lead_id: str, call_status: str, notes: str = "", extern
         print(f"[WARN] Skipping call log (missing lead_id). status={call_status} notes={notes[:120]}")
         return
     try:
-        supabase.table("call_logs").insert({
+        _insert_call_log({
             "lead_id": lead_id,
             "user_id": user_id,                 # <-- never None now
             "call_status": call_status,
             "notes": (notes or "")[:1000],
-        }).execute()
+        })
     except Exception as e:
         print("Call log insert failed:", e)
 
+def _insert_call_log(row: dict):
+    note_write(row.get("lead_id"))
+    if _pg:
+        # Only retry when the insert never left: after a timeout the row may already be
+        # committed and a second insert would duplicate it, so other errors surface.
+        try:
+            _pg.insert_row("call_logs", row)
+            return
+        except pg_backend.PgNotSentError as e:
+            print("[PG] call_logs insert not sent; retrying via PostgREST:", e)
+    supabase.table("call_logs").insert(row).execute()
+
 def log_call_enqueued_structured(lead_id: str, attempt_number: int, external_call_id: Optional[str]):
     try:
         uid = _get_lead_user_id(lead_id) or DEFAULT_USER_ID
-        supabase.table("call_logs").insert({
+        _insert_call_log({
             "user_id": uid,                      # <-- ensure NOT NULL
             "lead_id": lead_id,
             "call_status": "queued",
@@ -585,7 +972,7 @@ def log_call_enqueued_structured(lead_id: str, attempt_number: int, external_cal
             "provider_call_id": external_call_id,
             "attempt_number": attempt_number,
             "started_at": datetime.utcnow().isoformat()
-        }).execute()
+        })
     except Exception as e:
         print("Structured enqueue log failed:", e)
 
@@ -604,15 +991,41 @@ def update_structured_call_log(lead_id: str, external_call_id: Optional[str], pa
     except Exception as e:
         print("Structured call_log update failed:", e)
 
+def _refreshed_phone_fields(lead_id, patch: dict) -> Dict:
+    """Recompute phone_e164/phone_tz/phone_valid for a patch that edits the lead's phone."""
+    try:
+        res = supabase.table("leads").select("*").eq("id", lead_id).limit(1).execute()
+        current = (getattr(res, "data", None) or [{}])[0]
+    except Exception as e:
+        print("[PHONE] could not load lead for phone refresh:", e)
+        current = {}
+    fields = compute_phone_fields({**current, **patch})
+    # phone removed altogether: the stored columns no longer describe anything
+    return fields or {"phone_e164": None, "phone_tz": None, "phone_valid": None}
+
 def update_lead(lead_id, patch: dict):
     if not lead_id:
         print("[WARN] update_lead called with empty lead_id. Patch ignored.")
         return
     patch = {**patch, "updated_at": datetime.utcnow().isoformat()}
+    if ("phone" in patch or "contact_phone_numbers" in patch) and "phone_e164" not in patch:
+        patch.update(_refreshed_phone_fields(lead_id, patch))
+    note_write(lead_id)
+    if "next_call_at" in patch:
+        # schedule_next_call / inc_attempts_and_reschedule / call placed: keep the dispatcher heap current
+        note_next_call(lead_id, patch["next_call_at"])
     try:
+        if _pg:
+            try:
+                _pg.update_by_id("leads", lead_id, patch)
+                read_cache_invalidate("lead", lead_id)
+                return
+            except Exception as e:
+                print("[PG] lead update failed; retrying via PostgREST:", e)
         supabase.table("leads").update(patch).eq("id", lead_id).execute()
     except Exception as e:
         print("Lead update failed:", e)
+    read_cache_invalidate("lead", lead_id)
 
 def stop_sequence_for_lead(lead_id: str, reason: str = "reply"):
     """Stop any pending follow-up emails for this lead."""
@@ -654,7 +1067,7 @@ def inc_attempts_and_reschedule(lead, max_attempts: int, after_minutes=30):
             "next_call_at": None,
         })
         log_call_to_supabase(lead.get("id"), "max-retries", f"Reached {max_attempts} attempts")
-        return
+        return None
     next_time = datetime.utcnow() + timedelta(minutes=after_minutes)
     update_lead(lead.get("id"), {
         "call_attempts": attempts,
@@ -662,6 +1075,7 @@ def inc_attempts_and_reschedule(lead, max_attempts: int, after_minutes=30):
         "next_call_at": next_time.isoformat(),
     })
     log_call_to_supabase(lead.get("id"), "scheduled-retry", f"Retry at {next_time.isoformat()} UTC")
+    return next_time
 
 # ===================================================
 # Provider call (generic wrapper; response parsed best-effort)
@@ -732,7 +1146,7 @@ def make_vapi_call(phone, lead):
     }
 
     headers = {"Authorization": f"Bearer {VAPI_API_KEY}", "Content-Type": "application/json"}
-    resp = requests.post(url, json=payload, headers=headers)
+    resp = outbound_http.post(url, json=payload, headers=headers)
 
     who = (lead.get("first_name") or lead.get("name") or "Lead")
     print(f"[VAPI] POST {url} -> {resp.status_code} for {phone} ({who})")
@@ -769,14 +1183,14 @@ def call_lead_if_possible(lead):
         log_call_to_supabase(lead_id, "skipped", "Calls disabled by campaign rules")
         return
 
-    phone = get_valid_phone(lead)
+    phone, tz = lead_phone_and_tz(lead)
     if not phone:
         print(f"[CALL] No phone for lead_id={lead_id}")
         log_call_to_supabase(lead_id, "no-phone", "No valid phone on lead")
         return
 
-    if not in_call_window_now(phone, rules["call_window_start"], rules["call_window_end"]):
-        nxt = next_window_start(phone, rules["call_window_start"], rules["call_window_end"])
+    if not in_call_window_now(phone, rules["call_window_start"], rules["call_window_end"], tz=tz):
+        nxt = next_window_start(phone, rules["call_window_start"], rules["call_window_end"], tz=tz)
         if nxt:
             schedule_next_call(lead_id, nxt)
             print(f"[CALL] Out of window; scheduled next={nxt.isoformat()} lead_id={lead_id}")
@@ -1073,6 +1487,7 @@ def log_email_to_supabase(
         }
         if idem_key:
             payload["idem_key"] = idem_key
+        note_write(lead_id)
         supabase.table("email_logs").insert(payload).execute()
     except Exception as e:
         print("Email log insert failed:", e)
@@ -1279,28 +1694,343 @@ def send_email_if_possible(
 # ===================================================
 # Background scheduler (calls)
 # ===================================================
-scheduler = BackgroundScheduler(timezone="UTC")
+# Each job family gets its own executor so a slow Gmail poll can't hold the threads
+# that place calls. "nice" is the per-thread OS priority (Linux; higher = yields more).
+SCHEDULER_QUEUES: Dict[str, Dict[str, int]] = {
+    "calls":     {"workers": int(os.getenv("QUEUE_CALLS_WORKERS", "4")),     "nice": 0},
+    "outbox":    {"workers": int(os.getenv("QUEUE_OUTBOX_WORKERS", "2")),    "nice": 2},
+    "accept":    {"workers": int(os.getenv("QUEUE_ACCEPT_WORKERS", "2")),    "nice": 5},
+    "followups": {"workers": int(os.getenv("QUEUE_FOLLOWUPS_WORKERS", "1")), "nice": 10},
+    "gmail":     {"workers": int(os.getenv("QUEUE_GMAIL_WORKERS", "2")),     "nice": 15},
+}
+# Web processes only run the scheduler when no dedicated worker (worker.py) is deployed
+WEB_RUNS_SCHEDULER = _env("WEB_RUNS_SCHEDULER", "true").lower() == "true"
+
+_queue_lock = threading.Lock()
+_queue_started_at = time.monotonic()
+_queue_stats: Dict[str, Dict[str, float]] = {
+    name: {"runs": 0, "failures": 0, "running": 0, "busy_seconds": 0.0, "max_seconds": 0.0,
+           "skipped_busy": 0, "skipped_not_owner": 0, "missed": 0}
+    for name in SCHEDULER_QUEUES
+}
+_job_queue: Dict[str, str] = {}
+_queue_thread_local = threading.local()
+
+def _apply_queue_priority(queue_name: str):
+    if getattr(_queue_thread_local, "queue", None) == queue_name:
+        return
+    _queue_thread_local.queue = queue_name
+    nice = SCHEDULER_QUEUES[queue_name]["nice"]
+    if nice and hasattr(os, "setpriority") and hasattr(threading, "get_native_id"):
+        try:
+            # On Linux PRIO_PROCESS with a thread id sets that thread's niceness only
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+        except Exception as e:
+            print(f"[Scheduler] could not set priority for queue {queue_name}:", e)
+
+def _queued(queue_name: str, fn):
+    """
+    Wrap a job so its run time is charged to its queue. A job returning False did no work
+    (e.g. another process holds its lease) and is counted as skipped_not_owner, not as a run.
+    """
+    def run():
+        _apply_queue_priority(queue_name)
+        with _queue_lock:
+            _queue_stats[queue_name]["running"] += 1
+        t0 = time.monotonic()
+        ok = True
+        worked = True
+        try:
+            worked = fn() is not False
+        except Exception:
+            ok = False
+            raise
+        finally:
+            dt = time.monotonic() - t0
+            with _queue_lock:
+                st = _queue_stats[queue_name]
+                st["running"] -= 1
+                if worked:
+                    st["runs"] += 1
+                    st["busy_seconds"] += dt
+                    st["max_seconds"] = max(st["max_seconds"], dt)
+                    if not ok:
+                        st["failures"] += 1
+                else:
+                    st["skipped_not_owner"] += 1
+    run.__name__ = getattr(fn, "__name__", queue_name)
+    return run
+
+def _on_scheduler_skip(event):
+    q = _job_queue.get(event.job_id)
+    if q:
+        with _queue_lock:
+            _queue_stats[q]["skipped_busy" if event.code == EVENT_JOB_MAX_INSTANCES else "missed"] += 1
+
+def scheduler_queue_metrics() -> dict:
+    """Per-queue utilization: busy thread-seconds / (workers * uptime), plus current load."""
+    elapsed = max(1e-6, time.monotonic() - _queue_started_at)
+    out = {}
+    with _queue_lock:
+        for name, cfg in SCHEDULER_QUEUES.items():
+            st = _queue_stats[name]
+            workers = max(1, cfg["workers"])
+            out[name] = {
+                "workers": workers,
+                "nice": cfg["nice"],
+                "jobs": sorted(j for j, q in _job_queue.items() if q == name),
+                "running": int(st["running"]),
+                "runs": int(st["runs"]),
+                "failures": int(st["failures"]),
+                "skipped_busy": int(st["skipped_busy"]),
+                "skipped_not_owner": int(st["skipped_not_owner"]),
+                "missed": int(st["missed"]),
+                "avg_seconds": round(st["busy_seconds"] / st["runs"], 2) if st["runs"] else None,
+                "max_seconds": round(st["max_seconds"], 2),
+                "utilization": round(st["busy_seconds"] / (workers * elapsed), 4),
+            }
+    return out
+
+scheduler = BackgroundScheduler(
+    timezone="UTC",
+    executors={
+        "default": SchedulerThreadPool(4),
+        **{name: SchedulerThreadPool(max(1, cfg["workers"])) for name, cfg in SCHEDULER_QUEUES.items()},
+    },
+)
+scheduler.add_listener(_on_scheduler_skip, EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
+
+def claim_due_lead(lead: dict) -> bool:
+    """
+    Clear next_call_at only if it still holds the value the poller read. Two pollers can see
+    the same lead while shards rebalance; only the one whose claim lands dials it.
+    """
+    lead_id, seen = lead.get("id"), lead.get("next_call_at")
+    if not lead_id or not seen:
+        return False
+    note_write(lead_id)
+    try:
+        if _pg:
+            try:
+                return _pg.claim_due_lead(lead_id, seen)
+            except Exception as e:
+                print("[PG] lead claim failed; retrying via PostgREST:", e)
+        res = (supabase.table("leads")
+               .update({"next_call_at": None, "updated_at": datetime.utcnow().isoformat()})
+               .eq("id", lead_id)
+               .eq("next_call_at", seen)
+               .execute())
+        return bool(getattr(res, "data", None))
+    except Exception as e:
+        print(f"[Scheduler] claim failed for lead {lead_id}:", e)
+        return False
+    finally:
+        read_cache_invalidate("lead", lead_id)
 
-def poll_due_calls():
+def poll_due_calls(shard: Optional[Tuple[int, int]] = None):
     try:
         now_iso = datetime.utcnow().isoformat()
-        resp = (supabase.table("leads").select("*")
-                .or_("status.eq.accepted,status.eq.sent_for_contact")
-                .lte("next_call_at", now_iso).execute())
-        leads = resp.data or []
+        shard = _partial_shard(shard)
+        leads = None
+        if _pg:
+            try:
+                # utcnow() is naive; mark it UTC for the timestamptz comparison
+                leads = _pg.due_leads(now_iso + "+00:00", limit=5000, shard=shard)
+            except Exception as e:
+                print("[PG] due leads query failed; using PostgREST:", e)
+        if leads is None:
+            q = (supabase.table("leads").select("*")
+                 .in_("status", ["accepted", "sent_for_contact"])
+                 .lte("next_call_at", now_iso))
+            resp = _shard_filter(q, shard).execute()
+            leads = resp.data or []
         if not leads:
             return
-        print(f"[Scheduler] Due leads: {len(leads)}")
+        print(f"[Scheduler] Due leads: {len(leads)}" + (f" (shard {shard[0]}-{shard[1]})" if shard else ""))
         for lead in leads:
-            update_lead(lead.get("id"), {"next_call_at": None})
+            if not claim_due_lead(lead):
+                continue
             call_lead_if_possible(lead)
     except Exception as e:
         print("[Scheduler] Error:", e)
 
+# ===================================================
+# Next-due call dispatcher (min-heap of next_call_at)
+# ===================================================
+# Instead of polling every minute, keep the upcoming next_call_at instants in a heap and
+# sleep until the earliest one. Local writes (update_lead) push straight into the heap;
+# writes made by other processes, and anything missed, are picked up by the slow
+# reconciliation scan (the "calls-poller" job).
+CALL_DISPATCHER_ENABLED = _env("CALL_DISPATCHER_ENABLED", "true").lower() == "true"
+CALL_RECONCILE_SECONDS = int(os.getenv("CALL_RECONCILE_SECONDS", "120"))
+CALL_HEAP_LOAD_LIMIT = int(os.getenv("CALL_HEAP_LOAD_LIMIT", "5000"))
+CALL_DISPATCH_BATCH = int(os.getenv("CALL_DISPATCH_BATCH", "100"))
+# Fetching, claiming and dialing run here, not on the dispatcher thread, so one slow
+# Vapi/PostgREST call never holds up the next due call
+CALL_DIAL_WORKERS = int(os.getenv("CALL_DIAL_WORKERS", str(SCHEDULER_QUEUES["calls"]["workers"])))
+_call_dial_pool = ThreadPoolExecutor(max_workers=max(1, CALL_DIAL_WORKERS), thread_name_prefix="call-dial")
+
+_call_heap: List[Tuple[float, str]] = []   # (due epoch, lead_id); stale entries skipped lazily
+_call_due: Dict[str, float] = {}           # lead_id -> current due epoch
+_call_cv = threading.Condition()
+_call_heap_active = False
+_call_dispatcher_thread: Optional[threading.Thread] = None
+_call_heap_stats = {"wakeups": 0, "dispatched": 0, "claimed": 0, "dropped": 0,
+                    "reconciles": 0, "last_late_ms": 0, "max_late_ms": 0}
+
+def _call_epoch(when) -> Optional[float]:
+    if not when:
+        return None
+    if isinstance(when, str):
+        try:
+            when = datetime.fromisoformat(when.replace("Z", "+00:00"))
+        except Exception:
+            return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.timestamp()
+
+def note_next_call(lead_id, when):
+    """Record a lead's new next_call_at locally (None clears it)."""
+    if not lead_id or not CALL_DISPATCHER_ENABLED:
+        return
+    ts = _call_epoch(when)
+    with _call_cv:
+        if not _call_heap_active:
+            return
+        if ts is None:
+            _call_due.pop(str(lead_id), None)
+            return
+        _call_due[str(lead_id)] = ts
+        heapq.heappush(_call_heap, (ts, str(lead_id)))
+        if _call_heap[0][0] == ts:
+            _call_cv.notify()
+
+def _dispatch_due_calls(lead_ids: List[str]):
+    """Re-read the popped leads, claim the ones still due and dial them."""
+    now_iso = datetime.utcnow().isoformat()
+    try:
+        rows = (supabase.table("leads").select("*")
+                .in_("id", lead_ids)
+                .or_("status.eq.accepted,status.eq.sent_for_contact")
+                .lte("next_call_at", now_iso)
+                .execute()).data or []
+    except Exception as e:
+        print("[CallHeap] due lead fetch failed; reconcile will retry:", e)
+        return
+    with _call_cv:
+        _call_heap_stats["dropped"] += len(lead_ids) - len(rows)
+    for lead in rows:
+        if not claim_due_lead(lead):
+            continue
+        with _call_cv:
+            _call_heap_stats["claimed"] += 1
+        _submit_call_work(call_lead_if_possible, lead)
+
+def _log_call_work_error(fut):
+    e = fut.exception()
+    if e is not None:
+        print("[CallHeap] dispatch failed:", e)
+
+def _submit_call_work(fn, *args):
+    """Run fn on the dial pool, charged to the "calls" queue (stats and thread priority)."""
+    _call_dial_pool.submit(_queued("calls", partial(fn, *args))).add_done_callback(_log_call_work_error)
+
+def _call_dispatcher_loop():
+    while True:
+        with _call_cv:
+            while True:
+                while _call_heap and _call_due.get(_call_heap[0][1]) != _call_heap[0][0]:
+                    heapq.heappop(_call_heap)
+                if not _call_heap:
+                    _call_cv.wait(CALL_RECONCILE_SECONDS)
+                    continue
+                delay = _call_heap[0][0] - time.time()
+                if delay <= 0:
+                    break
+                # capped so wall-clock jumps can't oversleep a due call
+                _call_cv.wait(min(delay, 60))
+            now = time.time()
+            due: List[str] = []
+            while _call_heap and _call_heap[0][0] <= now and len(due) < CALL_DISPATCH_BATCH:
+                ts, lid = heapq.heappop(_call_heap)
+                if _call_due.get(lid) != ts:
+                    continue
+                del _call_due[lid]
+                due.append(lid)
+                late_ms = int((now - ts) * 1000)
+                _call_heap_stats["last_late_ms"] = late_ms
+                _call_heap_stats["max_late_ms"] = max(_call_heap_stats["max_late_ms"], late_ms)
+            _call_heap_stats["wakeups"] += 1
+            _call_heap_stats["dispatched"] += len(due)
+        if due:
+            _submit_call_work(_dispatch_due_calls, due)
+
+def reconcile_call_heap(shard: Optional[Tuple[int, int]] = None):
+    """Slow scan: load leads due within the next two reconcile periods into the heap."""
+    global _call_heap_active, _call_dispatcher_thread
+    horizon = datetime.utcnow() + timedelta(seconds=2 * CALL_RECONCILE_SECONDS)
+    shard = _partial_shard(shard)
+    rows = None
+    if _pg:
+        try:
+            rows = _pg.due_leads(horizon.isoformat() + "+00:00", limit=CALL_HEAP_LOAD_LIMIT, shard=shard)
+        except Exception as e:
+            print("[PG] call heap load failed; using PostgREST:", e)
+    if rows is None:
+        try:
+            q = (supabase.table("leads").select("id,next_call_at")
+                 .in_("status", ["accepted", "sent_for_contact"])
+                 .lte("next_call_at", horizon.isoformat()))
+            rows = (_shard_filter(q, shard)
+                    .order("next_call_at", desc=False)
+                    .limit(CALL_HEAP_LOAD_LIMIT)
+                    .execute()).data or []
+        except Exception as e:
+            print("[CallHeap] reconcile scan failed:", e)
+            return
+    with _call_cv:
+        _call_heap_active = True
+        for r in rows:
+            ts = _call_epoch(r.get("next_call_at"))
+            lid = str(r.get("id") or "")
+            if ts is None or not lid or _call_due.get(lid) == ts:
+                continue
+            _call_due[lid] = ts
+            heapq.heappush(_call_heap, (ts, lid))
+        _call_heap_stats["reconciles"] += 1
+        _call_cv.notify()
+        if _call_dispatcher_thread is None:
+            _call_dispatcher_thread = threading.Thread(target=_call_dispatcher_loop, name="call-dispatcher", daemon=True)
+            _call_dispatcher_thread.start()
+            print(f"[CallHeap] dispatcher started with {len(_call_due)} upcoming call(s)")
+
+def deactivate_call_heap():
+    """Not our calls any more (lease lost / no shard): stop dispatching from this process."""
+    global _call_heap_active
+    with _call_cv:
+        if _call_heap_active:
+            print("[CallHeap] deactivated; another instance dispatches calls")
+        _call_heap_active = False
+        _call_heap.clear()
+        _call_due.clear()
+
+def call_heap_metrics() -> dict:
+    with _call_cv:
+        nxt = min((ts for ts in _call_due.values()), default=None)
+        return {
+            "enabled": CALL_DISPATCHER_ENABLED,
+            "active": _call_heap_active,
+            "upcoming": len(_call_due),
+            "heap_entries": len(_call_heap),
+            "next_due_in_seconds": round(nxt - time.time(), 1) if nxt is not None else None,
+            **_call_heap_stats,
+        }
+
 # ===================================================
 # Email Sequence Scheduler (follow-up steps)
 # ===================================================
-def _due_email_steps(now_utc_iso: str, limit: int = 100):
+def _due_email_steps(now_utc_iso: str, limit: int = 100, shard: Optional[Tuple[int, int]] = None):
     """
     Returns a list of (lead, step) that are due to send now.
     IMPORTANT: The scheduler ONLY handles FOLLOW-UPS (step >= 2).
@@ -1340,7 +2070,7 @@ def _due_email_steps(now_utc_iso: str, limit: int = 100):
             .neq("email_sequence_stopped", True)     # skip sequences we stopped
             .limit(200)
         )
-        leads = leads_q.execute().data or []
+        leads = _shard_filter(leads_q, shard).execute().data or []
 
         for ld in leads:
             # Case A: absolute time
@@ -1363,7 +2093,7 @@ def _due_email_steps(now_utc_iso: str, limit: int = 100):
 
     return due
 
-def poll_due_email_steps():
+def poll_due_email_steps(shard: Optional[Tuple[int, int]] = None):
     """Check for scheduled email follow-ups that are now due."""
     # Hard stop: if email sending is off, don't even scan/query or print noise
     if not EMAIL_SENDING_ENABLED:
@@ -1371,7 +2101,7 @@ def poll_due_email_steps():
 
     try:
         now_iso = datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
-        items = _due_email_steps(now_iso, limit=200)
+        items = _due_email_steps(now_iso, limit=200, shard=shard)
         if not items:
             return
         print(f"[EmailSeq] Due items: {len(items)}")
@@ -1409,6 +2139,158 @@ def poll_due_email_steps():
     except Exception as e:
         print("[EmailSeq] Error:", e)
 
+# ===================================================
+# NL → Apify actor translator
+# ===================================================
+TITLES = [
+    "Chief Executive Officer", "Chief Financial Officer", "Chief Operating Officer",
+    "Chief Technology Officer", "Chief Marketing Officer", "Chief Revenue Officer",
+    "Chief Investment Officer", "Managing Director", "Managing Partner", "General Manager",
+    "Vice President", "Head of Sales", "Head of Marketing", "Head of Partnerships",
+    "Sales Director", "Marketing Director", "Finance Director", "Commercial Director",
+    "Business Development Manager", "Account Executive", "Portfolio Manager",
+    "Wealth Manager", "Financial Advisor", "Investment Manager", "Fund Manager",
+    "Sponsorship Manager", "Athletic Director",
+]
+
+# Bare role words (word-bounded) that also count as titles
+ROLE_WORD_TITLES = {
+    "ceo": "CEO",
+    "president": "President",
+    "partner": "Partner",
+    "founder": "Founder",
+    "owner": "Owner",
+}
+
+# phrase (word-bounded) -> actor seniority value
+SENIORITY_MAP = {
+    "ceo": "C-Suite", "cto": "C-Suite", "cfo": "C-Suite", "coo": "C-Suite", "cmo": "C-Suite",
+    "chief": "C-Suite", "c-suite": "C-Suite", "c-level": "C-Suite", "executive": "C-Suite",
+    "founder": "Founder", "co-founder": "Founder", "cofounder": "Founder",
+    "owner": "Owner",
+    "partner": "Partner",
+    "vp": "VP", "vice president": "VP", "svp": "VP", "evp": "VP",
+    "head": "Head", "head of": "Head",
+    "director": "Director",
+    "manager": "Manager",
+    "senior": "Senior",
+    "entry level": "Entry", "junior": "Entry",
+}
+SENIORITY_PRIORITY = ["C-Suite", "Founder", "Owner", "Partner", "VP", "Head", "Director", "Manager", "Senior", "Entry"]
+
+# single token -> actor functional area
+FUNCTIONAL_BY_KEYWORD = {
+    "finance": "Finance", "financial": "Finance", "accounting": "Finance",
+    "sales": "Sales", "marketing": "Marketing", "engineering": "Engineering",
+    "operations": "Operations", "hr": "Human Resources", "people": "Human Resources",
+    "legal": "Legal", "it": "Information Technology", "product": "Product Management",
+    "partnerships": "Business Development", "sponsorship": "Business Development",
+}
+
+# phrase -> actor industry; multiword phrases match as substrings, single tokens as whole words
+INDUSTRY_BY_KEYWORD = {
+    "finance": "Financial Services", "fintech": "Financial Services",
+    "financial services": "Financial Services", "banking": "Banking", "bank": "Banking",
+    "wealth management": "Investment Management", "asset management": "Investment Management",
+    "private equity": "Venture Capital & Private Equity", "venture capital": "Venture Capital & Private Equity",
+    "hedge fund": "Investment Management", "insurance": "Insurance",
+    "real estate": "Real Estate", "property": "Real Estate",
+    "software": "Computer Software", "saas": "Computer Software", "ai": "Computer Software",
+    "healthcare": "Hospital & Health Care", "pharma": "Pharmaceuticals",
+    "sports": "Sports", "sport": "Sports", "football": "Sports", "esports": "Sports",
+    "marketing agency": "Marketing & Advertising", "advertising": "Marketing & Advertising",
+    "legal services": "Law Practice", "law firm": "Law Practice",
+    "hospitality": "Hospitality", "construction": "Construction",
+}
+
+# alias (word-bounded) -> actor country
+COUNTRY_ALIASES = {
+    "usa": "United States", "us": "United States", "u.s.": "United States",
+    "united states": "United States", "america": "United States",
+    "uk": "United Kingdom", "u.k.": "United Kingdom", "united kingdom": "United Kingdom",
+    "england": "United Kingdom", "britain": "United Kingdom", "great britain": "United Kingdom",
+    "canada": "Canada", "australia": "Australia", "ireland": "Ireland",
+    "germany": "Germany", "france": "France", "spain": "Spain", "netherlands": "Netherlands",
+    "uae": "United Arab Emirates", "united arab emirates": "United Arab Emirates",
+}
+
+US_STATES = ["california", "texas", "new york", "florida", "illinois", "washington",
+             "massachusetts", "georgia", "ohio", "pennsylvania", "arizona", "colorado"]
+
+EMAIL_FLAG_PHRASES = ["with email", "with emails", "has email", "emails"]
+PHONE_FLAG_PHRASES = ["with phone", "with phones", "has phone", "phones"]
+VERIFIED_FLAG_PHRASES = ["verified email", "verified emails", "only verified"]
+
+SIZE_PAT = re.compile(r"(\d{1,6})\s*(?:-|–|to)\s*(\d{1,6})\s*(?:employees|employee|staff|people)", re.I)
+_CITY_PAT = re.compile(r"(?:\bin\b|\bat\b|\bbased in\b)\s+([a-zA-Z][a-zA-Z\s\-]{1,40})")
+_CITY_STOP_PAT = re.compile(r"[,.]|(?=\s+(with|and|or|for|of|that|who|which|emails?|phones?)\b)")
+_QUOTED_PAT = re.compile(r'"([^"]+)"')
+_DOMAIN_PAT = re.compile(r"\b([a-z0-9][a-z0-9\-]+\.[a-z]{2,})\b")
+
+NL_TRANSLATION_CACHE_SIZE = int(os.getenv("NL_TRANSLATION_CACHE_SIZE", "512"))
+
+def _compile_nl_matcher():
+    """
+    Compile every keyword table into one alternation, longest term first, wrapped in a
+    lookahead so finditer reports a (possibly overlapping) match at each start position.
+    Terms that are prefixes of the longest match at a position are resolved from a
+    precomputed table, so one scan finds every hit.
+    Returns (pattern, term -> [(kind, value, word_bounded)], term -> [shorter prefix terms]).
+    """
+    index: Dict[str, List[Tuple[str, Any, bool]]] = {}
+
+    def add(term: str, kind: str, value, word_bounded: bool):
+        index.setdefault(term.lower(), []).append((kind, value, word_bounded))
+
+    for t in TITLES:
+        add(t, "title", t, False)
+    for kw, title in ROLE_WORD_TITLES.items():
+        add(kw, "title", title, True)
+    for phrase, value in SENIORITY_MAP.items():
+        add(phrase, "seniority", value, True)
+    for kw, fn in FUNCTIONAL_BY_KEYWORD.items():
+        add(kw, "function", fn, True)
+    for phrase, ind in INDUSTRY_BY_KEYWORD.items():
+        add(phrase, "industry", ind, " " not in phrase)
+    for alias, proper in COUNTRY_ALIASES.items():
+        add(alias, "country", proper, True)
+    for st in US_STATES:
+        add(st, "state", st.title(), True)
+    for phrase in EMAIL_FLAG_PHRASES:
+        add(phrase, "flag", "has_email", False)
+    for phrase in PHONE_FLAG_PHRASES:
+        add(phrase, "flag", "has_phone", False)
+    for phrase in VERIFIED_FLAG_PHRASES:
+        add(phrase, "flag", "verified", False)
+
+    terms = sorted(index, key=len, reverse=True)
+    pattern = re.compile("(?=(" + "|".join(re.escape(t) for t in terms) + "))")
+    prefixes = {t: [p for p in terms if len(p) < len(t) and t.startswith(p)] for t in terms}
+    return pattern, index, prefixes
+
+_NL_PATTERN, _NL_TERMS, _NL_PREFIXES = _compile_nl_matcher()
+
+def _is_word_char(c: str) -> bool:
+    return c.isalnum() or c == "_"
+
+def scan_prompt(low: str) -> Dict[str, set]:
+    """Single pass over a lowercased prompt; returns kind -> set of matched values."""
+    hits: Dict[str, set] = {}
+    n = len(low)
+    for m in _NL_PATTERN.finditer(low):
+        i = m.start()
+        longest = m.group(1)
+        for term in (longest, *_NL_PREFIXES[longest]):
+            j = i + len(term)
+            bounded = (i == 0 or not _is_word_char(low[i - 1])) and (j >= n or not _is_word_char(low[j]))
+            for kind, value, word_bounded in _NL_TERMS[term]:
+                if word_bounded and not bounded:
+                    continue
+                hits.setdefault(kind, set()).add(value)
+                if kind == "industry":
+                    hits.setdefault("company_keyword", set()).add(term)
+    return hits
+
 def norm_ws(s): 
     return re.sub(r"\s+", " ", s.strip())
 
@@ -1420,99 +2302,16 @@ def pick_one_with_priority(candidates, priority_order):
             return p
     return candidates[0]
 
-def tokenize_words(s):
-    # Lowercase tokens with word boundaries; keeps only alphabetic words of length >= 2
-    return re.findall(r"\b[a-z][a-z]+\b", s.lower())
-
-def find_titles(s):
-    low = s.lower()
-    hits = []
-    for t in TITLES:
-        if t.lower() in low:
-            hits.append(t)
-    # brute force role words as titles
-    for kw in ["ceo","president","partner","founder","owner"]:
-        if re.search(rf"\b{kw}\b", low):
-            if kw == "partner":
-                hits.append("Partner")
-            elif kw != "ceo":
-                hits.append(kw.title())
-            else:
-                hits.append("CEO")
-    return sorted(set(hits))
-
-def find_seniority(s):
-    low = s.lower()
-    hits = set()
-    for pat, value in SENIORITY_MAP.items():
-        if re.search(pat, low):
-            hits.add(value)
-    # title-derived hints
-    if re.search(r"\bceo|cto|cfo|coo\b", low): hits.add("C-Suite")
-    if re.search(r"\bvp\b|\bvice president\b", low): hits.add("VP")
-    if re.search(r"\bhead\b", low): hits.add("Head")
-    if re.search(r"\bdirector\b", low): hits.add("Director")
-    if re.search(r"\bmanager\b", low): hits.add("Manager")
-    if re.search(r"\bpartner\b", low): hits.add("Partner")
-    if re.search(r"\bfounder\b", low): hits.add("Founder")
-    return sorted(hits)
-
-def find_functions(s):
-    toks = set(tokenize_words(s))
-    hits = set()
-    for kw, fn in FUNCTIONAL_BY_KEYWORD.items():
-        if kw in toks:
-            hits.add(fn)
-    return sorted(hits)
-
-def find_industries_and_keywords(s):
-    low = s.lower()
-    toks = set(tokenize_words(s))  # avoids matching 'ai' from 'emails'
-    inds, company_keywords = set(), set()
-    # phrase-first matches (multiword)
-    for phrase, mapped in INDUSTRY_BY_KEYWORD.items():
-        if " " in phrase:
-            if phrase in low:
-                inds.add(mapped)
-                company_keywords.add(phrase)
-    # single-token matches
-    for phrase, mapped in INDUSTRY_BY_KEYWORD.items():
-        if " " not in phrase and phrase in toks:
-            inds.add(mapped)
-            company_keywords.add(phrase)
-    # quoted phrases as keywords
-    for q in re.findall(r'"([^"]+)"', s):
-        if 1 <= len(q.split()) <= 5:
-            company_keywords.add(q.lower())
-    # explicit phrase support
-    if "wealth management" in low:
-        company_keywords.add("wealth management")
-    return sorted(inds), sorted(company_keywords)
-
-def find_geo(s):
-    low = s.lower()
-    countries, states, cities = [], [], []
-
-    # Countries (aliases)
-    for alias, proper in COUNTRY_ALIASES.items():
-        if re.search(rf"\b{re.escape(alias)}\b", low):
-            countries.append(proper)
-
+def find_cities(low):
     # Cities (stop before conjunctions or punctuation)
-    STOP = r"[,.]|(?=\s+(with|and|or|for|of|that|who|which|emails?|phones?)\b)"
-    for m in re.finditer(r"(?:\bin\b|\bat\b|\bbased in\b)\s+([a-zA-Z][a-zA-Z\s\-]{1,40})", low):
+    cities = []
+    for m in _CITY_PAT.finditer(low):
         chunk = norm_ws(m.group(1))
-        cut = re.split(STOP, chunk)[0].strip()
+        cut = _CITY_STOP_PAT.split(chunk)[0].strip()
         token = norm_ws(cut).title()
         if token and token.lower() not in COUNTRY_ALIASES and token.lower() not in ("usa","united states"):
             cities.append(token)
-
-    # State extraction (extend as needed)
-    for st in ["california","texas","new york","florida","illinois","washington","massachusetts","georgia","ohio","pennsylvania","arizona","colorado"]:
-        if re.search(rf"\b{st}\b", low):
-            states.append(st.title())
-
-    return sorted(set(countries)), sorted(set(states)), sorted(set(cities))
+    return sorted(set(cities))
 
 def find_size(s):
     m = SIZE_PAT.search(s)
@@ -1524,30 +2323,33 @@ def find_size(s):
         return ["1 - 200"]
     return []
 
-def detect_flags(s):
-    low = s.lower()
-    has_email = any(w in low for w in ["with email","with emails","has email","emails"])
-    has_phone = any(w in low for w in ["with phone","with phones","has phone","phones"])
-    verified = "verified email" in low or "verified emails" in low or "only verified" in low
-    return bool(has_email), bool(has_phone), bool(verified)
-
 def find_company_domains(s):
     # capture simple domain tokens like example.com
-    domains = re.findall(r"\b([a-z0-9][a-z0-9\-]+\.[a-z]{2,})\b", s.lower())
+    domains = _DOMAIN_PAT.findall(s.lower())
     bad = {"usa.com","email.com","gmail.com","yahoo.com"}
     return sorted({d for d in domains if d not in bad})
 
-def nl_to_actor_input(prompt: str, total_results: int):
-    s = prompt.strip()
+@lru_cache(maxsize=NL_TRANSLATION_CACHE_SIZE)
+def _translate_prompt(normalized: str) -> Tuple[Tuple[str, Any], ...]:
+    """Memoized translation of a normalized prompt (everything except totalResults)."""
+    hits = scan_prompt(normalized)
 
-    titles        = find_titles(s)
-    seniority_l   = find_seniority(s)
-    functional_l  = find_functions(s)
-    industries_l, company_keywords = find_industries_and_keywords(s)
-    countries, states, cities = find_geo(s)
-    sizes        = find_size(s)
-    has_email, has_phone, verified_only = detect_flags(s)
-    company_domains = find_company_domains(s)
+    titles = sorted(hits.get("title", ()))
+    seniority_l = sorted(hits.get("seniority", ()))
+    functional_l = sorted(hits.get("function", ()))
+    industries_l = sorted(hits.get("industry", ()))
+    company_keywords = set(hits.get("company_keyword", ()))
+    # quoted phrases as keywords
+    for q in _QUOTED_PAT.findall(normalized):
+        if 1 <= len(q.split()) <= 5:
+            company_keywords.add(q.lower())
+    company_keywords = sorted(company_keywords)
+    countries = sorted(hits.get("country", ()))
+    states = sorted(hits.get("state", ()))
+    cities = find_cities(normalized)
+    sizes = find_size(normalized)
+    flags = hits.get("flag", set())
+    company_domains = find_company_domains(normalized)
 
     def cap1(arr):
         if not arr: return arr
@@ -1556,15 +2358,11 @@ def nl_to_actor_input(prompt: str, total_results: int):
     seniority_one = pick_one_with_priority(seniority_l, SENIORITY_PRIORITY)
     seniority_arr = [seniority_one] if seniority_one else []
 
-    functional_arr = cap1(functional_l)
-    industry_arr   = cap1(industries_l)
-
     payload = {
-        "totalResults": total_results,
         "personTitle": titles or None,
         "seniority": (seniority_arr or None),
-        "functional": (functional_arr or None),
-        "companyIndustry": (industry_arr or None),
+        "functional": (cap1(functional_l) or None),
+        "companyIndustry": (cap1(industries_l) or None),
         "companyKeyword": (company_keywords or None),
         "companyEmployeeSize": (sizes or None),
         "personCountry": (countries or None),
@@ -1574,85 +2372,831 @@ def nl_to_actor_input(prompt: str, total_results: int):
         "companyState": (states or None),
         "companyCity": (cities or None),
         "companyDomain": (company_domains or None),
-        "hasEmail": has_email,
-        "hasPhone": has_phone,
-        "contactEmailStatus": (["Verified"] if verified_only else None),
+        "hasEmail": "has_email" in flags,
+        "hasPhone": "has_phone" in flags,
+        "contactEmailStatus": (["Verified"] if "verified" in flags else None),
     }
-    # remove empties
-    return {k: v for k, v in payload.items() if v not in (None, [], "")}
+    # remove empties; tuples keep the cached value immutable
+    return tuple((k, tuple(v) if isinstance(v, list) else v)
+                 for k, v in payload.items() if v not in (None, [], ""))
+
+def nl_to_actor_input(prompt: str, total_results: int):
+    out = {"totalResults": total_results}
+    for k, v in _translate_prompt(norm_ws((prompt or "").lower())):
+        out[k] = list(v) if isinstance(v, tuple) else v
+    return out
 
 # REST: scrape (NL → Apify actor via working translator)
 # ===================================================
+# At most APIFY_MAX_CONCURRENT_RUNS actor runs at once (jobs and the legacy sync path share it)
+_apify_run_slots = threading.BoundedSemaphore(max(1, APIFY_MAX_CONCURRENT_RUNS))
+_scrape_job_pool = ThreadPoolExecutor(max_workers=max(1, APIFY_MAX_CONCURRENT_RUNS), thread_name_prefix="scrape-job")
+# Jobs live in SCRAPE_JOBS_TABLE so every web worker can serve them; the dict is the running
+# process's write-through copy (fresher while it runs the job, and enough if the table is missing).
+SCRAPE_JOBS_TABLE = os.getenv("SCRAPE_JOBS_TABLE", "scrape_jobs")
+_scrape_jobs: Dict[str, dict] = {}
+_scrape_jobs_lock = threading.Lock()
+SCRAPE_TERMINAL_STATUSES = {"SUCCEEDED", "FAILED", "ABORTED", "TIMED-OUT"}
+
+_scrape_cache: "OrderedDict[str, dict]" = OrderedDict()
+_scrape_cache_lock = threading.Lock()
+_scrape_cache_counts = {"hit": 0, "miss": 0, "store": 0, "evict": 0}
+
+def _round_scrape_count(count: int) -> int:
+    count = max(1, int(count))
+    if SCRAPE_CACHE_TTL_SECONDS <= 0 or not SCRAPE_CACHE_COUNT_BUCKETS:
+        return count
+    for b in SCRAPE_CACHE_COUNT_BUCKETS:
+        if count <= b:
+            return b
+    step = SCRAPE_CACHE_COUNT_BUCKETS[-1]
+    return -(-count // step) * step
+
+def scrape_cache_key(actor_input: dict) -> str:
+    """Canonical actor input (list order and totalResults ignored) -> cache key."""
+    canon = {k: (sorted(v, key=str) if isinstance(v, list) else v)
+             for k, v in actor_input.items() if k != "totalResults"}
+    return hashlib.sha1(json.dumps(canon, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def scrape_cache_get(key: str, count: int) -> Optional[dict]:
+    """
+    A cached run that can answer `count` items: either it asked for at least that many,
+    or the actor ran dry below what it asked for (so a bigger run would not find more).
+    """
+    if SCRAPE_CACHE_TTL_SECONDS <= 0:
+        return None
+    now = time.monotonic()
+    with _scrape_cache_lock:
+        entry = _scrape_cache.get(key)
+        if entry and now - entry["stored"] > SCRAPE_CACHE_TTL_SECONDS:
+            _scrape_cache.pop(key, None)
+            entry = None
+        if entry and (entry["count"] >= count or entry["items"] < entry["count"]):
+            _scrape_cache.move_to_end(key)
+            _scrape_cache_counts["hit"] += 1
+            return dict(entry)
+        _scrape_cache_counts["miss"] += 1
+    return None
+
+def scrape_cache_put(key: str, dataset_id: str, run_id: Optional[str], count: int, items: int):
+    if SCRAPE_CACHE_TTL_SECONDS <= 0 or not dataset_id:
+        return
+    with _scrape_cache_lock:
+        prev = _scrape_cache.get(key)
+        if prev and prev["count"] > count and time.monotonic() - prev["stored"] <= SCRAPE_CACHE_TTL_SECONDS:
+            return  # keep the bigger run
+        _scrape_cache[key] = {"dataset_id": dataset_id, "run_id": run_id, "count": int(count),
+                              "items": int(items), "stored": time.monotonic()}
+        _scrape_cache.move_to_end(key)
+        _scrape_cache_counts["store"] += 1
+        while len(_scrape_cache) > SCRAPE_CACHE_MAX_ENTRIES:
+            _scrape_cache.popitem(last=False)
+            _scrape_cache_counts["evict"] += 1
+
+def scrape_cache_metrics() -> dict:
+    with _scrape_cache_lock:
+        return {"entries": len(_scrape_cache), "max_entries": SCRAPE_CACHE_MAX_ENTRIES,
+                "ttl_seconds": SCRAPE_CACHE_TTL_SECONDS, **_scrape_cache_counts}
+
+def _cache_finished_run(key: str, run: dict, count: int):
+    dataset_id = run.get("defaultDatasetId")
+    try:
+        _, total = fetch_apify_items(dataset_id, 0, 1)
+        scrape_cache_put(key, dataset_id, run.get("id"), count, int(total or 0))
+    except Exception as e:
+        print("[SCRAPE][CACHE] store failed:", e)
+
+def _apify_client():
+    if not _APIFY_CLIENT_AVAILABLE:
+        raise RuntimeError("apify-client is not installed")
+    if not APIFY_TOKEN:
+        raise RuntimeError("APIFY_TOKEN not set")
+    return ApifyClient(APIFY_TOKEN)
+
+def _wait_for_apify_run(client, run_id: str, on_poll=None) -> dict:
+    """Poll the run until it reaches a terminal status (or APIFY_RUN_TIMEOUT_SECONDS passes)."""
+    deadline = time.monotonic() + APIFY_RUN_TIMEOUT_SECONDS
+    while True:
+        run = client.run(run_id).get() or {}
+        if on_poll:
+            on_poll(run)
+        if run.get("status") in SCRAPE_TERMINAL_STATUSES:
+            return run
+        if time.monotonic() > deadline:
+            print(f"[APIFY] run {run_id} still {run.get('status')} after {APIFY_RUN_TIMEOUT_SECONDS}s; aborting")
+            try:
+                client.run(run_id).abort()
+            except Exception as e:
+                print("[APIFY] abort failed:", e)
+            run["status"] = "TIMED-OUT"
+            return run
+        time.sleep(APIFY_POLL_SECONDS)
+
+def fetch_apify_items(dataset_id: str, offset: int = 0, limit: int = SCRAPE_PAGE_SIZE) -> Tuple[List[dict], Optional[int]]:
+    """One page of dataset items; returns (items, total_known_so_far)."""
+    page = _apify_client().dataset(dataset_id).list_items(offset=max(0, int(offset)), limit=max(1, int(limit)), clean=True)
+    return list(page.items or []), getattr(page, "total", None)
+
+def run_apify(prompt: str, count: int) -> List[dict]:
+    """Blocking: translate the prompt, run the actor to completion (or reuse a cached run) and return the items."""
+    run_count = _round_scrape_count(count)
+    run_input = nl_to_actor_input(prompt, run_count)
+    key = scrape_cache_key(run_input)
+    cached = scrape_cache_get(key, count)
+    if cached:
+        print(f"[SCRAPE][CACHE] hit key={key[:12]} dataset={cached['dataset_id']}")
+        dataset_id = cached["dataset_id"]
+    else:
+        client = _apify_client()
+        with _apify_run_slots:
+            run = client.actor(APIFY_ACTOR_ID).start(run_input=run_input)
+            run = _wait_for_apify_run(client, run["id"])
+        if run.get("status") != "SUCCEEDED":
+            raise RuntimeError(f"actor run {run.get('id')} ended with status {run.get('status')}")
+        _cache_finished_run(key, run, run_count)
+        dataset_id = run["defaultDatasetId"]
+    items: List[dict] = []
+    offset = 0
+    while len(items) < count:
+        page, _ = fetch_apify_items(dataset_id, offset, min(SCRAPE_PAGE_SIZE, count - len(items)))
+        if not page:
+            break
+        items.extend(page)
+        offset += len(page)
+    return items
+
+def _scrape_job_row(job: dict) -> dict:
+    return {"id" if k == "job_id" else k: v for k, v in job.items()}
+
+def _persist_scrape_job(job_id: str, patch: dict, insert: bool = False):
+    patch = {**patch, "updated_at": datetime.utcnow().isoformat()}
+    try:
+        if insert:
+            supabase.table(SCRAPE_JOBS_TABLE).insert(_scrape_job_row(patch)).execute()
+        else:
+            supabase.table(SCRAPE_JOBS_TABLE).update(patch).eq("id", job_id).execute()
+    except Exception as e:
+        print(f"[SCRAPE][JOB] persist failed job={job_id}:", e)
+
+def _update_scrape_job(job_id: str, **patch):
+    with _scrape_jobs_lock:
+        job = _scrape_jobs.get(job_id)
+        if job is not None:
+            if all(job.get(k) == v for k, v in patch.items()):
+                return
+            job.update(patch)
+    _persist_scrape_job(job_id, patch)
+
+def load_scrape_job(job_id: str) -> Optional[dict]:
+    """The local copy when this process runs the job, else the stored row."""
+    with _scrape_jobs_lock:
+        job = _scrape_jobs.get(job_id)
+        if job is not None:
+            return dict(job)
+    try:
+        res = supabase.table(SCRAPE_JOBS_TABLE).select("*").eq("id", job_id).limit(1).execute()
+        rows = getattr(res, "data", None) or []
+    except Exception as e:
+        print(f"[SCRAPE][JOB] load failed job={job_id}:", e)
+        return None
+    if not rows:
+        return None
+    row = dict(rows[0])
+    row["job_id"] = str(row.pop("id"))
+    if row.get("status") not in ("done", "error"):
+        stale_before = datetime.now(timezone.utc) - timedelta(seconds=SCRAPE_JOB_STALE_SECONDS)
+        if row.get("updated_at") and _timeline_ts(row["updated_at"]) < stale_before:
+            row.update(_expire_stale_scrape_jobs(job_id) or {})
+    return row
+
+def _expire_stale_scrape_jobs(job_id: Optional[str] = None) -> Optional[dict]:
+    """Mark unfinished jobs whose heartbeat stopped as error. Returns the patch when a row changed."""
+    now = datetime.utcnow()
+    patch = {"status": "error", "error": "scrape job lost (the process running it stopped)",
+             "finished_at": now.isoformat(), "updated_at": now.isoformat()}
+    q = (supabase.table(SCRAPE_JOBS_TABLE).update(patch)
+         .in_("status", ["queued", "running"])
+         .lt("updated_at", (now - timedelta(seconds=SCRAPE_JOB_STALE_SECONDS)).isoformat()))
+    if job_id:
+        q = q.eq("id", job_id)
+    try:
+        rows = getattr(q.execute(), "data", None) or []
+    except Exception as e:
+        print("[SCRAPE][JOB] stale sweep failed:", e)
+        return None
+    for r in rows:
+        print(f"[SCRAPE][JOB] {r.get('id')} marked error: no heartbeat for {SCRAPE_JOB_STALE_SECONDS}s")
+    return patch if rows else None
+
+_scrape_heartbeat_thread: Optional[threading.Thread] = None
+
+def _scrape_job_heartbeat_loop():
+    """Bump updated_at on every unfinished job this process owns (queued ones included)."""
+    global _scrape_heartbeat_thread
+    while True:
+        time.sleep(max(1, SCRAPE_JOB_HEARTBEAT_SECONDS))
+        with _scrape_jobs_lock:
+            ids = [k for k, j in _scrape_jobs.items() if j.get("status") not in ("done", "error")]
+            if not ids:
+                _scrape_heartbeat_thread = None
+                return
+        try:
+            (supabase.table(SCRAPE_JOBS_TABLE).update({"updated_at": datetime.utcnow().isoformat()})
+             .in_("id", ids).in_("status", ["queued", "running"]).execute())
+        except Exception as e:
+            print("[SCRAPE][JOB] heartbeat failed:", e)
+
+def _ensure_scrape_job_heartbeat():
+    global _scrape_heartbeat_thread
+    with _scrape_jobs_lock:
+        if _scrape_heartbeat_thread is None:
+            _scrape_heartbeat_thread = threading.Thread(target=_scrape_job_heartbeat_loop,
+                                                        name="scrape-job-heartbeat", daemon=True)
+            _scrape_heartbeat_thread.start()
+
+def _prune_scrape_jobs():
+    cutoff = datetime.utcnow() - timedelta(minutes=SCRAPE_JOB_RETENTION_MINUTES)
+    with _scrape_jobs_lock:
+        for job_id in [k for k, j in _scrape_jobs.items()
+                       if j.get("finished_at") and datetime.fromisoformat(j["finished_at"]) < cutoff]:
+            _scrape_jobs.pop(job_id, None)
+    # dead runners never set finished_at; expire them so the delete below reaches them too
+    _expire_stale_scrape_jobs()
+    try:
+        supabase.table(SCRAPE_JOBS_TABLE).delete().lt("finished_at", cutoff.isoformat()).execute()
+    except Exception as e:
+        print("[SCRAPE][JOB] prune failed:", e)
+
+def _run_scrape_job(job_id: str):
+    job = _scrape_jobs.get(job_id)
+    if not job:
+        return
+    try:
+        client = _apify_client()
+        with _apify_run_slots:
+            run = client.actor(APIFY_ACTOR_ID).start(run_input=job["actor_input"])
+            _update_scrape_job(job_id, status="running", run_id=run.get("id"),
+                               dataset_id=run.get("defaultDatasetId"),
+                               started_at=datetime.utcnow().isoformat())
+            print(f"[SCRAPE][JOB] {job_id} started run={run.get('id')}")
+
+            def _on_poll(r):
+                _update_scrape_job(job_id, apify_status=r.get("status"))
+
+            run = _wait_for_apify_run(client, run["id"], on_poll=_on_poll)
+        ok = run.get("status") == "SUCCEEDED"
+        if ok:
+            _cache_finished_run(job["cache_key"], run, job["actor_input"]["totalResults"])
+        _update_scrape_job(job_id, status="done" if ok else "error",
+                           apify_status=run.get("status"),
+                           error=None if ok else f"actor run ended with status {run.get('status')}",
+                           finished_at=datetime.utcnow().isoformat())
+        print(f"[SCRAPE][JOB] {job_id} finished status={run.get('status')}")
+    except Exception as e:
+        print(f"[SCRAPE][JOB] {job_id} failed:", e)
+        _update_scrape_job(job_id, status="error", error=str(e), finished_at=datetime.utcnow().isoformat())
+
+def create_scrape_job(prompt: str, count: int, user_id: Optional[str] = None) -> dict:
+    _prune_scrape_jobs()
+    job_id = str(uuid4())
+    actor_input = nl_to_actor_input(prompt, _round_scrape_count(count))
+    key = scrape_cache_key(actor_input)
+    now_iso = datetime.utcnow().isoformat()
+    job = {
+        "job_id": job_id,
+        "user_id": user_id,
+        "prompt": prompt,
+        "count": count,
+        "actor_input": actor_input,
+        "cache_key": key,
+        "cache_hit": False,
+        "status": "queued",
+        "apify_status": None,
+        "run_id": None,
+        "dataset_id": None,
+        "error": None,
+        "created_at": now_iso,
+        "started_at": None,
+        "finished_at": None,
+    }
+    cached = scrape_cache_get(key, count)
+    if cached:
+        # Served from an earlier run's dataset; item pages are sliced to `count`
+        job.update(status="done", apify_status="SUCCEEDED", cache_hit=True, run_id=cached.get("run_id"),
+                   dataset_id=cached["dataset_id"], started_at=now_iso, finished_at=now_iso)
+        print(f"[SCRAPE][CACHE] hit key={key[:12]} job={job_id}")
+    with _scrape_jobs_lock:
+        _scrape_jobs[job_id] = job
+    _persist_scrape_job(job_id, job, insert=True)
+    if not cached:
+        _ensure_scrape_job_heartbeat()
+        _scrape_job_pool.submit(_run_scrape_job, job_id)
+    return job
+
+def _public_scrape_job(job: dict) -> dict:
+    return {k: job.get(k) for k in ("job_id", "status", "apify_status", "count", "cache_hit", "run_id",
+                                    "dataset_id", "error", "created_at", "started_at", "finished_at")}
+
+async def _parse_scrape_body(request: Request) -> Tuple[Optional[dict], Optional[JSONResponse]]:
+    try:
+        body = await request.json()
+    except Exception:
+        return None, JSONResponse({"ok": False, "error": "JSON body required"}, status_code=400)
+    if not isinstance(body, dict):
+        return None, JSONResponse({"ok": False, "error": "JSON object body required"}, status_code=400)
+    prompt = (str(body.get("prompt") or body.get("q") or "")).strip()
+    try:
+        count = int(body.get("count") or 1000)
+    except (TypeError, ValueError):
+        return None, JSONResponse({"ok": False, "error": "'count' must be an integer"}, status_code=400)
+    if count < 1:
+        return None, JSONResponse({"ok": False, "error": "'count' must be positive"}, status_code=400)
+    if not prompt:
+        return None, JSONResponse({"ok": False, "error": "Missing 'prompt'"}, status_code=400)
+    return {"prompt": prompt, "count": count, "user_id": body.get("user_id") or body.get("userId")}, None
+
 @app.post("/api/scrape-leads")
 @app.post("/api/scrape-leads-nl")  # alias for backward compatibility
-async def scrape_leads_nl(request: Request):
+async def scrape_leads_nl(request: Request, mode: Optional[str] = Query(None)):
     """
     Natural-language scraping via Apify actor (VYRyEF4ygTTkaIghe).
     Body:
       { "prompt": "Finance CEO based in USA with emails", "count": 1000 }
     Returns:
       The actor dataset items (list).
+    With ?mode=job the run is started as a scrape job instead (see /api/scrape-jobs).
     """
-    try:
-        body = await request.json()
-    except Exception:
-        return JSONResponse({"ok": False, "error": "JSON body required"}, status_code=400)
-
-    prompt = (body.get("prompt") or body.get("q") or "").strip()
-    count  = int(body.get("count") or 1000)
-    if not prompt:
-        return JSONResponse({"ok": False, "error": "Missing 'prompt'"}, status_code=400)
+    parsed, err = await _parse_scrape_body(request)
+    if err:
+        return err
+    if (mode or "").lower() == "job":
+        return _create_scrape_job_response(parsed)
 
     try:
-        items = run_apify(prompt, count)  # uses the working translator in scrape_runner.py
-        return items
+        return await run_blocking(run_apify, parsed["prompt"], parsed["count"])
     except Exception as e:
         return JSONResponse({"ok": False, "error": f"Apify error: {e}"}, status_code=502)
 
-@app.post("/api/accepted-leads")
-async def accept_and_call_leads(request: Request, background_tasks: BackgroundTasks):
+def _create_scrape_job_response(parsed: dict) -> JSONResponse:
+    try:
+        job = create_scrape_job(parsed["prompt"], parsed["count"], parsed.get("user_id"))
+    except Exception as e:
+        print("[SCRAPE][JOB] create failed:", e)
+        return JSONResponse({"ok": False, "error": f"Could not start scrape job: {e}"}, status_code=500)
+    job_id = job["job_id"]
+    return JSONResponse({
+        "ok": True,
+        "job_id": job_id,
+        "status_url": f"/api/scrape-jobs/{job_id}",
+        "items_url": f"/api/scrape-jobs/{job_id}/items",
+        "stream_url": f"/api/scrape-jobs/{job_id}/stream",
+    }, status_code=202)
+
+@app.post("/api/scrape-jobs")
+async def start_scrape_job(request: Request):
     """
-    Accepts:
-      - a single lead object
-      - a list of leads
-      - or an object: { "leads": [...], "emailTemplateId": "uuid-optional", "campaignId": "..." }
-    Stamps campaign_id onto every lead and runs call/email flows.
+    Start an NL scrape in the background. Body as /api/scrape-leads.
+    Poll /api/scrape-jobs/{job_id}, page /items, or follow /stream (NDJSON).
     """
-    # Read JSON first so we can accept user_id from the body too
-    body = await request.json()
+    parsed, err = await _parse_scrape_body(request)
+    if err:
+        return err
+    return _create_scrape_job_response(parsed)
+
+@app.get("/api/scrape-cache/metrics")
+def get_scrape_cache_metrics():
+    return {"ok": True, **scrape_cache_metrics()}
+
+@app.get("/api/scrape-jobs/{job_id}")
+def get_scrape_job(job_id: str):
+    job = load_scrape_job(job_id)
+    if not job:
+        return JSONResponse({"ok": False, "error": "Job not found"}, status_code=404)
+    out = {"ok": True, **_public_scrape_job(job)}
+    if job.get("dataset_id"):
+        try:
+            _, total = fetch_apify_items(job["dataset_id"], 0, 1)
+            out["items_available"] = min(int(total or 0), int(job["count"]))
+        except Exception as e:
+            print("[SCRAPE][JOB] dataset count failed:", e)
+    return out
 
-    # Accept user_id from header, query, OR body (user_id / userId)
-    user_id = (
-        _get_request_user_id(request)
-        or (body.get("user_id") if isinstance(body, dict) else None)
-        or (body.get("userId") if isinstance(body, dict) else None)
-    )
-    if not user_id:
-        return JSONResponse({"ok": False, "error": "Missing user_id"}, status_code=400)
+@app.get("/api/scrape-jobs/{job_id}/items")
+def get_scrape_job_items(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(SCRAPE_PAGE_SIZE, ge=1, le=5000)):
+    """Page through the items the actor has pushed so far (works while the run is still going)."""
+    job = load_scrape_job(job_id)
+    if not job:
+        return JSONResponse({"ok": False, "error": "Job not found"}, status_code=404)
+    if not job.get("dataset_id"):
+        return {"ok": True, "status": job.get("status"), "items": [], "offset": offset, "next_offset": offset, "done": False}
 
+    limit = max(0, min(limit, int(job["count"]) - offset))
     try:
-        # One-time raw log to prove what the UI actually sent
-        print(f"[ACCEPT][RAW BODY] {json.dumps(body)[:2000]}")
-    except Exception:
-        print("[ACCEPT][RAW BODY] (non-serializable)")
+        items, _ = fetch_apify_items(job["dataset_id"], offset, limit) if limit else ([], None)
+    except Exception as e:
+        return JSONResponse({"ok": False, "error": f"Apify error: {e}"}, status_code=502)
+    next_offset = offset + len(items)
+    finished = job.get("status") in ("done", "error")
+    return {
+        "ok": True,
+        "status": job.get("status"),
+        "items": items,
+        "offset": offset,
+        "next_offset": next_offset,
+        "done": finished and (not items or next_offset >= int(job["count"])),
+    }
 
-    email_template_id = None
-    leads = []
-    body_type = "unknown"
+@app.get("/api/scrape-jobs/{job_id}/stream")
+async def stream_scrape_job(job_id: str):
+    """
+    NDJSON stream: one item per line as the actor produces them, then a final
+    {"_status": ...} line once the run has finished and the dataset is drained (or the
+    run's timeout plus SCRAPE_STREAM_GRACE_SECONDS has passed).
+    """
+    job = await run_blocking(load_scrape_job, job_id)
+    if not job:
+        return JSONResponse({"ok": False, "error": "Job not found"}, status_code=404)
+
+    async def gen():
+        nonlocal job
+        offset = 0
+        limit_total = int(job["count"])
+        deadline = time.monotonic() + APIFY_RUN_TIMEOUT_SECONDS + SCRAPE_STREAM_GRACE_SECONDS
+        while offset < limit_total:
+            if time.monotonic() > deadline:
+                print(f"[SCRAPE][STREAM] {job_id} still {job.get('status')} at the stream deadline; closing")
+                job = {**job, "error": job.get("error") or "stream deadline exceeded"}
+                break
+            if job.get("status") not in ("done", "error"):
+                # the run may be on another worker; re-read its status (and dataset id)
+                job = await run_blocking(load_scrape_job, job_id) or job
+            finished = job.get("status") in ("done", "error")
+            items: List[dict] = []
+            if job.get("dataset_id"):
+                try:
+                    items, _ = await run_blocking(
+                        fetch_apify_items, job["dataset_id"], offset, min(SCRAPE_PAGE_SIZE, limit_total - offset)
+                    )
+                except Exception as e:
+                    print(f"[SCRAPE][STREAM] {job_id} page fetch failed:", e)
+            for it in items:
+                yield json.dumps(it, default=str) + "\n"
+            offset += len(items)
+            if not items:
+                if finished:
+                    break
+                await asyncio.sleep(APIFY_POLL_SECONDS)
+        yield json.dumps({"_status": job.get("status"), "_error": job.get("error"), "_items": offset}) + "\n"
+
+    return StreamingResponse(gen(), media_type="application/x-ndjson")
 
-    # ---- Resolve container and optional template ----
-    if isinstance(body, dict) and "leads" in body:
-        leads = body.get("leads") or []
-        email_template_id = body.get("emailTemplateId")
-        body_type = "dict"
-    elif isinstance(body, list):
-        leads = body
-        body_type = "list"
-    elif isinstance(body, dict):
-        leads = [body]
-        body_type = "single-dict"
-    else:
-        return JSONResponse({"ok": False, "error": "Invalid body"}, status_code=400)
+# ==============================================
+# Lead acceptance (bulk: normalize -> chunked upsert -> hydrate -> dispatch)
+# ==============================================
+ACCEPT_UPSERT_CHUNK = int(os.getenv("ACCEPT_UPSERT_CHUNK", "200"))
+
+_ACCEPT_PHONE_ALIASES = [
+    "phone_number", "mobile", "mobile_number", "cell", "work_phone",
+    "telephone", "tel", "primary_phone", "contact_number"
+]
+
+def _chunks(items: List, size: int):
+    size = max(1, int(size or 1))
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _normalize_accepted_lead(lead, req_campaign_id: Optional[str], user_id: str) -> Optional[dict]:
+    """
+    In-memory canonicalization of one incoming lead (no DB access).
+    Returns None when the lead must be skipped (no campaign / missing or invalid email).
+    """
+    if not isinstance(lead, dict):
+        return None
+
+    # ----- Canonicalize & stamp campaign onto the lead BEFORE any DB writes -----
+    per_lead_campaign = (lead.get("campaignId") or lead.get("campaign_id") or "").strip() or None
+    lead["campaign_id"] = per_lead_campaign or req_campaign_id  # <- canonical target field
+    if not lead["campaign_id"]:
+        print("[ACCEPT][WARN] Lead missing campaign_id after resolution; skipping.")
+        return None
+
+    # Generate id if needed and bind to user
+    if not lead.get("id"):
+        lead["id"] = str(uuid4())
+    lead["user_id"] = user_id
+
+    # ---- EMAIL NORMALIZATION & VALIDATION (REQUIRED for upsert) ----
+    raw_email = (lead.get("email_address") or lead.get("email") or lead.get("Email") or "").strip()
+    if not raw_email:
+        print(f"[ACCEPT][EMAIL][ERROR] Lead missing email/email_address; skipping. id={lead.get('id')} name={lead.get('first_name')}")
+        return None
+    lead["email_address"] = raw_email.lower()
+    if not EMAIL_REGEX.match(lead["email_address"]):
+        print(f"[ACCEPT][EMAIL][ERROR] Invalid email='{lead['email_address']}' ; skipping lead id={lead.get('id')}")
+        return None
+
+    # ---- PHONE NORMALIZATION ----
+    for src in _ACCEPT_PHONE_ALIASES:
+        v = lead.get(src)
+        if isinstance(v, str) and v.strip() and not lead.get("phone"):
+            lead["phone"] = v.strip()
+    if not lead.get("contact_phone_numbers") and isinstance(lead.get("phone"), str) and lead["phone"].strip():
+        lead["contact_phone_numbers"] = [{"rawNumber": lead["phone"].strip()}]
+
+    # Parse a few stringified fields safely
+    if isinstance(lead.get("contact_phone_numbers"), str):
+        try:
+            lead["contact_phone_numbers"] = json.loads(lead["contact_phone_numbers"])
+        except Exception:
+            lead["contact_phone_numbers"] = []
+    if isinstance(lead.get("company"), str):
+        try:
+            lead["company"] = json.loads(lead["company"])
+        except Exception:
+            pass
+
+    # Resolve phone/timezone once so dialing never re-parses it
+    lead.update(compute_phone_fields(lead))
+
+    # Status defaults
+    lead["status"] = "accepted"
+    lead["accepted_at"] = datetime.utcnow().isoformat()
+    lead.setdefault("call_attempts", 0)
+    lead.setdefault("last_call_status", None)
+    lead.setdefault("next_call_at", None)
+    return lead
+
+def _upsert_lead_single(lead: dict, user_id: str) -> Optional[dict]:
+    """
+    Per-lead upsert (unique on user_id + email_address), used when a bulk chunk fails.
+    Returns the saved row (with the lead's campaign applied) or None.
+    """
+    try:
+        # 🚫 Do NOT send 'id' when upserting on (user_id,email_address)
+        upsert_payload = {k: v for k, v in lead.items() if k != "id"}
+        res = (supabase.table("leads")
+               .upsert(upsert_payload, on_conflict="user_id,email_address")
+               .execute())
+        saved_rows = getattr(res, "data", []) or []
+        if saved_rows:
+            saved = saved_rows[0]
+        else:
+            # some PostgREST versions return no data on upsert; fetch explicitly
+            fetch = (supabase.table("leads")
+                     .select("*")
+                     .eq("user_id", user_id)
+                     .eq("email_address", lead.get("email_address"))
+                     .single().execute())
+            saved = getattr(fetch, "data", None) or {}
+        if not saved:
+            print("[ACCEPT] Upsert did not return/fetch a row; skipping.")
+            return None
+        return saved
+    except Exception as e:
+        msg = str(e)
+        # Duplicate -> reuse existing row and UPDATE campaign to the new one (never touch id)
+        if "23505" not in msg and "duplicate key value violates unique constraint" not in msg:
+            print(f"[ACCEPT] Supabase upsert failed for lead {lead.get('id')}: {e}")
+            return None
+        try:
+            existing = (supabase.table("leads")
+                        .select("*")
+                        .eq("user_id", user_id)
+                        .eq("email_address", lead.get("email_address"))
+                        .single().execute()).data
+            if not existing:
+                print("[ACCEPT] Duplicate raised but fetch failed; skipping this lead.")
+                return None
+            patch = {}
+            for k in ["first_name", "last_name", "company_name", "job_title", "location",
+                      "city_name", "state_name", "country_name", "phone", "contact_phone_numbers"]:
+                v = lead.get(k)
+                if v and not existing.get(k):
+                    patch[k] = v
+            if patch:
+                update_lead(existing["id"], patch)
+            print(f"[ACCEPT] Reused existing lead (user/email unique). id={existing['id']} -> campaign={lead['campaign_id']}")
+            return {**existing, **patch}
+        except Exception as e2:
+            print(f"[ACCEPT] Failed to fetch existing lead after 23505: {e2}")
+            return None
+
+def _bulk_upsert_leads(chunk: List[dict], user_id: str) -> List[Tuple[dict, dict]]:
+    """
+    Upsert a chunk of normalized leads with returning rows. Leads are grouped by key set
+    (PostgREST bulk upserts need matching keys) and rows are matched back by email.
+    Returns [(lead, saved_row)] for every lead that was persisted.
+    """
+    groups: Dict[frozenset, List[dict]] = {}
+    for ld in chunk:
+        groups.setdefault(frozenset(k for k in ld if k != "id"), []).append(ld)
+
+    out: List[Tuple[dict, dict]] = []
+    for group in groups.values():
+        payload = [{k: v for k, v in ld.items() if k != "id"} for ld in group]
+        try:
+            res = (supabase.table("leads")
+                   .upsert(payload, on_conflict="user_id,email_address")
+                   .execute())
+            rows = getattr(res, "data", []) or []
+        except Exception as e:
+            print(f"[ACCEPT][BULK] chunk upsert failed ({len(group)} leads); retrying one by one:", e)
+            for ld in group:
+                saved = _upsert_lead_single(ld, user_id)
+                if saved:
+                    out.append((ld, saved))
+            continue
+
+        by_email = {(r.get("email_address") or "").lower(): r for r in rows}
+        missing = [ld["email_address"] for ld in group if ld["email_address"] not in by_email]
+        if missing:
+            # some PostgREST versions return no data on upsert; fetch explicitly in one query
+            try:
+                fetch = (supabase.table("leads").select("*")
+                         .eq("user_id", user_id)
+                         .in_("email_address", missing)
+                         .execute())
+                for r in getattr(fetch, "data", []) or []:
+                    by_email[(r.get("email_address") or "").lower()] = r
+            except Exception as e:
+                print("[ACCEPT][BULK] fetch after upsert failed:", e)
+
+        for ld in group:
+            saved = by_email.get(ld["email_address"])
+            if saved:
+                out.append((ld, saved))
+            else:
+                print(f"[ACCEPT][BULK] no row returned for email={ld['email_address']}; skipping.")
+    return out
+
+def _accept_lead_chunk(chunk: List[dict], user_id: str) -> List[dict]:
+    """
+    Persist one chunk of normalized leads: bulk upsert, campaign fix-up (one update per
+    campaign) and a single `in_` hydrate of phone fields. Returns leads carrying DB ids.
+    """
+    pairs = _bulk_upsert_leads(chunk, user_id)
+
+    # if DB rows still point at a different campaign, force them to the *new* one
+    fixups: Dict[str, List[str]] = {}
+    for ld, saved in pairs:
+        # Always use DB’s id (keeps existing id stable when it was an update)
+        ld["id"] = saved.get("id", ld.get("id"))
+        if (saved.get("campaign_id") or "") != ld["campaign_id"]:
+            fixups.setdefault(ld["campaign_id"], []).append(ld["id"])
+    for campaign_id, ids in fixups.items():
+        try:
+            (supabase.table("leads")
+             .update({"campaign_id": campaign_id, "updated_at": datetime.utcnow().isoformat()})
+             .in_("id", ids).execute())
+        except Exception as e:
+            print(f"[ACCEPT][BULK] campaign fix-up failed campaign={campaign_id}:", e)
+
+    leads = [ld for ld, _ in pairs]
+
+    # hydrate phone back from DB where we still don't have one (one query per chunk)
+    need = [ld["id"] for ld in leads if not ld.get("phone") or not ld.get("contact_phone_numbers")]
+    if need:
+        try:
+            res = (supabase.table("leads")
+                   .select("id,phone,contact_phone_numbers,company,phone_e164,phone_tz,phone_valid")
+                   .in_("id", need).execute())
+            db_rows = {r.get("id"): r for r in (getattr(res, "data", []) or [])}
+        except Exception as e:
+            print("[ACCEPT] DB hydrate failed (continuing):", e)
+            db_rows = {}
+        for ld in leads:
+            db_lead = db_rows.get(ld["id"])
+            if not db_lead:
+                continue
+            if not ld.get("phone") and isinstance(db_lead.get("phone"), str) and db_lead["phone"].strip():
+                ld["phone"] = db_lead["phone"].strip()
+            if not ld.get("contact_phone_numbers") and isinstance(db_lead.get("contact_phone_numbers"), list):
+                ld["contact_phone_numbers"] = db_lead["contact_phone_numbers"]
+            if not ld.get("phone") and isinstance(db_lead.get("company"), dict):
+                cph = db_lead["company"].get("phone")
+                if isinstance(cph, str) and cph.strip():
+                    ld["phone"] = cph.strip()
+            if isinstance(ld.get("phone"), str) and ld["phone"].strip() and not ld.get("contact_phone_numbers"):
+                ld["contact_phone_numbers"] = [{"rawNumber": ld["phone"].strip()}]
+            if not ld.get("phone_e164"):
+                if db_lead.get("phone_e164"):
+                    for k in ("phone_e164", "phone_tz", "phone_valid"):
+                        ld[k] = db_lead.get(k)
+                else:
+                    fields = compute_phone_fields(ld)
+                    if fields.get("phone_e164"):
+                        ld.update(fields)
+                        update_lead(ld["id"], fields)
+
+    print(f"[ACCEPT][BULK] chunk saved={len(leads)}/{len(chunk)} campaign_fixups={sum(len(v) for v in fixups.values())} hydrated={len(need)}")
+    return leads
+
+def _dispatch_accepted_leads(leads: List[dict], email_template_id: Optional[str], user_id: str,
+                             skip_call_ids: Optional[set] = None):
+    """
+    Call / schedule / initial-email fan-out for one accepted chunk.
+    Runs as a background task so the accept request only pays for the DB writes.
+    skip_call_ids: leads already dialed/scheduled by an earlier attempt at this chunk.
+    """
+    rules_by_campaign: Dict[str, Dict] = {}
+    initial_sender = os.getenv("INITIAL_EMAIL_SENDER", "render").strip().lower()
+
+    for lead in leads:
+        try:
+            cid = lead.get("campaign_id")
+            if cid not in rules_by_campaign:
+                rules_by_campaign[cid] = get_campaign_rules(cid)
+            rules = rules_by_campaign[cid]
+
+            if skip_call_ids and lead.get("id") in skip_call_ids:
+                print(f"[ACCEPT] Call already handled by an earlier attempt; lead_id={lead.get('id')}")
+            elif rules.get("send_calls", True):
+                phone, tz = lead_phone_and_tz(lead)
+                if phone and in_call_window_now(phone, rules["call_window_start"], rules["call_window_end"], tz=tz):
+                    print(f"[ACCEPT] Calling now: {phone} lead_id={lead.get('id')}")
+                    call_lead_if_possible(lead)
+                else:
+                    nxt = next_window_start(phone, rules["call_window_start"], rules["call_window_end"], tz=tz) if phone else None
+                    if nxt:
+                        schedule_next_call(lead.get("id"), nxt)
+                        log_call_to_supabase(lead.get("id"), "scheduled", f"Out of window at accept. Next: {nxt.isoformat()} UTC", user_id=user_id)
+                        print(f"[ACCEPT] Out of window; scheduled for {nxt.isoformat()} lead_id={lead.get('id')}")
+                    else:
+                        log_call_to_supabase(lead.get("id"), "no-tz", "No timezone at accept", user_id=user_id)
+                        print(f"[ACCEPT] Could not determine timezone for phone={phone} lead_id={lead.get('id')}")
+
+            # Initial email is handled by Lovable when INITIAL_EMAIL_SENDER=lovable
+            if rules.get("send_email", True):
+                if initial_sender == "render":
+                    print(f"[ACCEPT] Sending INITIAL email for lead_id={lead.get('id')} (sender=render)")
+                    send_email_if_possible(lead, email_template_id, user_id, f"{lead.get('id')}:step:initial")
+                else:
+                    print(f"[ACCEPT] Skipping INITIAL email (sender={initial_sender}); Lovable will send.")
+        except Exception as e:
+            print(f"[ACCEPT] dispatch failed lead_id={lead.get('id')}:", e)
+
+def accept_leads(
+    leads: List,
+    req_campaign_id: Optional[str],
+    user_id: str,
+    email_template_id: Optional[str],
+    dispatch,
+) -> Dict[str, int]:
+    """
+    Normalize all leads in memory, then persist and dispatch them chunk by chunk.
+    `dispatch(chunk_leads)` schedules the call/email fan-out for a saved chunk.
+    """
+    normalized: Dict[str, dict] = {}
+    skipped = 0
+    for lead in leads:
+        ld = _normalize_accepted_lead(lead, req_campaign_id, user_id)
+        if ld is None:
+            skipped += 1
+            continue
+        # a bulk upsert cannot touch the same (user_id, email) twice; last one wins
+        if ld["email_address"] in normalized:
+            skipped += 1
+        normalized[ld["email_address"]] = ld
+
+    saved = 0
+    for chunk in _chunks(list(normalized.values()), ACCEPT_UPSERT_CHUNK):
+        done = _accept_lead_chunk(chunk, user_id)
+        saved += len(done)
+        if done:
+            dispatch(done)
+    return {"saved": saved, "skipped": skipped, "failed": len(normalized) - saved}
+
+def _resolve_accept_body(request: Request, body) -> Tuple[Optional[dict], Optional[JSONResponse]]:
+    """
+    Shared body parsing for the accept endpoints. Returns (parsed, None) or (None, error_response).
+    parsed = {"user_id", "leads", "email_template_id", "campaign_id", "body_type"}
+    """
+    # Accept user_id from header, query, OR body (user_id / userId)
+    user_id = (
+        _get_request_user_id(request)
+        or (body.get("user_id") if isinstance(body, dict) else None)
+        or (body.get("userId") if isinstance(body, dict) else None)
+    )
+    if not user_id:
+        return None, JSONResponse({"ok": False, "error": "Missing user_id"}, status_code=400)
+
+    email_template_id = None
+    leads = []
+    body_type = "unknown"
+
+    # ---- Resolve container and optional template ----
+    if isinstance(body, dict) and "leads" in body:
+        leads = body.get("leads") or []
+        email_template_id = body.get("emailTemplateId")
+        body_type = "dict"
+    elif isinstance(body, list):
+        leads = body
+        body_type = "list"
+    elif isinstance(body, dict):
+        leads = [body]
+        body_type = "single-dict"
+    else:
+        return None, JSONResponse({"ok": False, "error": "Invalid body"}, status_code=400)
 
     # ---- Resolve top-level campaign (optional – per-lead overrides still supported) ----
     req_campaign_id = (
@@ -1669,208 +3213,568 @@ async def accept_and_call_leads(request: Request, background_tasks: BackgroundTa
             for l in leads
         )
         if not has_any:
-            return JSONResponse({"ok": False, "error": "Missing campaignId (top-level or per-lead)"}, status_code=400)
+            return None, JSONResponse({"ok": False, "error": "Missing campaignId (top-level or per-lead)"}, status_code=400)
 
     print(f"[ACCEPT] Received {len(leads)} lead(s). BodyType={body_type}")
+    if leads and isinstance(leads[0], dict):
+        # Log a sample, not the whole payload — serializing a large body just to truncate it is wasteful
+        try:
+            print(f"[ACCEPT][SAMPLE LEAD] {json.dumps(leads[0])[:500]}")
+        except Exception:
+            print("[ACCEPT][SAMPLE LEAD] (non-serializable)")
 
-    results = []
-    for lead in leads:
-        if not isinstance(lead, dict):
-            continue
+    return {
+        "user_id": user_id,
+        "leads": leads,
+        "email_template_id": email_template_id,
+        "campaign_id": req_campaign_id,
+        "body_type": body_type,
+    }, None
 
-        # ----- Canonicalize & stamp campaign onto the lead BEFORE any DB writes -----
-        per_lead_campaign = (lead.get("campaignId") or lead.get("campaign_id") or "").strip() or None
-        resolved_campaign = per_lead_campaign or req_campaign_id
-        lead["campaign_id"] = resolved_campaign  # <- canonical target field
+@app.post("/api/accepted-leads")
+async def accept_and_call_leads(request: Request, background_tasks: BackgroundTasks):
+    """
+    Accepts:
+      - a single lead object
+      - a list of leads
+      - or an object: { "leads": [...], "emailTemplateId": "uuid-optional", "campaignId": "..." }
+    Stamps campaign_id onto every lead, upserts them in chunks and fans out call/email flows per chunk.
+    With ?mode=job the batch is stored as an accept job instead (see /api/accept-jobs).
+    """
+    # Read JSON first so we can accept user_id from the body too
+    body = await request.json()
+    parsed, err = _resolve_accept_body(request, body)
+    if err:
+        return err
+
+    if (request.query_params.get("mode") or "").lower() == "job":
+        return await _create_accept_job_response(parsed, background_tasks)
+
+    user_id = parsed["user_id"]
+    email_template_id = parsed["email_template_id"]
+    counts = await run_blocking(
+        accept_leads,
+        parsed["leads"], parsed["campaign_id"], user_id, email_template_id,
+        dispatch=lambda chunk: background_tasks.add_task(_dispatch_accepted_leads, chunk, email_template_id, user_id),
+    )
+    return {"status": "saved_and_scheduled", "num_leads": counts["saved"], "received": len(parsed["leads"])}
 
-        if not lead["campaign_id"]:
-            # Shouldn't happen due to guard above, but double-check
-            print("[ACCEPT][WARN] Lead missing campaign_id after resolution; skipping.")
-            continue
+# ---------------------------------------------------
+# Accept jobs (durable, chunked, resumable after restarts)
+# ---------------------------------------------------
+ACCEPT_JOBS_TABLE = os.getenv("ACCEPT_JOBS_TABLE", "accept_jobs")
+ACCEPT_JOB_CHUNKS_TABLE = os.getenv("ACCEPT_JOB_CHUNKS_TABLE", "accept_job_chunks")
+ACCEPT_JOB_CHUNKS_PER_TICK = int(os.getenv("ACCEPT_JOB_CHUNKS_PER_TICK", "5"))
+ACCEPT_JOB_STALE_MINUTES = int(os.getenv("ACCEPT_JOB_STALE_MINUTES", "10"))
+
+def create_accept_job(user_id: str, leads: List, campaign_id: Optional[str], email_template_id: Optional[str]) -> str:
+    """Store the raw batch as one job row plus ACCEPT_UPSERT_CHUNK-sized chunk rows."""
+    job_id = str(uuid4())
+    supabase.table(ACCEPT_JOBS_TABLE).insert({
+        "id": job_id,
+        "user_id": user_id,
+        "campaign_id": campaign_id,
+        "email_template_id": email_template_id,
+        "status": "queued",
+        "total": len(leads),
+    }).execute()
+
+    rows = [
+        {"job_id": job_id, "chunk_index": i, "leads": chunk, "size": len(chunk), "status": "pending"}
+        for i, chunk in enumerate(_chunks(leads, ACCEPT_UPSERT_CHUNK))
+    ]
+    # several chunk rows per insert keeps request bodies reasonable
+    for batch in _chunks(rows, 10):
+        supabase.table(ACCEPT_JOB_CHUNKS_TABLE).insert(batch).execute()
+    print(f"[ACCEPT][JOB] created job={job_id} leads={len(leads)} chunks={len(rows)}")
+    return job_id
+
+async def _create_accept_job_response(parsed: dict, background_tasks: BackgroundTasks):
+    try:
+        job_id = await run_blocking(
+            create_accept_job, parsed["user_id"], parsed["leads"], parsed["campaign_id"], parsed["email_template_id"]
+        )
+    except Exception as e:
+        print("[ACCEPT][JOB] create failed:", e)
+        return JSONResponse({"ok": False, "error": f"Could not store accept job: {e}"}, status_code=500)
+    # Start right away; the scheduled tick picks up anything this misses (e.g. after a restart)
+    background_tasks.add_task(run_accept_jobs_tick)
+    return JSONResponse({
+        "ok": True,
+        "job_id": job_id,
+        "received": len(parsed["leads"]),
+        "status_url": f"/api/accept-jobs/{job_id}",
+    }, status_code=202)
+
+def _claim_accept_job_chunk() -> Optional[dict]:
+    """Claim the oldest pending chunk (or one whose worker went stale)."""
+    stale_iso = (datetime.utcnow() - timedelta(minutes=ACCEPT_JOB_STALE_MINUTES)).isoformat()
+    try:
+        cand = (supabase.table(ACCEPT_JOB_CHUNKS_TABLE)
+                .select("id,job_id,chunk_index,status,lock_token")
+                .or_(f"status.eq.pending,and(status.eq.running,claimed_at.lt.{stale_iso})")
+                .order("id", desc=False)
+                .limit(5)
+                .execute()).data or []
+    except Exception as e:
+        print("[ACCEPT][JOB] select chunks failed:", e)
+        return None
 
-        # Generate id if needed and bind to user
-        if not lead.get("id"):
-            lead["id"] = str(uuid4())
-            print(f"[ACCEPT] Generated id for lead: {lead['id']}")
-        lead["user_id"] = user_id
+    my_lock = str(uuid4())
+    now_iso = datetime.utcnow().isoformat()
+    for row in cand:
+        try:
+            q = (supabase.table(ACCEPT_JOB_CHUNKS_TABLE)
+                 .update({"status": "running", "lock_token": my_lock, "claimed_at": now_iso})
+                 .eq("id", row["id"])
+                 .eq("status", row["status"]))
+            if row.get("lock_token"):
+                q = q.eq("lock_token", row["lock_token"])
+            owned = getattr(q.execute(), "data", None) or []
+            if owned:
+                # a stale "running" chunk was partly dispatched by the worker that died
+                return {**owned[0], "resumed": row["status"] == "running"}
+        except Exception as e:
+            print(f"[ACCEPT][JOB] claim failed chunk={row.get('id')}:", e)
+    return None
 
-        # ---- EMAIL NORMALIZATION & VALIDATION (REQUIRED for upsert) ----
-        raw_email = (
-            (lead.get("email_address") or lead.get("email") or lead.get("Email") or "").strip()
+def _leads_with_call_activity(lead_ids: List[str], since_iso: Optional[str]) -> set:
+    """Leads that got any call_logs row (queued / scheduled / no-tz ...) since since_iso."""
+    ids = [i for i in lead_ids if i]
+    if not ids:
+        return set()
+    q = supabase.table("call_logs").select("lead_id").in_("lead_id", ids)
+    if since_iso:
+        q = q.gte("created_at", since_iso)
+    rows = getattr(q.execute(), "data", None) or []
+    return {r.get("lead_id") for r in rows}
+
+def _process_accept_job_chunk(chunk_row: dict):
+    rid = chunk_row["id"]
+    job_id = chunk_row["job_id"]
+    lock = chunk_row.get("lock_token")
+    try:
+        job = (supabase.table(ACCEPT_JOBS_TABLE).select("*").eq("id", job_id).single().execute()).data or {}
+        if job.get("status") == "queued":
+            supabase.table(ACCEPT_JOBS_TABLE).update({
+                "status": "running", "started_at": datetime.utcnow().isoformat()
+            }).eq("id", job_id).eq("status", "queued").execute()
+
+        user_id = job.get("user_id")
+        email_template_id = job.get("email_template_id")
+        resumed = bool(chunk_row.get("resumed"))
+
+        def dispatch(leads):
+            # Taking over a stale chunk: emails are guarded by their idem key, calls are not,
+            # so skip leads the previous worker already dialed or scheduled.
+            skip = (_leads_with_call_activity([ld.get("id") for ld in leads], job.get("created_at"))
+                    if resumed else None)
+            _dispatch_accepted_leads(leads, email_template_id, user_id, skip_call_ids=skip)
+
+        counts = accept_leads(
+            chunk_row.get("leads") or [], job.get("campaign_id"), user_id, email_template_id,
+            dispatch=dispatch,
         )
-        if raw_email:
-            lead["email_address"] = raw_email.lower()
-        else:
-            print(f"[ACCEPT][EMAIL][ERROR] Lead missing email/email_address; skipping. id={lead.get('id')} name={lead.get('first_name')}")
-            continue
+        supabase.table(ACCEPT_JOB_CHUNKS_TABLE).update({
+            "status": "done",
+            "saved": counts["saved"],
+            "skipped": counts["skipped"],
+            "failed": counts["failed"],
+            "finished_at": datetime.utcnow().isoformat(),
+            "leads": None,  # payload no longer needed
+        }).eq("id", rid).eq("lock_token", lock).execute()
+        print(f"[ACCEPT][JOB] job={job_id} chunk={chunk_row.get('chunk_index')} {counts}")
+    except Exception as e:
+        print(f"[ACCEPT][JOB] chunk failed job={job_id} chunk={rid}:", e)
+        try:
+            supabase.table(ACCEPT_JOB_CHUNKS_TABLE).update({
+                "status": "error",
+                "failed": int(chunk_row.get("size") or 0),
+                "error": str(e)[:500],
+                "finished_at": datetime.utcnow().isoformat(),
+            }).eq("id", rid).eq("lock_token", lock).execute()
+        except Exception:
+            pass
+
+    # Close the job once no chunk is left to do
+    try:
+        left = (supabase.table(ACCEPT_JOB_CHUNKS_TABLE).select("id", count="exact")
+                .eq("job_id", job_id).in_("status", ["pending", "running"]).execute())
+        if not (getattr(left, "count", None) or 0):
+            supabase.table(ACCEPT_JOBS_TABLE).update({
+                "status": "completed", "finished_at": datetime.utcnow().isoformat()
+            }).eq("id", job_id).neq("status", "completed").execute()
+    except Exception as e:
+        print("[ACCEPT][JOB] completion check failed:", e)
 
-        # Optional (reject clearly invalid emails early)
-        if not EMAIL_REGEX.match(lead["email_address"]):
-            print(f"[ACCEPT][EMAIL][ERROR] Invalid email='{lead['email_address']}' ; skipping lead id={lead.get('id')}")
+def run_accept_jobs_tick(max_chunks: int = ACCEPT_JOB_CHUNKS_PER_TICK):
+    for _ in range(max(1, max_chunks)):
+        chunk_row = _claim_accept_job_chunk()
+        if not chunk_row:
+            return
+        # the claim select skips the payload; load it now that we own the chunk
+        try:
+            full = (supabase.table(ACCEPT_JOB_CHUNKS_TABLE).select("*")
+                    .eq("id", chunk_row["id"]).single().execute()).data or {}
+            chunk_row = {**chunk_row, **full}
+        except Exception as e:
+            print("[ACCEPT][JOB] load chunk failed:", e)
             continue
+        _process_accept_job_chunk(chunk_row)
 
-        # ---- PHONE NORMALIZATION (kept from your code) ----
-        for src in [
-            "phone_number", "mobile", "mobile_number", "cell", "work_phone",
-            "telephone", "tel", "primary_phone", "contact_number"
-        ]:
-            v = lead.get(src)
-            if isinstance(v, str) and v.strip() and not lead.get("phone"):
-                lead["phone"] = v.strip()
-        if not lead.get("contact_phone_numbers") and isinstance(lead.get("phone"), str) and lead["phone"].strip():
-            lead["contact_phone_numbers"] = [{"rawNumber": lead["phone"].strip()}]
-        print("[ACCEPT][PHONE DEBUG]", json.dumps({
-            "phone": lead.get("phone"),
-            "phone_number": lead.get("phone_number"),
-            "mobile": lead.get("mobile"),
-            "contact_phone_numbers": lead.get("contact_phone_numbers"),
-            "company.phone": (lead.get("company") or {}).get("phone") if isinstance(lead.get("company"), dict) else None
-        }, indent=2))
-
-        # Parse a few stringified fields safely
-        if isinstance(lead.get("contact_phone_numbers"), str):
-            try:
-                lead["contact_phone_numbers"] = json.loads(lead["contact_phone_numbers"])
-            except Exception:
-                lead["contact_phone_numbers"] = []
-        if isinstance(lead.get("company"), str):
-            try:
-                lead["company"] = json.loads(lead["company"])
-            except Exception:
-                pass
+@app.post("/api/accept-jobs")
+async def create_accept_job_endpoint(request: Request, background_tasks: BackgroundTasks):
+    """
+    Same body as /api/accepted-leads, but returns 202 with a job id immediately.
+    Poll GET /api/accept-jobs/{job_id} for progress.
+    """
+    body = await request.json()
+    parsed, err = _resolve_accept_body(request, body)
+    if err:
+        return err
+    return await _create_accept_job_response(parsed, background_tasks)
 
-        # Status defaults
-        lead["status"] = "accepted"
-        lead["accepted_at"] = datetime.utcnow().isoformat()
-        lead.setdefault("call_attempts", 0)
-        lead.setdefault("last_call_status", None)
-        lead.setdefault("next_call_at", None)
+@app.get("/api/accept-jobs/{job_id}")
+def get_accept_job(job_id: str, request: Request):
+    user_id = _get_request_user_id(request)
+    if not user_id:
+        return JSONResponse({"ok": False, "error": "Missing user_id"}, status_code=400)
+    try:
+        job = (supabase.table(ACCEPT_JOBS_TABLE).select("*")
+               .eq("id", job_id).eq("user_id", user_id)
+               .limit(1).execute()).data
+        job = job[0] if job else None
+    except Exception:
+        job = None
+    if not job:
+        return JSONResponse({"ok": False, "error": "Job not found"}, status_code=404)
 
-        # ---- Upsert (unique on user_id + email_address) ----
+    try:
+        chunks = (supabase.table(ACCEPT_JOB_CHUNKS_TABLE)
+                  .select("status,size,saved,skipped,failed,claimed_at,finished_at")
+                  .eq("job_id", job_id).execute()).data or []
+    except Exception as e:
+        print("[ACCEPT][JOB] chunk status fetch failed:", e)
+        chunks = []
+
+    done = [c for c in chunks if c.get("status") in ("done", "error")]
+    saved = sum(int(c.get("saved") or 0) for c in done)
+    skipped = sum(int(c.get("skipped") or 0) for c in done)
+    failed = sum(int(c.get("failed") or 0) for c in done)
+
+    # throughput over the time chunks have actually been worked on
+    per_sec = None
+    starts = [_parse_since(c.get("claimed_at")) for c in done if c.get("claimed_at")]
+    ends = [_parse_since(c.get("finished_at")) for c in done if c.get("finished_at")]
+    if starts and ends:
         try:
-            # 🚫 Do NOT send 'id' when upserting on (user_id,email_address)
-            upsert_payload = {k: v for k, v in lead.items() if k != "id"}
-        
-            res = (supabase.table("leads")
-                   .upsert(upsert_payload, on_conflict="user_id,email_address")
-                   .execute())
-            saved_rows = getattr(res, "data", []) or []
-        
-            if saved_rows:
-                saved = saved_rows[0]
-            else:
-                # some PostgREST versions return no data on upsert; fetch explicitly
-                fetch = (supabase.table("leads")
-                         .select("*")
-                         .eq("user_id", user_id)
-                         .eq("email_address", lead.get("email_address") or lead.get("email"))
-                         .single().execute())
-                saved = getattr(fetch, "data", None) or {}
-        
-            if saved:
-                # Always use DB’s id (keeps existing id stable when it was an update)
-                lead["id"] = saved.get("id", lead.get("id"))
-        
-                # if DB row had a different campaign, force it to the *new* one
-                if (saved.get("campaign_id") or "") != lead["campaign_id"]:
-                    update_lead(lead["id"], {"campaign_id": lead["campaign_id"]})
-        
-                results.append({**saved, "campaign_id": lead["campaign_id"]})
-            else:
-                print("[ACCEPT] Upsert did not return/fetch a row; skipping.")
+            secs = (datetime.fromisoformat(max(e for e in ends if e)) - datetime.fromisoformat(min(s for s in starts if s))).total_seconds()
+            if secs > 0:
+                per_sec = round((saved + skipped + failed) / secs, 2)
+        except Exception:
+            per_sec = None
+
+    return {
+        "ok": True,
+        "job_id": job_id,
+        "status": job.get("status"),
+        "total": job.get("total"),
+        "processed": saved,
+        "skipped": skipped,
+        "failed": failed,
+        "chunks_total": len(chunks),
+        "chunks_done": len(done),
+        "leads_per_second": per_sec,
+        "created_at": job.get("created_at"),
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+    }
+
+# ---------------------------------------------------
+# Streaming NDJSON accept (constant memory for large uploads)
+# ---------------------------------------------------
+ACCEPT_STREAM_MAX_LINE_BYTES = int(os.getenv("ACCEPT_STREAM_MAX_LINE_BYTES", str(1024 * 1024)))
+ACCEPT_DISPATCH_WORKERS = int(os.getenv("ACCEPT_DISPATCH_WORKERS", "2"))
+ACCEPT_STREAM_MAX_INFLIGHT = int(os.getenv("ACCEPT_STREAM_MAX_INFLIGHT", "2"))
+
+_accept_dispatch_pool = ThreadPoolExecutor(max_workers=max(1, ACCEPT_DISPATCH_WORKERS), thread_name_prefix="accept-dispatch")
+
+ACCEPT_STREAM_INFLATE_CHUNK = 64 * 1024
+
+def _inflate_bounded(decomp, data: bytes):
+    """Decompress data in pieces of at most ACCEPT_STREAM_INFLATE_CHUNK bytes (no gzip-bomb blowup)."""
+    while True:
+        out = decomp.decompress(data, ACCEPT_STREAM_INFLATE_CHUNK)
+        if out:
+            yield out
+        data = decomp.unconsumed_tail
+        if not data and len(out) < ACCEPT_STREAM_INFLATE_CHUNK:
+            return
+
+class _LineSplitter:
+    """Splits byte pieces into lines, holding at most one partial line (bounded by the max)."""
+
+    def __init__(self, max_line: int):
+        self.max_line = max_line
+        self.tail = b""
+
+    def feed(self, piece: bytes) -> List[bytes]:
+        parts = piece.split(b"\n")
+        if len(parts) == 1:
+            self.tail += piece
+            lines = []
+        else:
+            lines = [self.tail + parts[0]] + parts[1:-1]
+            self.tail = parts[-1]
+        if len(self.tail) > self.max_line or any(len(ln) > self.max_line for ln in lines):
+            raise ValueError(f"NDJSON line exceeds {self.max_line} bytes")
+        return lines
+
+async def _iter_ndjson_lines(request: Request, gzipped: bool = False):
+    """
+    Yield raw NDJSON lines from the request body as it arrives, gunzipping on the fly
+    when the client says so (Content-Encoding: gzip) or the body starts with the gzip magic.
+    Decompression is capped per step, so memory stays bounded by the line limit.
+    """
+    decomp = None
+    sniffed = False
+    splitter = _LineSplitter(ACCEPT_STREAM_MAX_LINE_BYTES)
+    async for part in request.stream():
+        if not part:
+            continue
+        if not sniffed:
+            sniffed = True
+            if gzipped or part[:2] == b"\x1f\x8b":
+                decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for piece in (_inflate_bounded(decomp, part) if decomp else (part,)):
+            for line in splitter.feed(piece):
+                yield line
+    if splitter.tail:
+        yield splitter.tail
+
+@app.post("/api/accepted-leads/stream")
+async def accept_leads_stream(request: Request):
+    """
+    NDJSON variant of /api/accepted-leads: one lead object per line, optionally gzip-compressed.
+      curl -X POST ".../api/accepted-leads/stream?campaignId=<id>" -H "X-User-Id: <uid>" \\
+           -H "Content-Type: application/x-ndjson" -H "Content-Encoding: gzip" --data-binary @leads.ndjson.gz
+    Query: campaignId (default for lines without one), emailTemplateId (optional).
+    Leads are upserted in chunks as they are parsed; reading pauses while a chunk is written
+    and while too many chunks are still dispatching, so memory stays bounded.
+    """
+    user_id = _get_request_user_id(request)
+    if not user_id:
+        return JSONResponse({"ok": False, "error": "Missing user_id"}, status_code=400)
+
+    qp = request.query_params
+    req_campaign_id = (qp.get("campaignId") or qp.get("campaign_id") or "").strip() or None
+    email_template_id = (qp.get("emailTemplateId") or qp.get("email_template_id") or "").strip() or None
+    gzipped = "gzip" in (request.headers.get("content-encoding") or "").lower()
+
+    counts = {"received": 0, "saved": 0, "skipped": 0, "failed": 0, "bad_lines": 0}
+    inflight: List = []
+    chunk: Dict[str, dict] = {}
+
+    async def flush():
+        if not chunk:
+            return
+        batch = list(chunk.values())
+        chunk.clear()
+        done = await run_blocking(_accept_lead_chunk, batch, user_id)
+        counts["saved"] += len(done)
+        counts["failed"] += len(batch) - len(done)
+        if done:
+            # backpressure: wait for the oldest dispatch before queueing another
+            while len(inflight) >= max(1, ACCEPT_STREAM_MAX_INFLIGHT):
+                await asyncio.wrap_future(inflight.pop(0))
+            inflight.append(_accept_dispatch_pool.submit(_dispatch_accepted_leads, done, email_template_id, user_id))
+
+    try:
+        async for raw in _iter_ndjson_lines(request, gzipped=gzipped):
+            raw = raw.strip()
+            if not raw:
                 continue
-        
-            print(f"[ACCEPT] Saved/updated lead: {lead.get('first_name','')} {lead.get('last_name','')} (id: {lead.get('id')})")
-            print(f"[ACCEPT] campaign_in_body={per_lead_campaign or req_campaign_id} final_campaign={lead.get('campaign_id')}")
-            print(f"[ACCEPT][TRACE] id={lead.get('id')} email={lead.get('email_address')} campaign={lead.get('campaign_id')}")
-        
-            # hydrate phone back from DB if we still don't have one (unchanged)
+            counts["received"] += 1
             try:
-                db_row_res = (supabase.table("leads")
-                              .select("phone,contact_phone_numbers,company")
-                              .eq("id", lead["id"]).single().execute())
-                db_lead = getattr(db_row_res, "data", None) or {}
-                if not lead.get("phone") and isinstance(db_lead.get("phone"), str) and db_lead["phone"].strip():
-                    lead["phone"] = db_lead["phone"].strip()
-                if not lead.get("contact_phone_numbers") and isinstance(db_lead.get("contact_phone_numbers"), list):
-                    lead["contact_phone_numbers"] = db_lead["contact_phone_numbers"]
-                if not lead.get("phone") and isinstance(db_lead.get("company"), dict):
-                    cph = db_lead["company"].get("phone")
-                    if isinstance(cph, str) and cph.strip():
-                        lead["phone"] = cph.strip()
-                if isinstance(lead.get("phone"), str) and lead["phone"].strip() and not lead.get("contact_phone_numbers"):
-                    lead["contact_phone_numbers"] = [{"rawNumber": lead["phone"].strip()}]
-                print("[ACCEPT][POST-UPSERT PHONE]", json.dumps({
-                    "phone": lead.get("phone"),
-                    "contact_phone_numbers": lead.get("contact_phone_numbers"),
-                }, indent=2))
-            except Exception as e:
-                print("[ACCEPT] DB hydrate failed (continuing):", e)
-        
-        except Exception as e:
-            msg = str(e)
-            # Duplicate -> reuse existing row and UPDATE campaign to the new one (never touch id)
-            if "23505" in msg or "duplicate key value violates unique constraint" in msg:
-                try:
-                    existing = (supabase.table("leads")
-                                .select("*")
-                                .eq("user_id", user_id)
-                                .eq("email_address", lead.get("email_address") or lead.get("email"))
-                                .single().execute()).data
-                    if existing:
-                        lead["id"] = existing["id"]
-                        patch = {}
-                        for k in ["first_name", "last_name", "company_name", "job_title", "location",
-                                  "city_name", "state_name", "country_name", "phone", "contact_phone_numbers"]:
-                            v = lead.get(k)
-                            if v and not existing.get(k):
-                                patch[k] = v
-                        if (existing.get("campaign_id") or "") != lead["campaign_id"]:
-                            patch["campaign_id"] = lead["campaign_id"]
-                        if patch:
-                            update_lead(lead["id"], patch)
-                        results.append({**existing, **patch})
-                        print(f"[ACCEPT] Reused existing lead (user/email unique). id={lead['id']} -> campaign={lead['campaign_id']}")
-                    else:
-                        print("[ACCEPT] Duplicate raised but fetch failed; skipping this lead.")
-                        continue
-                except Exception as e2:
-                    print(f"[ACCEPT] Failed to fetch existing lead after 23505: {e2}")
-                    continue
-            else:
-                print(f"[ACCEPT] Supabase upsert failed for lead {lead.get('id')}: {e}")
+                lead = json.loads(raw)
+            except Exception:
+                counts["bad_lines"] += 1
                 continue
+            ld = _normalize_accepted_lead(lead, req_campaign_id, user_id)
+            if ld is None:
+                counts["skipped"] += 1
+                continue
+            if ld["email_address"] in chunk:
+                counts["skipped"] += 1
+            chunk[ld["email_address"]] = ld
+            if len(chunk) >= ACCEPT_UPSERT_CHUNK:
+                await flush()
+        await flush()
+    except (ValueError, zlib.error) as e:
+        await flush()
+        print("[ACCEPT][STREAM] aborted:", e)
+        return JSONResponse({"ok": False, "error": f"Bad stream: {e}", **counts}, status_code=400)
+
+    print(f"[ACCEPT][STREAM] user={user_id} {counts}")
+    return {"status": "saved_and_scheduled", "num_leads": counts["saved"], **counts}
 
-        # === Delivery rules & actions ===
-        rules = get_campaign_rules(lead.get("campaign_id"))
+# ---------------------------------------------------
+# Google Sheet import (streamed CSV -> bulk accept)
+# ---------------------------------------------------
+# normalized header -> lead field; override per request with "columns": {"Header": "field"}
+SHEET_DEFAULT_COLUMNS = {
+    "first_name": "first_name", "firstname": "first_name", "first": "first_name",
+    "last_name": "last_name", "lastname": "last_name", "last": "last_name", "surname": "last_name",
+    "email": "email_address", "email_address": "email_address", "e_mail": "email_address", "work_email": "email_address",
+    "phone": "phone", "phone_number": "phone", "mobile": "phone", "mobile_number": "phone", "telephone": "phone",
+    "company": "company_name", "company_name": "company_name", "organization": "company_name", "organisation": "company_name",
+    "title": "job_title", "job_title": "job_title", "position": "job_title",
+    "city": "city_name", "city_name": "city_name",
+    "state": "state_name", "state_name": "state_name", "region": "state_name",
+    "country": "country_name", "country_name": "country_name",
+    "campaign_id": "campaign_id", "campaignid": "campaign_id",
+}
+
+# Lead fields a caller-supplied "columns" mapping may target; anything else (status,
+# next_call_at, user_id, call_attempts, ...) is owned by the pipeline
+SHEET_IMPORTABLE_FIELDS = frozenset(SHEET_DEFAULT_COLUMNS.values())
+
+def _norm_sheet_header(h: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", (h or "").strip().lower()).strip("_")
+
+def _sheet_column_plan(header: List[str], columns: Optional[dict]) -> List[Tuple[int, str]]:
+    """[(column_index, lead_field)] for the columns that map to a lead field; the rest are ignored."""
+    custom = {_norm_sheet_header(k): v for k, v in (columns or {}).items() if isinstance(v, str) and v in SHEET_IMPORTABLE_FIELDS}
+    plan = []
+    for i, h in enumerate(header):
+        key = _norm_sheet_header(h)
+        field = custom.get(key) or SHEET_DEFAULT_COLUMNS.get(key)
+        if field:
+            plan.append((i, field))
+    return plan
+
+def import_sheet_leads(
+    sheet_url: str,
+    user_id: str,
+    req_campaign_id: Optional[str],
+    email_template_id: Optional[str],
+    columns: Optional[dict] = None,
+    gid_candidates=(0, 1837663021),
+) -> dict:
+    """
+    Stream a sheet's CSV export and push rows through the bulk accept path ACCEPT_UPSERT_CHUNK
+    at a time; call/email dispatch runs on the accept dispatch pool with bounded in-flight chunks.
+    """
+    opened = _open_sheet_csv_stream(sheet_url, gid_candidates)
+    if not opened:
+        return {"ok": False, "error": "Sheet not accessible as CSV (share as 'Anyone with link' or publish it)"}
+    parts, gid = opened
+    try:
+        return _import_sheet_rows(parts, gid, user_id, req_campaign_id, email_template_id, columns)
+    finally:
+        parts.close()  # releases the HTTP response on every exit path
+
+def _import_sheet_rows(parts, gid, user_id: str, req_campaign_id: Optional[str],
+                       email_template_id: Optional[str], columns: Optional[dict]) -> dict:
+    started = time.monotonic()
+    counts = {"rows": 0, "saved": 0, "skipped": 0, "failed": 0}
+    inflight: List = []
+    chunk: Dict[str, dict] = {}
+
+    def flush():
+        if not chunk:
+            return
+        batch = list(chunk.values())
+        chunk.clear()
+        done = _accept_lead_chunk(batch, user_id)
+        counts["saved"] += len(done)
+        counts["failed"] += len(batch) - len(done)
+        if done:
+            while len(inflight) >= max(1, ACCEPT_STREAM_MAX_INFLIGHT):
+                inflight.pop(0).result()
+            inflight.append(_accept_dispatch_pool.submit(_dispatch_accepted_leads, done, email_template_id, user_id))
+
+    rows = _iter_csv_rows(parts)
+    header = next(rows, None)
+    plan = _sheet_column_plan(header or [], columns)
+    if not any(field == "email_address" for _, field in plan):
+        return {"ok": False, "gid": gid, "error": "No email column found in the sheet header", "header": header or []}
+
+    for row in rows:
+        if not any((c or "").strip() for c in row):
+            continue
+        counts["rows"] += 1
+        lead = {}
+        for i, field in plan:
+            if i < len(row) and row[i].strip():
+                lead[field] = row[i].strip()
+        ld = _normalize_accepted_lead(lead, req_campaign_id, user_id)
+        if ld is None:
+            counts["skipped"] += 1
+            continue
+        if ld["email_address"] in chunk:
+            counts["skipped"] += 1
+        chunk[ld["email_address"]] = ld
+        if len(chunk) >= ACCEPT_UPSERT_CHUNK:
+            flush()
+            _log_sheet_progress(counts, started)
+    flush()
+    for f in inflight:
+        f.result()
+
+    secs = time.monotonic() - started
+    out = {"ok": True, "gid": gid, **counts, "seconds": round(secs, 2),
+           "rows_per_second": round(counts["rows"] / secs, 2) if secs > 0 else None}
+    print(f"[SHEET][IMPORT] user={user_id} {out}")
+    return out
 
-        if rules.get("send_calls", True):
-            phone = get_valid_phone(lead)
-            if phone and in_call_window_now(phone, rules["call_window_start"], rules["call_window_end"]):
-                print(f"[ACCEPT] Calling now: {phone} lead_id={lead.get('id')}")
-                background_tasks.add_task(call_lead_if_possible, lead)
-            else:
-                nxt = next_window_start(phone, rules["call_window_start"], rules["call_window_end"]) if phone else None
-                if nxt:
-                    schedule_next_call(lead.get("id"), nxt)
-                    log_call_to_supabase(lead.get("id"), "scheduled", f"Out of window at accept. Next: {nxt.isoformat()} UTC")
-                    print(f"[ACCEPT] Out of window; scheduled for {nxt.isoformat()} lead_id={lead.get('id')}")
-                else:
-                    log_call_to_supabase(lead.get("id"), "no-tz", "No timezone at accept")
-                    print(f"[ACCEPT] Could not determine timezone for phone={phone} lead_id={lead.get('id')}")
-
-        # Initial email is handled by Lovable when INITIAL_EMAIL_SENDER=lovable
-        if rules.get("send_email", True):
-            initial_sender = os.getenv("INITIAL_EMAIL_SENDER", "render").strip().lower()
-            if initial_sender == "render":
-                print(f"[ACCEPT] Queueing INITIAL email for lead_id={lead.get('id')} (sender=render)")
-                initial_idem = f"{lead.get('id')}:step:initial"
-                tpl_id = email_template_id
-                background_tasks.add_task(send_email_if_possible, lead, tpl_id, user_id, initial_idem)
-            else:
-                print(f"[ACCEPT] Skipping INITIAL email (sender={initial_sender}); Lovable will send.")
+def _log_sheet_progress(counts: dict, started: float):
+    secs = time.monotonic() - started
+    rate = counts["rows"] / secs if secs > 0 else 0.0
+    print(f"[SHEET][IMPORT] rows={counts['rows']} saved={counts['saved']} skipped={counts['skipped']} ({rate:.1f} rows/s)")
+
+@app.post("/api/sheet-import")
+async def sheet_import(request: Request):
+    """
+    Import leads from a Google Sheet straight into the accept pipeline.
+    Body:
+      { "sheetUrl": "https://docs.google.com/spreadsheets/d/<id>/edit", "campaignId": "...",
+        "emailTemplateId": "optional", "gid": 0 (optional), "columns": {"Work Email": "email_address"} (optional) }
+    Returns counts plus rows_per_second.
+    """
+    try:
+        body = await request.json()
+    except Exception:
+        return JSONResponse({"ok": False, "error": "JSON body required"}, status_code=400)
+    user_id = _get_request_user_id(request) or body.get("user_id") or body.get("userId")
+    if not user_id:
+        return JSONResponse({"ok": False, "error": "Missing user_id"}, status_code=400)
+    sheet_url = (body.get("sheetUrl") or body.get("sheet_url") or "").strip()
+    if not _extract_sheet_id(sheet_url):
+        return JSONResponse({"ok": False, "error": "Missing or invalid 'sheetUrl'"}, status_code=400)
+    columns = body.get("columns")
+    if columns is not None and not isinstance(columns, dict):
+        return JSONResponse({"ok": False, "error": "'columns' must be an object of header -> lead field"}, status_code=400)
+    bad = sorted({str(v) for v in (columns or {}).values() if not isinstance(v, str) or v not in SHEET_IMPORTABLE_FIELDS})
+    if bad:
+        return JSONResponse({"ok": False, "error": f"Unsupported lead field(s) in 'columns': {', '.join(bad)}",
+                             "allowed": sorted(SHEET_IMPORTABLE_FIELDS)}, status_code=400)
+    gids = (body["gid"],) if body.get("gid") not in (None, "") else (0, 1837663021)
 
-    return {"status": "saved_and_scheduled", "num_leads": len(results), "received": len(leads)}
+    try:
+        out = await run_blocking(
+            import_sheet_leads,
+            sheet_url,
+            user_id,
+            (body.get("campaignId") or body.get("campaign_id") or "").strip() or None,
+            body.get("emailTemplateId") or body.get("email_template_id"),
+            columns,
+            gids,
+        )
+    except Exception as e:
+        print("[SHEET][IMPORT] failed:", e)
+        return JSONResponse({"ok": False, "error": f"Sheet import failed: {e}"}, status_code=502)
+    return out if out.get("ok") else JSONResponse(out, status_code=400)
 
 # ---------------------------------------------------
 # Test endpoints (handy for Outreach Centre buttons)
@@ -1898,6 +3802,9 @@ async def test_email(request: Request):
         "country_name": "",
     }
 
+    return await run_blocking(_send_test_email, caller_user_id, to, tpl, fake_lead)
+
+def _send_test_email(caller_user_id: Optional[str], to: str, tpl: Optional[str], fake_lead: dict):
     subj_tpl, body_tpl = fetch_email_template(tpl)
     subject = render_template(subj_tpl, fake_lead)
     body_txt = render_template(body_tpl, fake_lead)
@@ -1970,7 +3877,7 @@ async def test_call(request: Request):
         "job_title": "Test",
         "campaign_id": campaign_id,
     }
-    code, text = make_vapi_call(number, lead)
+    code, text = await run_blocking(make_vapi_call, number, lead)
     return {"ok": code in (200, 201, 202), "status": code, "response": text}
 
 from fastapi import Body
@@ -1980,15 +3887,19 @@ def vapi_campaign_instructions_post(payload: dict = Body(...)):
     # Accept both snake_case and camelCase just in case
     campaign_id = (payload.get("campaign_id") or payload.get("campaignId") or "").strip()
     lead_id = (payload.get("lead_id") or payload.get("leadId") or "").strip() or None
-    cfg = get_campaign_caller_config(campaign_id)
-    prompt = build_vapi_instructions_from_config(cfg) or ""
-    return {"instructions": prompt}
+    _, out = _campaign_instructions(campaign_id)
+    return out
+
+def _campaign_instructions(campaign_id: str):
+    def load():
+        cfg = get_campaign_caller_config(campaign_id)
+        return {"instructions": build_vapi_instructions_from_config(cfg) or ""}
+    return cached_read("campaign_instructions", campaign_id or "", load)
 
 @app.get("/vapi/campaign-instructions")
-def vapi_campaign_instructions_get(campaign_id: str, lead_id: Optional[str] = None):
-    cfg = get_campaign_caller_config(campaign_id)
-    prompt = build_vapi_instructions_from_config(cfg) or ""
-    return {"instructions": prompt}
+def vapi_campaign_instructions_get(request: Request, campaign_id: str, lead_id: Optional[str] = None):
+    etag, out = _campaign_instructions(campaign_id)
+    return conditional_response(request, etag, out)
 
 @app.get("/api/dev/gmail-scan")
 def dev_gmail_scan(request: Request, days: int = 7):
@@ -2067,8 +3978,9 @@ def _parse_since(since_str: Optional[str]) -> Optional[str]:
 
 @app.get("/api/lead-activity/{lead_id}")
 def get_lead_activity(lead_id: str, since: Optional[str] = None):
+    db = read_db(lead_id)
     try:
-        lead_res = supabase.table("leads").select("*").eq("id", lead_id).single().execute()
+        lead_res = db.table("leads").select("*").eq("id", lead_id).single().execute()
         lead = getattr(lead_res, "data", None)
     except Exception as e:
         lead = None
@@ -2077,7 +3989,7 @@ def get_lead_activity(lead_id: str, since: Optional[str] = None):
     since_iso = _parse_since(since)
 
     try:
-        q = supabase.table("call_logs").select("*").eq("lead_id", lead_id)
+        q = db.table("call_logs").select("*").eq("lead_id", lead_id)
         if since_iso:
             q = q.gte("created_at", since_iso)
         calls_res = q.order("created_at", desc=True).limit(100).execute()
@@ -2087,7 +3999,7 @@ def get_lead_activity(lead_id: str, since: Optional[str] = None):
         print("Call logs fetch failed:", e)
 
     try:
-        q = supabase.table("email_logs").select("*").eq("lead_id", lead_id)
+        q = db.table("email_logs").select("*").eq("lead_id", lead_id)
         if since_iso:
             q = q.gte("created_at", since_iso)
         emails_res = q.order("created_at", desc=True).limit(100).execute()
@@ -2098,14 +4010,393 @@ def get_lead_activity(lead_id: str, since: Optional[str] = None):
 
     return {"lead": lead, "calls": calls, "emails": emails}
 
-@app.get("/api/leads/{lead_id}")
-def get_lead(lead_id: str):
+# ---------------------------------------------------
+# Lead timeline (calls + emails merged, keyset-paginated)
+# ---------------------------------------------------
+TIMELINE_DEFAULT_LIMIT = 50
+TIMELINE_MAX_LIMIT = 200
+TIMELINE_CALL_COLUMNS = "id,created_at,call_status,provider,external_call_id,attempt_number,started_at,ended_at,duration_seconds,recording_url"
+TIMELINE_EMAIL_COLUMNS = "id,created_at,status,direction,provider,to_email,subject,error"
+# ordering is (created_at, kind, id) descending; "email" sorts above "call" on equal timestamps
+TIMELINE_KINDS = ("email", "call")
+
+def _encode_timeline_cursor(row: dict) -> str:
+    raw = json.dumps({"t": row["created_at"], "k": row["kind"], "id": row["id"]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_timeline_cursor(cursor: Optional[str]) -> Optional[dict]:
+    if not cursor:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode((cursor + "===").encode("ascii")).decode("utf-8"))
+        if data.get("k") not in TIMELINE_KINDS or not data.get("t") or data.get("id") is None:
+            return None
+        return data
+    except Exception:
+        return None
+
+def _timeline_ts(value: Optional[str]) -> datetime:
     try:
-        res = supabase.table("leads").select("*").eq("id", lead_id).single().execute()
+        return datetime.fromisoformat(_parse_since(value))
+    except Exception:
+        return datetime.min.replace(tzinfo=timezone.utc)
+
+def _fetch_timeline_rows(table: str, kind: str, columns: str, lead_id: str, cursor: Optional[dict],
+                         since_iso: Optional[str], limit: int) -> List[dict]:
+    q = read_db(lead_id).table(table).select(columns).eq("lead_id", lead_id)
+    if since_iso:
+        q = q.gte("created_at", since_iso)
+    if cursor:
+        t = cursor["t"]
+        if kind == cursor["k"]:
+            q = q.or_(f'created_at.lt."{t}",and(created_at.eq."{t}",id.lt."{cursor["id"]}")')
+        elif TIMELINE_KINDS.index(kind) > TIMELINE_KINDS.index(cursor["k"]):
+            # sorts after the cursor kind on ties, so rows at the cursor timestamp are still due
+            q = q.lte("created_at", t)
+        else:
+            q = q.lt("created_at", t)
+    rows = (q.order("created_at", desc=True).order("id", desc=True).limit(limit).execute()).data or []
+    for r in rows:
+        r["kind"] = kind
+    return rows
+
+@app.get("/api/leads/{lead_id}/timeline")
+def get_lead_timeline(
+    lead_id: str,
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(TIMELINE_DEFAULT_LIMIT, ge=1, le=TIMELINE_MAX_LIMIT),
+    since: Optional[str] = None,
+    include_bodies: bool = False,
+):
+    """
+    Calls and emails for one lead as a single newest-first stream.
+    Pass next_cursor back as ?cursor= for the next page. Email bodies/notes and call notes
+    are left out unless ?include_bodies=true. Sends an ETag; a matching If-None-Match gets 304.
+    """
+    cur = _decode_timeline_cursor(cursor)
+    if cursor and not cur:
+        return JSONResponse({"ok": False, "error": "Invalid cursor"}, status_code=400)
+    since_iso = _parse_since(since)
+    call_cols = TIMELINE_CALL_COLUMNS + (",notes" if include_bodies else "")
+    email_cols = TIMELINE_EMAIL_COLUMNS + (",body,notes" if include_bodies else "")
+
+    try:
+        # limit + 1 from each side tells us whether another page exists
+        calls = _fetch_timeline_rows("call_logs", "call", call_cols, lead_id, cur, since_iso, limit + 1)
+        emails = _fetch_timeline_rows("email_logs", "email", email_cols, lead_id, cur, since_iso, limit + 1)
+    except Exception as e:
+        print("[TIMELINE] fetch failed:", e)
+        return JSONResponse({"ok": False, "error": "Timeline fetch failed"}, status_code=502)
+
+    # Each list is already (created_at, id) desc; equal keys only occur within one list,
+    # so merge is stable with respect to the DB's id order.
+    merged = list(heapq.merge(
+        emails, calls,
+        key=lambda r: (_timeline_ts(r.get("created_at")), -TIMELINE_KINDS.index(r["kind"])),
+        reverse=True,
+    ))
+    page = merged[:limit]
+    has_more = len(merged) > limit
+    next_cursor = _encode_timeline_cursor(page[-1]) if has_more and page else None
+
+    etag = '"' + hashlib.sha1(repr((cursor, limit, since_iso, include_bodies,
+                                     [sorted(r.items()) for r in page])).encode("utf-8")).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    inm = request.headers.get("if-none-match") or ""
+    if etag in [t.strip() for t in inm.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    return JSONResponse({"ok": True, "items": page, "next_cursor": next_cursor, "has_more": has_more}, headers=headers)
+
+# ---------------------------------------------------
+# Live activity (activity_events relay -> per-process pub/sub -> Server-Sent Events)
+# ---------------------------------------------------
+SSE_SUBSCRIBER_BUFFER = int(os.getenv("SSE_SUBSCRIBER_BUFFER", "100"))
+SSE_HEARTBEAT_SECONDS = int(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# "table": publishers append to activity_events and every web process with subscribers tails
+# it, so events from worker.py and other uvicorn workers reach all streams.
+# "local": in-process only (single-process deployments without the table).
+ACTIVITY_FANOUT = _env("ACTIVITY_FANOUT", "table").lower()
+ACTIVITY_EVENTS_TABLE = os.getenv("ACTIVITY_EVENTS_TABLE", "activity_events")
+ACTIVITY_POLL_SECONDS = float(os.getenv("ACTIVITY_POLL_SECONDS", "1"))
+# Tailers read rows within seconds; the buffer only has to cover a tailer's brief outage
+ACTIVITY_RETENTION_SECONDS = int(os.getenv("ACTIVITY_RETENTION_SECONDS", "900"))
+ACTIVITY_LISTENERS_TABLE = os.getenv("ACTIVITY_LISTENERS_TABLE", "activity_listeners")
+ACTIVITY_LISTENER_TTL_SECONDS = int(os.getenv("ACTIVITY_LISTENER_TTL_SECONDS", "30"))
+# How long a publisher trusts its last "is anyone listening" answer
+ACTIVITY_LISTENER_CHECK_SECONDS = float(os.getenv("ACTIVITY_LISTENER_CHECK_SECONDS", "5"))
+ACTIVITY_TAIL_BATCH = 500
+# bigserial ids can commit out of order; re-read this many ids behind the cursor
+ACTIVITY_TAIL_OVERLAP = 200
+
+# topic ("campaign:<id>" / "lead:<id>") -> list of subscribers {"loop", "queue", "dropped"}
+_activity_subs: Dict[str, List[dict]] = {}
+_activity_lock = threading.Lock()
+_activity_stats = {"published": 0, "delivered": 0, "dropped": 0, "relayed": 0, "no_listeners": 0}
+_activity_tailer: Optional[threading.Thread] = None
+_activity_listening = {"checked_at": 0.0, "any": True}
+
+def _activity_subscribe(topic: str) -> dict:
+    global _activity_tailer
+    sub = {"loop": asyncio.get_running_loop(), "queue": asyncio.Queue(maxsize=max(1, SSE_SUBSCRIBER_BUFFER)), "dropped": 0}
+    with _activity_lock:
+        _activity_subs.setdefault(topic, []).append(sub)
+        if ACTIVITY_FANOUT == "table" and _activity_tailer is None:
+            _activity_tailer = threading.Thread(target=_tail_activity_events, name="activity-tailer", daemon=True)
+            _activity_tailer.start()
+    return sub
+
+def _activity_unsubscribe(topic: str, sub: dict):
+    with _activity_lock:
+        subs = _activity_subs.get(topic) or []
+        if sub in subs:
+            subs.remove(sub)
+        if not subs:
+            _activity_subs.pop(topic, None)
+
+def _activity_offer(sub: dict, msg: dict):
+    """Runs on the subscriber's loop. A full buffer drops its oldest message, never blocks the publisher."""
+    q = sub["queue"]
+    if q.full():
+        try:
+            q.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        sub["dropped"] += 1
+        _activity_stats["dropped"] += 1
+    q.put_nowait(msg)
+    _activity_stats["delivered"] += 1
+
+def publish_activity(event_type: str, lead_id: Optional[str], campaign_id: Optional[str] = None, **data):
+    """Fan an activity event out to campaign/lead subscribers in every process. Safe to call from any thread."""
+    at = datetime.utcnow().isoformat()
+    with _activity_lock:
+        _activity_stats["published"] += 1
+    if ACTIVITY_FANOUT == "table":
+        if not _activity_has_listeners():
+            with _activity_lock:
+                _activity_stats["no_listeners"] += 1
+            return
+        try:
+            supabase.table(ACTIVITY_EVENTS_TABLE).insert({
+                "event_type": event_type, "lead_id": lead_id, "campaign_id": campaign_id,
+                "payload": json.loads(json.dumps(data, default=str)),
+            }).execute()
+            return  # the tailers (including ours) deliver it
+        except Exception as e:
+            print(f"[ACTIVITY] relay insert failed for {event_type}; delivering locally only:", e)
+    _deliver_activity(event_type, lead_id, campaign_id, at, data)
+
+def _activity_has_listeners() -> bool:
+    """Whether any process has SSE subscribers; the fleet-wide answer is cached briefly."""
+    with _activity_lock:
+        if _activity_subs:
+            return True
+        if time.monotonic() - _activity_listening["checked_at"] < ACTIVITY_LISTENER_CHECK_SECONDS:
+            return _activity_listening["any"]
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=ACTIVITY_LISTENER_TTL_SECONDS)).isoformat()
+    try:
+        res = (supabase.table(ACTIVITY_LISTENERS_TABLE).select("instance_id")
+               .gte("heartbeat_at", cutoff).limit(1).execute())
+        listening = bool(getattr(res, "data", None))
+    except Exception as e:
+        print("[ACTIVITY] listener check failed; publishing anyway:", e)
+        listening = True
+    with _activity_lock:
+        _activity_listening.update(checked_at=time.monotonic(), any=listening)
+    return listening
+
+def _activity_listener_heartbeat(subscribers: int):
+    try:
+        if subscribers:
+            supabase.table(ACTIVITY_LISTENERS_TABLE).upsert({
+                "instance_id": SCHEDULER_INSTANCE_ID, "subscribers": subscribers,
+                "heartbeat_at": datetime.now(timezone.utc).isoformat(),
+            }, on_conflict="instance_id").execute()
+        else:
+            supabase.table(ACTIVITY_LISTENERS_TABLE).delete().eq("instance_id", SCHEDULER_INSTANCE_ID).execute()
+    except Exception as e:
+        print("[ACTIVITY] listener heartbeat failed:", e)
+
+def _deliver_activity(event_type: str, lead_id: Optional[str], campaign_id: Optional[str], at: str, data: dict):
+    """Hand one event to this process's subscribers; cheap when nobody listens."""
+    with _activity_lock:
+        if not _activity_subs:
+            return
+        want_campaign = any(t.startswith("campaign:") for t in _activity_subs)
+    if not campaign_id and lead_id and want_campaign:
+        try:
+            row = (supabase.table("leads").select("campaign_id").eq("id", lead_id).single().execute()).data or {}
+            campaign_id = row.get("campaign_id")
+        except Exception:
+            campaign_id = None
+
+    msg = {"type": event_type, "lead_id": lead_id, "campaign_id": campaign_id, "at": at, **data}
+    topics = [t for t in (f"campaign:{campaign_id}" if campaign_id else None,
+                          f"lead:{lead_id}" if lead_id else None) if t]
+    with _activity_lock:
+        targets = [s for t in topics for s in (_activity_subs.get(t) or [])]
+    for sub in targets:
+        try:
+            sub["loop"].call_soon_threadsafe(_activity_offer, sub, msg)
+        except RuntimeError:
+            pass  # loop already closed; the stream's finally will unsubscribe
+
+def _tail_activity_events():
+    """
+    Relay activity_events rows to this process's subscribers. Runs only while anyone here
+    is subscribed; starts at the current head, so a new stream sees only new events.
+    """
+    global _activity_tailer
+    last_id: Optional[int] = None
+    seen: set = set()
+    last_beat = 0.0
+    while True:
+        with _activity_lock:
+            subscribers = sum(len(v) for v in _activity_subs.values())
+        if not subscribers:
+            _activity_listener_heartbeat(0)
+            with _activity_lock:
+                if not _activity_subs:
+                    _activity_tailer = None
+                    return
+            last_beat = 0.0  # someone subscribed while we were leaving; announce again
+            continue
+        if time.monotonic() - last_beat >= ACTIVITY_LISTENER_TTL_SECONDS / 3:
+            # announce first, so publishers elsewhere start writing before we read the head
+            _activity_listener_heartbeat(subscribers)
+            last_beat = time.monotonic()
+        full = False
+        try:
+            if last_id is None:
+                res = supabase.table(ACTIVITY_EVENTS_TABLE).select("id").order("id", desc=True).limit(1).execute()
+                rows = getattr(res, "data", None) or []
+                last_id = int(rows[0]["id"]) if rows else 0
+            else:
+                floor = max(0, last_id - ACTIVITY_TAIL_OVERLAP)
+                res = (supabase.table(ACTIVITY_EVENTS_TABLE)
+                       .select("id,event_type,lead_id,campaign_id,payload,created_at")
+                       .gt("id", floor).order("id").limit(ACTIVITY_TAIL_BATCH).execute())
+                rows = getattr(res, "data", None) or []
+                full = len(rows) >= ACTIVITY_TAIL_BATCH
+                for r in rows:
+                    rid = int(r["id"])
+                    if rid in seen:
+                        continue
+                    seen.add(rid)
+                    last_id = max(last_id, rid)
+                    payload = r.get("payload") if isinstance(r.get("payload"), dict) else {}
+                    _deliver_activity(r["event_type"], r.get("lead_id"), r.get("campaign_id"),
+                                      r.get("created_at") or datetime.utcnow().isoformat(), payload)
+                    with _activity_lock:
+                        _activity_stats["relayed"] += 1
+                floor = max(0, last_id - ACTIVITY_TAIL_OVERLAP)
+                seen = {i for i in seen if i > floor}
+        except Exception as e:
+            print("[ACTIVITY] tail failed:", e)
+        if not full:
+            time.sleep(max(0.1, ACTIVITY_POLL_SECONDS))
+
+def prune_activity_events():
+    """activity_events is only a relay buffer; drop rows every tailer has long since read."""
+    now = datetime.now(timezone.utc)
+    cutoff = (now - timedelta(seconds=ACTIVITY_RETENTION_SECONDS)).isoformat()
+    supabase.table(ACTIVITY_EVENTS_TABLE).delete().lt("created_at", cutoff).execute()
+    # listeners that died without deleting their row
+    stale = (now - timedelta(seconds=ACTIVITY_LISTENER_TTL_SECONDS * 10)).isoformat()
+    supabase.table(ACTIVITY_LISTENERS_TABLE).delete().lt("heartbeat_at", stale).execute()
+
+def _activity_stream_response(request: Request, topic: str) -> StreamingResponse:
+    sub = _activity_subscribe(topic)
+
+    async def gen():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    msg = await asyncio.wait_for(sub["queue"].get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {msg['type']}\ndata: {json.dumps(msg, default=str)}\n\n"
+        finally:
+            _activity_unsubscribe(topic, sub)
+
+    return StreamingResponse(gen(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/campaigns/{campaign_id}/events")
+async def campaign_activity_events(campaign_id: str, request: Request, lead_id: Optional[str] = None):
+    """
+    SSE stream of live activity for a campaign (or one of its leads with ?lead_id=).
+    Events: call_status, call_settled, email_sent, email_failed, email_reply.
+    Includes activity from every process (see ACTIVITY_FANOUT).
+    """
+    topic = f"lead:{lead_id}" if lead_id else f"campaign:{campaign_id}"
+    return _activity_stream_response(request, topic)
+
+@app.get("/api/leads/{lead_id}/events")
+async def lead_activity_events(lead_id: str, request: Request):
+    """SSE stream of live activity for one lead."""
+    return _activity_stream_response(request, f"lead:{lead_id}")
+
+@app.get("/api/supabase/metrics")
+def supabase_pool_metrics():
+    out = {"ok": True, **supabase.pool_metrics(), "read_routing": read_routing_metrics()}
+    if supabase_read is not None:
+        out["replica_pool"] = supabase_read.pool_metrics()
+    return out
+
+@app.get("/api/http/metrics")
+def outbound_http_metrics():
+    return {"ok": True, "hosts": outbound_http.http_metrics()}
+
+@app.get("/api/scheduler/queues")
+def scheduler_queues():
+    """
+    Queue utilization for every live scheduler process (worker.py included), read from
+    scheduler_queue_metrics; this process's own numbers are live if it runs the scheduler.
+    """
+    running = bool(getattr(scheduler, "running", False))
+    out = {"ok": True, "instance_id": SCHEDULER_INSTANCE_ID, "running": running}
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=max(90, SCHEDULER_METRICS_REPORT_SECONDS * 3))
+    try:
+        res = (supabase.table(SCHEDULER_METRICS_TABLE).select("*")
+               .gte("reported_at", cutoff.isoformat()).order("instance_id").execute())
+        rows = getattr(res, "data", None) or []
+    except Exception as e:
+        print("[Scheduler] metrics read failed:", e)
+        rows = []
+        out["error"] = "metrics table unavailable"
+    instances = [r for r in rows if r.get("instance_id") != SCHEDULER_INSTANCE_ID]
+    if running:
+        instances.insert(0, scheduler_metrics_snapshot())
+    out["instances"] = instances
+    return out
+
+@app.get("/api/activity/metrics")
+def activity_metrics():
+    with _activity_lock:
+        subscribers = sum(len(v) for v in _activity_subs.values())
+        topics = len(_activity_subs)
+        tailing = _activity_tailer is not None
+    return {"ok": True, "fanout": ACTIVITY_FANOUT, "tailing": tailing,
+            "topics": topics, "subscribers": subscribers, **_activity_stats}
+
+@app.get("/api/leads/{lead_id}")
+def get_lead(lead_id: str, request: Request):
+    def load():
+        res = read_db(lead_id).table("leads").select("*").eq("id", lead_id).single().execute()
         return getattr(res, "data", None) or {}
+    try:
+        etag, lead = cached_read("lead", lead_id, load)
     except Exception as e:
         print("Lead fetch failed:", e)
         return JSONResponse({"ok": False, "error": "Lead not found"}, status_code=404)
+    return conditional_response(request, etag, lead)
 
 
 # ===================================================
@@ -2168,133 +4459,142 @@ def poll_gmail_replies_for_user(user_id: str, to_domain_override: Optional[str]
         return
 
     for m in msgs:
-        mid = m.get("id")
-        if not mid:
-            print("[Gmail Poller] skip message with no id")
-            continue
-
-        # Skip if we've already processed this Gmail message id
-        if _seen_gmail_message(mid):
-            print(f"[Gmail Poller] skip already-seen mid={mid}")
-            continue
+        _ingest_gmail_reply(svc, user_id, m.get("id"))
 
-        try:
-            full = _gmail_get_message(svc, mid)
-            headers = (full or {}).get("payload", {}).get("headers", []) or []
-            to_hdr   = _hdr(headers, "Delivered-To") or _hdr(headers, "To")
-            from_hdr = _hdr(headers, "From")
-            subject  = _hdr(headers, "Subject")
-            snippet  = (full or {}).get("snippet", "") or ""
-            print(f"[Gmail Poller] mid={mid} to='{to_hdr}' from='{from_hdr}' subj='{subject}'")
-        except Exception as e:
-            print("[Gmail Poller] get error:", e)
-            continue
-
-        # Parse lead_id from plus-addressing (scott+<LEAD_ID>@domain)
-                # Parse lead_id from plus-addressing (e.g. scott+<LEAD_ID>@domain)
-        lead_id = parse_lead_id_from_addresses(_extract_emails(to_hdr))
-
-        # Fallback: if no lead_id via plus-addressing, match by sender email
-        if not lead_id:
-            from_emails = _extract_emails(from_hdr)
-            if from_emails:
-                normalized_from = from_emails[0].lower().strip()
-                try:
-                    db_row_res = (
-                        supabase.table("leads")
-                        .select("id")
-                        .eq("user_id", user_id)
-                        .eq("email_address", normalized_from)
-                        .single()
-                        .execute()
-                    )
-                    db_lead = getattr(db_row_res, "data", None)
-                    if db_lead:
-                        lead_id = db_lead.get("id")
-                except Exception as e:
-                    print(f"[Gmail Poller] fallback search failed: {e}")
-
-        if not lead_id:
-            # No lead found even after fallback; skip this message
-            continue
-
-        print(f"[Gmail Poller] mid={mid} parsed lead_id={lead_id}")
+def _ingest_gmail_reply(svc, user_id: str, mid: Optional[str]) -> bool:
+    """
+    Process one inbound Gmail message id: log it as a reply and mark the lead replied.
+    Shared by the inbox poller and the push (watch) path. Returns True when a lead was matched.
+    """
+    if not mid:
+        print("[Gmail Poller] skip message with no id")
+        return False
 
-        # Try to insert the reply log
-        try:
-            # Extract sender email
-            sender_emails = _extract_emails(from_hdr) if from_hdr else []
-            sender_email = sender_emails[0] if sender_emails else (from_hdr or "")
+    # Skip if we've already processed this Gmail message id
+    if _seen_gmail_message(mid):
+        print(f"[Gmail Poller] skip already-seen mid={mid}")
+        return False
 
-            # Prepare a short snippet
-            snippet_text = (snippet or "").strip()
-            if len(snippet_text) > 200:
-                snippet_text = snippet_text[:197] + "..."
+    try:
+        full = _gmail_get_message(svc, mid)
+        headers = (full or {}).get("payload", {}).get("headers", []) or []
+        to_hdr   = _hdr(headers, "Delivered-To") or _hdr(headers, "To")
+        from_hdr = _hdr(headers, "From")
+        subject  = _hdr(headers, "Subject")
+        snippet  = (full or {}).get("snippet", "") or ""
+        print(f"[Gmail Poller] mid={mid} to='{to_hdr}' from='{from_hdr}' subj='{subject}'")
+    except Exception as e:
+        print("[Gmail Poller] get error:", e)
+        return False
 
-            # Format notes exactly how the frontend expects:
-            # from=sender@example.com snippet=Short reply text
-            notes_value = f"from={sender_email} snippet={snippet_text}"
+    # Parse lead_id from plus-addressing (e.g. scott+<LEAD_ID>@domain)
+    lead_id = parse_lead_id_from_addresses(_extract_emails(to_hdr))
 
-            # Fetch user_id of lead (or fallback to current user_id)
+    # Fallback: if no lead_id via plus-addressing, match by sender email
+    if not lead_id:
+        from_emails = _extract_emails(from_hdr)
+        if from_emails:
+            normalized_from = from_emails[0].lower().strip()
             try:
-                lead_user_res = (
+                db_row_res = (
                     supabase.table("leads")
-                    .select("user_id")
-                    .eq("id", lead_id)
+                    .select("id")
+                    .eq("user_id", user_id)
+                    .eq("email_address", normalized_from)
                     .single()
                     .execute()
                 )
-                lead_user_id = (lead_user_res.data or {}).get("user_id")
-            except Exception:
-                lead_user_id = None
+                db_lead = getattr(db_row_res, "data", None)
+                if db_lead:
+                    lead_id = db_lead.get("id")
+            except Exception as e:
+                print(f"[Gmail Poller] fallback search failed: {e}")
 
-            if not lead_user_id:
-                lead_user_id = user_id
+    if not lead_id:
+        # No lead found even after fallback; skip this message
+        return False
 
-            supabase.table("email_logs").insert({
-                "user_id": lead_user_id,
-                "lead_id": lead_id,
-                "status": "reply",          # what the frontend filters on
-                "direction": "inbound",      # 🔥 IMPORTANT: satisfies email_logs_status_check
-                "provider": "gmail",   # consistent with Lovable's inbound provider
-                "subject": subject or "",
-                "notes": notes_value,        # from=... snippet=...
-                "body": snippet_text,
-                "to_email": to_hdr,
-                "idem_key": f"gmail:{mid}",  # dedupe key
-            }).execute()
+    print(f"[Gmail Poller] mid={mid} parsed lead_id={lead_id}")
 
-            print(f"[Gmail Poller] inserted reply mid={mid} lead_id={lead_id}")
-        except Exception as e:
-            print("[Gmail Poller] email_logs insert failed:", e)
+    lead_campaign_id = None
+    # Try to insert the reply log
+    try:
+        # Extract sender email
+        sender_emails = _extract_emails(from_hdr) if from_hdr else []
+        sender_email = sender_emails[0] if sender_emails else (from_hdr or "")
+
+        # Prepare a short snippet
+        snippet_text = (snippet or "").strip()
+        if len(snippet_text) > 200:
+            snippet_text = snippet_text[:197] + "..."
 
-        # Update lead status → replied + snapshot and stop follow-ups
+        # Format notes exactly how the frontend expects:
+        # from=sender@example.com snippet=Short reply text
+        notes_value = f"from={sender_email} snippet={snippet_text}"
+
+        # Fetch user_id of lead (or fallback to current user_id)
         try:
-            now_iso = datetime.utcnow().isoformat()
-
-            update_lead(lead_id, {
-                # Match Lovable's process-email-replies exactly
-                "status": "replied",
-                "last_reply_from": from_hdr,                # or parsed sender if you prefer
-                "last_reply_subject": subject or "No Subject",
-                "last_reply_snippet": (snippet or "")[:500],
-                "last_reply_at": now_iso,
-                "last_email_reply_at": now_iso,
-                "last_email_status": "replied",
-                # IMPORTANT: do NOT touch any call-related fields here
-                # (no last_call_status, next_call_at, call_attempts, etc.)
-            })
+            lead_user_res = (
+                supabase.table("leads")
+                .select("user_id,campaign_id")
+                .eq("id", lead_id)
+                .single()
+                .execute()
+            )
+            lead_user_id = (lead_user_res.data or {}).get("user_id")
+            lead_campaign_id = (lead_user_res.data or {}).get("campaign_id")
+        except Exception:
+            lead_user_id = None
 
-            stop_sequence_for_lead(lead_id, reason="reply")
-            print(f"[Gmail Poller] marked replied & stopped sequence lead_id={lead_id}")
-        except Exception as e:
-            print("[Gmail Poller] lead update/stop failed:", e)
+        if not lead_user_id:
+            lead_user_id = user_id
+
+        supabase.table("email_logs").insert({
+            "user_id": lead_user_id,
+            "lead_id": lead_id,
+            "status": "reply",          # what the frontend filters on
+            "direction": "inbound",      # 🔥 IMPORTANT: satisfies email_logs_status_check
+            "provider": "gmail",   # consistent with Lovable's inbound provider
+            "subject": subject or "",
+            "notes": notes_value,        # from=... snippet=...
+            "body": snippet_text,
+            "to_email": to_hdr,
+            "idem_key": f"gmail:{mid}",  # dedupe key
+        }).execute()
+
+        print(f"[Gmail Poller] inserted reply mid={mid} lead_id={lead_id}")
+    except Exception as e:
+        print("[Gmail Poller] email_logs insert failed:", e)
+
+    # Update lead status → replied + snapshot and stop follow-ups
+    try:
+        now_iso = datetime.utcnow().isoformat()
+
+        update_lead(lead_id, {
+            # Match Lovable's process-email-replies exactly
+            "status": "replied",
+            "last_reply_from": from_hdr,                # or parsed sender if you prefer
+            "last_reply_subject": subject or "No Subject",
+            "last_reply_snippet": (snippet or "")[:500],
+            "last_reply_at": now_iso,
+            "last_email_reply_at": now_iso,
+            "last_email_status": "replied",
+            # IMPORTANT: do NOT touch any call-related fields here
+            # (no last_call_status, next_call_at, call_attempts, etc.)
+        })
 
-def poll_all_gmail_replies():
+        stop_sequence_for_lead(lead_id, reason="reply")
+        print(f"[Gmail Poller] marked replied & stopped sequence lead_id={lead_id}")
+        publish_activity("email_reply", lead_id, lead_campaign_id, subject=subject or "", from_email=from_hdr)
+    except Exception as e:
+        print("[Gmail Poller] lead update/stop failed:", e)
+    return True
+
+def poll_all_gmail_replies(shard: Optional[Tuple[int, int]] = None):
     """
-    Iterates all connected Google users and polls their inboxes for replies.
+    Iterates all connected Google users (in this instance's shard) and polls their inboxes for replies.
     """
-    user_ids = _list_google_connected_user_ids()
+    user_ids = [u for u in _list_google_connected_user_ids() if in_shard(u, shard)]
     if not user_ids:
         print("[Gmail Poller] No connected users to poll")
         return
@@ -2304,6 +4604,193 @@ def poll_all_gmail_replies():
         except Exception as e:
             print(f"[Gmail Poller] error polling user {uid}:", e)
 
+# ===================================================
+# Gmail push (watch) ingestion — incremental fetch per notified user
+# ===================================================
+def _load_gmail_watch(user_id: str) -> Optional[dict]:
+    try:
+        res = supabase.table(GMAIL_WATCH_TABLE).select("*").eq("user_id", user_id).limit(1).execute()
+        rows = getattr(res, "data", []) or []
+        return rows[0] if rows else None
+    except Exception as e:
+        print("[Gmail Push] load watch state failed:", e)
+        return None
+
+def _find_gmail_watch_user(email_address: str) -> Optional[str]:
+    if not email_address:
+        return None
+    try:
+        res = (supabase.table(GMAIL_WATCH_TABLE)
+               .select("user_id")
+               .eq("email_address", email_address.lower().strip())
+               .limit(1).execute())
+        rows = getattr(res, "data", []) or []
+        return rows[0].get("user_id") if rows else None
+    except Exception as e:
+        print("[Gmail Push] watch lookup failed:", e)
+        return None
+
+def _save_gmail_watch(user_id: str, patch: dict):
+    try:
+        supabase.table(GMAIL_WATCH_TABLE).upsert({
+            "user_id": user_id,
+            **patch,
+            "updated_at": datetime.utcnow().isoformat(),
+        }, on_conflict="user_id").execute()
+    except Exception as e:
+        print("[Gmail Push] save watch state failed:", e)
+
+def gmail_start_watch(user_id: str) -> Optional[dict]:
+    """
+    (Re)register users.watch on INBOX for this user. Gmail expires a watch after 7 days,
+    so this is also what the daily renewal job calls.
+    """
+    if not GMAIL_PUSH_TOPIC:
+        print("[Gmail Push] GMAIL_PUSH_TOPIC not set; cannot start watch")
+        return None
+    if not GMAIL_PUSH_VERIFICATION_TOKEN:
+        print("[Gmail Push] GMAIL_PUSH_VERIFICATION_TOKEN not set; refusing to start watch")
+        return None
+    creds = _get_authed_creds(user_id)
+    svc = _gmail_users_service(creds)
+    profile = svc.users().getProfile(userId="me").execute() or {}
+    resp = svc.users().watch(userId="me", body={
+        "topicName": GMAIL_PUSH_TOPIC,
+        "labelIds": ["INBOX"],
+        "labelFilterBehavior": "include",
+    }).execute() or {}
+
+    patch = {"email_address": (profile.get("emailAddress") or "").lower().strip() or None}
+    # Keep an existing cursor so a renewal doesn't skip messages that arrived in between
+    state = _load_gmail_watch(user_id) or {}
+    if not state.get("history_id") and resp.get("historyId"):
+        patch["history_id"] = str(resp["historyId"])
+    if resp.get("expiration"):
+        patch["expiration"] = datetime.fromtimestamp(int(resp["expiration"]) / 1000, tz=timezone.utc).isoformat()
+    _save_gmail_watch(user_id, patch)
+    print(f"[Gmail Push] watch started user={user_id} email={patch['email_address']} historyId={resp.get('historyId')}")
+    return resp
+
+def renew_all_gmail_watches():
+    for uid in _list_google_connected_user_ids():
+        try:
+            gmail_start_watch(uid)
+        except Exception as e:
+            print(f"[Gmail Push] watch renewal failed user={uid}:", e)
+
+def sync_gmail_history_for_user(user_id: str, notified_history_id: Optional[str] = None):
+    """
+    Incremental fetch driven by a push notification: read history.list since the stored
+    cursor and ingest only the INBOX messages added since then.
+    Falls back to a full poll of this one inbox when there is no usable cursor.
+    """
+    try:
+        creds = _get_authed_creds(user_id)
+        svc = _gmail_users_service(creds)
+    except Exception as e:
+        print("[Gmail Push] Skipping; cannot auth for user:", e)
+        return
+
+    state = _load_gmail_watch(user_id) or {}
+    start_id = state.get("history_id")
+    if not start_id:
+        print(f"[Gmail Push] no history cursor for user={user_id}; polling inbox once")
+        poll_gmail_replies_for_user(user_id)
+        if notified_history_id:
+            _save_gmail_watch(user_id, {"history_id": str(notified_history_id)})
+        return
+
+    message_ids: List[str] = []
+    latest_id = str(start_id)
+    page_token = None
+    try:
+        while True:
+            kwargs = {
+                "userId": "me",
+                "startHistoryId": str(start_id),
+                "historyTypes": ["messageAdded"],
+                "labelId": "INBOX",
+            }
+            if page_token:
+                kwargs["pageToken"] = page_token
+            resp = svc.users().history().list(**kwargs).execute() or {}
+            for h in resp.get("history", []) or []:
+                for added in h.get("messagesAdded", []) or []:
+                    msg = added.get("message") or {}
+                    if "SENT" in (msg.get("labelIds") or []):
+                        continue
+                    if msg.get("id"):
+                        message_ids.append(msg["id"])
+            latest_id = str(resp.get("historyId") or latest_id)
+            page_token = resp.get("nextPageToken")
+            if not page_token:
+                break
+    except Exception as e:
+        # 404 = cursor older than Gmail keeps history for; re-sync this inbox by polling
+        if getattr(getattr(e, "resp", None), "status", None) == 404:
+            print(f"[Gmail Push] history cursor expired user={user_id}; polling inbox once")
+            poll_gmail_replies_for_user(user_id)
+            _save_gmail_watch(user_id, {"history_id": str(notified_history_id or latest_id)})
+        else:
+            print("[Gmail Push] history list error:", e)
+        return
+
+    matched = 0
+    for mid in dict.fromkeys(message_ids):
+        if _ingest_gmail_reply(svc, user_id, mid):
+            matched += 1
+
+    try:
+        if notified_history_id and int(notified_history_id) > int(latest_id):
+            latest_id = str(notified_history_id)
+    except Exception:
+        pass
+    _save_gmail_watch(user_id, {"history_id": latest_id})
+    print(f"[Gmail Push] user={user_id} new={len(message_ids)} matched={matched} cursor={latest_id}")
+
+@app.post("/webhooks/gmail-push")
+async def gmail_push(request: Request, background_tasks: BackgroundTasks):
+    """
+    Pub/Sub push endpoint for Gmail watch notifications.
+    Body: {"message": {"data": base64({"emailAddress": "...", "historyId": 123}), "messageId": "..."}, "subscription": "..."}
+    Always acks quickly (2xx) — the incremental fetch runs in the background.
+    """
+    token = request.query_params.get("token") or ""
+    if not GMAIL_PUSH_VERIFICATION_TOKEN or not hmac.compare_digest(token, GMAIL_PUSH_VERIFICATION_TOKEN):
+        return JSONResponse({"ok": False, "error": "invalid token"}, status_code=403)
+
+    try:
+        envelope = await request.json()
+        data_b64 = ((envelope or {}).get("message") or {}).get("data") or ""
+        data = json.loads(base64.b64decode(data_b64).decode("utf-8")) if data_b64 else {}
+    except Exception:
+        # Malformed deliveries are acked; a Pub/Sub retry would carry the same payload
+        return JSONResponse({"ok": True, "note": "unparseable push payload"}, status_code=200)
+
+    email_address = (data.get("emailAddress") or "").lower().strip()
+    history_id = data.get("historyId")
+    user_id = await run_blocking(_find_gmail_watch_user, email_address)
+    if not user_id:
+        print(f"[Gmail Push] no watch registered for {email_address}")
+        return JSONResponse({"ok": True, "note": "unknown mailbox"}, status_code=200)
+
+    background_tasks.add_task(sync_gmail_history_for_user, user_id, str(history_id) if history_id else None)
+    return {"ok": True, "user_id": user_id}
+
+@app.post("/api/dev/gmail-watch")
+def dev_gmail_watch(request: Request):
+    """
+    (Re)start the Gmail push watch for this user (X-User-Id header or ?user_id=).
+    """
+    uid = _get_request_user_id(request)
+    if not uid:
+        return JSONResponse({"ok": False, "error": "Missing user_id"}, status_code=400)
+    try:
+        resp = gmail_start_watch(uid)
+    except Exception as e:
+        return JSONResponse({"ok": False, "error": f"watch failed: {e}"}, status_code=500)
+    return {"ok": bool(resp), "watch": resp}
+
 @app.post("/webhooks/inbound-email")
 async def inbound_email(request: Request):
     try:
@@ -2327,7 +4814,10 @@ async def inbound_email(request: Request):
         return JSONResponse({"ok": True, "note": "no lead_id tag found"}, status_code=200)
 
     snippet = (text or html or "")[:500]
+    await run_blocking(_record_inbound_reply, lead_id, tos, frm, subject, snippet)
+    return {"ok": True, "lead_id": lead_id}
 
+def _record_inbound_reply(lead_id: str, tos: List[str], frm: str, subject: str, snippet: str):
     # 1) Log the reply in email_logs (as you already do)
     try:
         supabase.table("email_logs").insert({
@@ -2357,8 +4847,6 @@ async def inbound_email(request: Request):
     except Exception as e:
         print("Lead status/snapshot update (reply) failed:", e)
 
-    return {"ok": True, "lead_id": lead_id}
-
 # ---------- DEV: inspect last inbox messages (headers) ----------
 @app.get("/api/dev/gmail-last")
 def gmail_last(request: Request, max_results: int = 10, q: str = "newer_than:3d"):
@@ -2491,16 +4979,17 @@ def _maybe_schedule_followup_from_event(user_id: str, evt: dict, lead: Optional[
 # ===================================================
 # Outbox worker: the ONLY place emails are actually sent
 # ===================================================
-def _process_email_outbox_tick(batch_size: int = 25):
+def _process_email_outbox_tick(batch_size: int = 25, shard: Optional[Tuple[int, int]] = None):
     now_iso = datetime.utcnow().isoformat()
     my_lock = str(uuid4())
 
-    # 1) Load candidates due now
+    # 1) Load candidates due now (in our shard)
     try:
-        cand = (supabase.table("email_outbox")
-                .select("*")
-                .lte("send_after", now_iso)
-                .eq("status", "queued")
+        q = (supabase.table("email_outbox")
+             .select("*")
+             .lte("send_after", now_iso)
+             .eq("status", "queued"))
+        cand = (_shard_filter(q, shard)
                 .order("send_after", desc=False)
                 .limit(batch_size)
                 .execute()).data or []
@@ -2518,12 +5007,20 @@ def _process_email_outbox_tick(batch_size: int = 25):
 
         # 2) Try to claim the row atomically
         try:
-            upd = (supabase.table("email_outbox")
-                   .update({"status": "sending", "lock_token": my_lock, "attempts": (int(row.get("attempts") or 0) + 1)})
-                   .eq("id", rid)
-                   .eq("status", "queued")
-                   .execute())
-            owned = (getattr(upd, "data", None) or [])
+            owned, claimed_direct = None, False
+            if _pg:
+                try:
+                    owned = _pg.claim_outbox_row(rid, my_lock)
+                    claimed_direct = True
+                except Exception as e:
+                    print(f"[PG] outbox claim failed id={rid}; using PostgREST:", e)
+            if not claimed_direct:
+                upd = (supabase.table("email_outbox")
+                       .update({"status": "sending", "lock_token": my_lock, "attempts": (int(row.get("attempts") or 0) + 1)})
+                       .eq("id", rid)
+                       .eq("status", "queued")
+                       .execute())
+                owned = (getattr(upd, "data", None) or [])
             if not owned:
                 # Someone else claimed it
                 continue
@@ -2587,34 +5084,325 @@ def _process_email_outbox_tick(batch_size: int = 25):
             except Exception:
                 pass
 
-            # Only stamp emailed_at for the FIRST email (step 0/1). Follow-ups don’t re-stamp.
-            try:
-                if int(row.get("step_number") or 0) in (0, 1):
-                    update_lead(lead.get("id"), {"emailed_at": datetime.utcnow().isoformat(), "last_email_status": "sent"})
-                else:
-                    update_lead(lead.get("id"), {"last_email_status": "sent"})
-            except Exception:
-                pass
+            # Only stamp emailed_at for the FIRST email (step 0/1). Follow-ups don’t re-stamp.
+            try:
+                if int(row.get("step_number") or 0) in (0, 1):
+                    update_lead(lead.get("id"), {"emailed_at": datetime.utcnow().isoformat(), "last_email_status": "sent"})
+                else:
+                    update_lead(lead.get("id"), {"last_email_status": "sent"})
+            except Exception:
+                pass
+
+            print(f"[OUTBOX] sent idem_key={row.get('idem_key')} to={row.get('to_email')}")
+            publish_activity("email_sent", lead.get("id"), lead.get("campaign_id"),
+                             step_number=row.get("step_number"), subject=row.get("subject") or "")
+        except Exception as e:
+            # Failure → backoff and requeue
+            print(f"[OUTBOX] send failed idem_key={row.get('idem_key')} err={e}")
+            publish_activity("email_failed", lead.get("id"), lead.get("campaign_id"),
+                             step_number=row.get("step_number"), error=str(e)[:200])
+            try:
+                supabase.table("email_outbox").update({
+                    "status": "queued",
+                    "send_after": (datetime.utcnow() + timedelta(minutes=10)).isoformat(),
+                    "last_error": str(e)[:500],
+                }).eq("id", rid).eq("lock_token", my_lock).execute()
+            except Exception:
+                pass
+
+# ===================================================
+# Scheduler leader election (one lease row per job)
+# ===================================================
+# Every process schedules every job; each run first takes/renews the job's lease and
+# skips unless it holds it. Safe with several uvicorn workers and several machines.
+LEADER_ELECTION_ENABLED = _env("LEADER_ELECTION_ENABLED", "true").lower() == "true"
+SCHEDULER_LEASES_TABLE = os.getenv("SCHEDULER_LEASES_TABLE", "scheduler_leases")
+SCHEDULER_INSTANCE_ID = f"{os.getenv('FLY_MACHINE_ID') or os.getenv('HOSTNAME') or 'local'}:{os.getpid()}:{uuid4().hex[:6]}"
+
+_held_leases: set = set()
+_held_leases_lock = threading.Lock()
+
+def _try_acquire_lease_fallback(job_id: str, ttl_seconds: int) -> bool:
+    """Client-side equivalent of try_acquire_scheduler_lease (conditional update, then insert)."""
+    now = datetime.now(timezone.utc)
+    patch = {"holder": SCHEDULER_INSTANCE_ID,
+             "expires_at": (now + timedelta(seconds=ttl_seconds)).isoformat(),
+             "renewed_at": now.isoformat()}
+    upd = (supabase.table(SCHEDULER_LEASES_TABLE).update(patch)
+           .eq("job_id", job_id)
+           .or_(f'holder.eq."{SCHEDULER_INSTANCE_ID}",expires_at.lt."{now.isoformat()}"')
+           .execute())
+    if getattr(upd, "data", None):
+        return True
+    try:
+        supabase.table(SCHEDULER_LEASES_TABLE).insert({"job_id": job_id, **patch}).execute()
+        return True
+    except Exception:
+        return False  # row exists and someone else holds it
+
+def try_acquire_scheduler_lease(job_id: str, ttl_seconds: int) -> bool:
+    if not LEADER_ELECTION_ENABLED:
+        return True
+    try:
+        res = supabase.rpc("try_acquire_scheduler_lease", {
+            "p_job_id": job_id, "p_holder": SCHEDULER_INSTANCE_ID, "p_ttl_seconds": int(ttl_seconds),
+        }).execute()
+        held = bool(getattr(res, "data", None))
+    except Exception as e:
+        print(f"[LEADER] lease RPC failed for {job_id}; using fallback:", e)
+        try:
+            held = _try_acquire_lease_fallback(job_id, ttl_seconds)
+        except Exception as e2:
+            print(f"[LEADER] lease fallback failed for {job_id}; skipping run:", e2)
+            held = False
+    with _held_leases_lock:
+        was_held = job_id in _held_leases
+        if held:
+            _held_leases.add(job_id)
+        else:
+            _held_leases.discard(job_id)
+    if held != was_held:
+        print(f"[LEADER] {'acquired' if held else 'lost'} {job_id} as {SCHEDULER_INSTANCE_ID}")
+    return held
+
+def release_scheduler_leases():
+    with _held_leases_lock:
+        held = list(_held_leases)
+        _held_leases.clear()
+    for job_id in held:
+        try:
+            supabase.rpc("release_scheduler_lease", {"p_job_id": job_id, "p_holder": SCHEDULER_INSTANCE_ID}).execute()
+        except Exception:
+            try:
+                (supabase.table(SCHEDULER_LEASES_TABLE).delete()
+                 .eq("job_id", job_id).eq("holder", SCHEDULER_INSTANCE_ID).execute())
+            except Exception as e:
+                print(f"[LEADER] release failed for {job_id}:", e)
+
+def _run_while_leased(job_id: str, ttl_seconds: int, fn, *args, **kwargs) -> bool:
+    """
+    Run fn only while holding the job's lease; a heartbeat renews it every ttl/3 so a run
+    that outlasts the TTL doesn't hand the job to another process mid-run.
+    Returns False when the lease wasn't ours (fn not run).
+    """
+    if not try_acquire_scheduler_lease(job_id, ttl_seconds):
+        return False
+    if not LEADER_ELECTION_ENABLED:
+        fn(*args, **kwargs)
+        return True
+    done = threading.Event()
+
+    def heartbeat():
+        while not done.wait(max(5, ttl_seconds / 3)):
+            if not try_acquire_scheduler_lease(job_id, ttl_seconds):
+                print(f"[LEADER] lease for {job_id} lost while running; another process may start it")
+                return
+
+    threading.Thread(target=heartbeat, name=f"lease-{job_id}", daemon=True).start()
+    try:
+        fn(*args, **kwargs)
+    finally:
+        done.set()
+    return True
+
+def _leader_only(job_id: str, fn, ttl_seconds: int):
+    def run():
+        return _run_while_leased(job_id, ttl_seconds, fn)
+    run.__name__ = getattr(fn, "__name__", job_id)
+    return run
+
+def _add_queue_job(run, job_id: str, interval_seconds: int, queue_name: str, **kwargs):
+    _job_queue[job_id] = queue_name
+    scheduler.add_job(
+        _queued(queue_name, run),
+        executor=queue_name,
+        trigger="interval", seconds=interval_seconds,
+        id=job_id,
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+        **kwargs,
+    )
+
+def _add_leader_job(fn, job_id: str, interval_seconds: int, queue_name: str, **kwargs):
+    """Interval job that only the lease holder runs; the lease outlives a few intervals so the leader keeps it."""
+    ttl = max(30, interval_seconds * 3)
+    _add_queue_job(_leader_only(job_id, fn, ttl), job_id, interval_seconds, queue_name, **kwargs)
+
+# ===================================================
+# Hash-sharded pollers (membership table + heartbeats)
+# ===================================================
+# Every process running a sharded job heartbeats into scheduler_members on each tick. The
+# live members, sorted by instance id, split SHARD_SPACE into contiguous [lo, hi) ranges, so
+# a join or leave rebalances on the next tick. If membership can't be read the job falls
+# back to its leader lease and scans everything.
+SHARD_SPACE = 1024  # matches "& 1023" in the shard_key columns
+POLLER_SHARDING_ENABLED = _env("POLLER_SHARDING_ENABLED", "true").lower() == "true"
+# Membership liveness is independent of job intervals: members heartbeat every
+# SHARD_HEARTBEAT_SECONDS, so a crashed member's range is reassigned within the TTL.
+SHARD_MEMBER_TTL_SECONDS = int(os.getenv("SHARD_MEMBER_TTL_SECONDS", "45"))
+SHARD_HEARTBEAT_SECONDS = max(1, min(int(os.getenv("SHARD_HEARTBEAT_SECONDS", "15")), SHARD_MEMBER_TTL_SECONDS // 3))
+SCHEDULER_MEMBERS_TABLE = os.getenv("SCHEDULER_MEMBERS_TABLE", "scheduler_members")
+
+_shard_assignments: Dict[str, dict] = {}
+_shard_lock = threading.Lock()
+
+def _shard_members_fallback(job_id: str, ttl_seconds: int) -> List[str]:
+    """Client-side equivalent of shard_heartbeat: upsert our heartbeat, list live members."""
+    now = datetime.now(timezone.utc)
+    supabase.table(SCHEDULER_MEMBERS_TABLE).upsert(
+        {"job_id": job_id, "instance_id": SCHEDULER_INSTANCE_ID, "heartbeat_at": now.isoformat()},
+        on_conflict="job_id,instance_id",
+    ).execute()
+    res = (supabase.table(SCHEDULER_MEMBERS_TABLE).select("instance_id")
+           .eq("job_id", job_id)
+           .gte("heartbeat_at", (now - timedelta(seconds=ttl_seconds)).isoformat())
+           .order("instance_id")
+           .execute())
+    return [r["instance_id"] for r in (getattr(res, "data", None) or [])]
+
+def shard_for_job(job_id: str, ttl_seconds: int = SHARD_MEMBER_TTL_SECONDS) -> Optional[Tuple[int, int]]:
+    """Heartbeat and return this instance's shard range for job_id, or None to fall back to the lease."""
+    if not POLLER_SHARDING_ENABLED:
+        return None
+    try:
+        try:
+            res = supabase.rpc("shard_heartbeat", {
+                "p_job_id": job_id, "p_instance_id": SCHEDULER_INSTANCE_ID, "p_ttl_seconds": int(ttl_seconds),
+            }).execute()
+            members = [r["instance_id"] for r in (getattr(res, "data", None) or [])]
+        except Exception as e:
+            print(f"[SHARD] heartbeat RPC failed for {job_id}; using fallback:", e)
+            members = _shard_members_fallback(job_id, ttl_seconds)
+    except Exception as e:
+        print(f"[SHARD] membership unavailable for {job_id}; using leader lease:", e)
+        return None
+    if SCHEDULER_INSTANCE_ID not in members:
+        return None
+
+    i, n = members.index(SCHEDULER_INSTANCE_ID), len(members)
+    shard = (i * SHARD_SPACE // n, (i + 1) * SHARD_SPACE // n)
+    with _shard_lock:
+        prev = _shard_assignments.get(job_id)
+        _shard_assignments[job_id] = {"shard": shard, "members": n, "index": i, "at": datetime.utcnow().isoformat()}
+    if not prev or prev["shard"] != shard:
+        print(f"[SHARD] {job_id}: {SCHEDULER_INSTANCE_ID} owns [{shard[0]},{shard[1]}) of {SHARD_SPACE} ({n} member(s))")
+        try:
+            (supabase.table(SCHEDULER_MEMBERS_TABLE)
+             .update({"shard_lo": shard[0], "shard_hi": shard[1]})
+             .eq("job_id", job_id).eq("instance_id", SCHEDULER_INSTANCE_ID).execute())
+        except Exception:
+            pass  # informational only
+    return shard
 
-            print(f"[OUTBOX] sent idem_key={row.get('idem_key')} to={row.get('to_email')}")
+_shard_heartbeat_stop = threading.Event()
+_shard_heartbeat_thread: Optional[threading.Thread] = None
+
+def _shard_heartbeat_loop():
+    """
+    Keep our membership fresh between ticks of long-interval jobs, and run a job right away
+    when its membership changes (a member crashed or joined) instead of waiting a full interval.
+    """
+    while not _shard_heartbeat_stop.wait(SHARD_HEARTBEAT_SECONDS):
+        with _shard_lock:
+            jobs = {j: a["shard"] for j, a in _shard_assignments.items()}
+        for job_id, prev in jobs.items():
+            if _shard_heartbeat_stop.is_set():
+                return
+            shard = shard_for_job(job_id)
+            if shard is not None and shard != prev:
+                try:
+                    scheduler.modify_job(job_id, next_run_time=datetime.now(timezone.utc))
+                except Exception:
+                    pass  # job removed or scheduler stopping
+
+def start_shard_heartbeat():
+    global _shard_heartbeat_thread
+    if not POLLER_SHARDING_ENABLED:
+        return
+    with _shard_lock:
+        if _shard_heartbeat_thread is not None and _shard_heartbeat_thread.is_alive():
+            return
+        _shard_heartbeat_stop.clear()
+        _shard_heartbeat_thread = threading.Thread(target=_shard_heartbeat_loop, name="shard-heartbeat", daemon=True)
+        _shard_heartbeat_thread.start()
+
+def leave_shard_groups():
+    """Drop our membership rows so the remaining members rebalance right away."""
+    _shard_heartbeat_stop.set()
+    with _shard_lock:
+        jobs = list(_shard_assignments)
+        _shard_assignments.clear()
+    for job_id in jobs:
+        try:
+            (supabase.table(SCHEDULER_MEMBERS_TABLE).delete()
+             .eq("job_id", job_id).eq("instance_id", SCHEDULER_INSTANCE_ID).execute())
         except Exception as e:
-            # Failure → backoff and requeue
-            print(f"[OUTBOX] send failed idem_key={row.get('idem_key')} err={e}")
-            try:
-                supabase.table("email_outbox").update({
-                    "status": "queued",
-                    "send_after": (datetime.utcnow() + timedelta(minutes=10)).isoformat(),
-                    "last_error": str(e)[:500],
-                }).eq("id", rid).eq("lock_token", my_lock).execute()
-            except Exception:
-                pass
+            print(f"[SHARD] leave failed for {job_id}:", e)
+
+def shard_assignments() -> Dict[str, dict]:
+    with _shard_lock:
+        return {k: dict(v) for k, v in _shard_assignments.items()}
+
+def _partial_shard(shard: Optional[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+    """None when shard is missing or covers the whole space (no filter needed)."""
+    if not shard or (shard[0] <= 0 and shard[1] >= SHARD_SPACE):
+        return None
+    return shard
+
+def _shard_filter(q, shard: Optional[Tuple[int, int]]):
+    """
+    Restrict a PostgREST query on a table with a shard_key column to [lo, hi). The member
+    owning shard 0 also takes rows not backfilled yet (null shard_key); that uses or_, so
+    don't pass queries that already have one.
+    """
+    shard = _partial_shard(shard)
+    if not shard:
+        return q
+    if shard[0] <= 0:
+        return q.or_(f"shard_key.is.null,shard_key.lt.{shard[1]}")
+    return q.gte("shard_key", shard[0]).lt("shard_key", shard[1])
+
+def in_shard(value, shard: Optional[Tuple[int, int]]) -> bool:
+    """Client-side shard test for keys without a shard_key column (e.g. user ids)."""
+    shard = _partial_shard(shard)
+    if not shard:
+        return True
+    return shard[0] <= zlib.crc32(str(value).encode("utf-8")) % SHARD_SPACE < shard[1]
+
+def _add_sharded_job(fn, job_id: str, interval_seconds: int, queue_name: str, on_skip=None, **kwargs):
+    """Interval job every member runs on its own shard; falls back to leader-only full scans."""
+    ttl = max(30, interval_seconds * 3)  # lease fallback only; membership uses SHARD_MEMBER_TTL_SECONDS
+
+    def run():
+        shard = shard_for_job(job_id)
+        if shard is not None:
+            fn(shard=shard)
+            return True
+        if _run_while_leased(job_id, ttl, fn):
+            return True
+        if on_skip:
+            on_skip()
+        return False
+    run.__name__ = getattr(fn, "__name__", job_id)
+    _add_queue_job(run, job_id, interval_seconds, queue_name, **kwargs)
 
 def _schedule_jobs():
-    # Calls poller (ok on both roles if you want)
+    # Calls: every scheduler process dials its own shard of leads. With the dispatcher the
+    # job is only the slow reconciliation scan; the heap wakes up exactly when calls are due.
+    if CALL_DISPATCHER_ENABLED:
+        _add_sharded_job(reconcile_call_heap, "calls-poller", CALL_RECONCILE_SECONDS, "calls",
+                         on_skip=deactivate_call_heap, next_run_time=datetime.now(timezone.utc))
+    else:
+        _add_sharded_job(poll_due_calls, "calls-poller", 60, "calls")
+
+    # Accept jobs: chunks are claimed atomically, so any role can help drain them
+    _job_queue["accept-jobs-worker"] = "accept"
     scheduler.add_job(
-        poll_due_calls,
-        trigger="interval", minutes=1,
-        id="calls-poller",
+        _queued("accept", run_accept_jobs_tick),
+        executor="accept",
+        trigger="interval", seconds=10,
+        id="accept-jobs-worker",
         replace_existing=True,
         coalesce=True,
         max_instances=1,
@@ -2622,14 +5410,7 @@ def _schedule_jobs():
 
     # Only schedule follow-up email steps on the worker AND when enabled
     if PROCESS_ROLE == "worker" and EMAIL_SEQUENCE_SCHEDULER_ENABLED:
-        scheduler.add_job(
-            poll_due_email_steps,
-            trigger="interval", minutes=5,
-            id="email-steps-poller",
-            replace_existing=True,
-            coalesce=True,
-            max_instances=1,
-        )
+        _add_sharded_job(poll_due_email_steps, "email-steps-poller", 5 * 60, "followups")
         print("[Scheduler] Email steps poller scheduled (every 5m) on worker")
     else:
         why = []
@@ -2641,30 +5422,41 @@ def _schedule_jobs():
 
     # Outbox sender — only on worker
     if PROCESS_ROLE == "worker":
-        scheduler.add_job(
-            _process_email_outbox_tick,
-            trigger="interval", seconds=30,
-            id="email-outbox-sender",
-            replace_existing=True,
-            coalesce=True,
-            max_instances=1,
-        )
+        _add_sharded_job(_process_email_outbox_tick, "email-outbox-sender", 30, "outbox")
         print("[Scheduler] Outbox sender scheduled (every 30s)")
 
-    # Gmail reply poller (leave as-is)
+    # Gmail reply poller — every 2m, or a slow safety net when push notifications are on
     if _GOOGLE_LIBS_AVAILABLE:
-        scheduler.add_job(
-            poll_all_gmail_replies,
-            trigger="interval", minutes=2,
-            id="gmail-replies-poller",
-            replace_existing=True,
-            coalesce=True,
-            max_instances=1,
-        )
-        print("[Scheduler] Gmail replies poller scheduled (every 2m)")
+        poll_minutes = GMAIL_SAFETY_POLL_MINUTES if GMAIL_PUSH_ENABLED else 2
+        _add_sharded_job(poll_all_gmail_replies, "gmail-replies-poller", poll_minutes * 60, "gmail")
+        print(f"[Scheduler] Gmail replies poller scheduled (every {poll_minutes}m)")
+
+        if GMAIL_PUSH_ENABLED:
+            _add_leader_job(renew_all_gmail_watches, "gmail-watch-renewal", 24 * 3600, "gmail",
+                            next_run_time=datetime.now(timezone.utc))
+            print("[Scheduler] Gmail watch renewal scheduled (every 24h)")
     else:
         print("[Scheduler] Gmail libs missing; reply poller not scheduled")
 
+    if ACTIVITY_FANOUT == "table":
+        _add_leader_job(prune_activity_events, "activity-events-prune", 5 * 60, "followups")
+
+    # Vapi inbox: retry failed events, pick up events from processes that died
+    _add_leader_job(recover_vapi_events, "vapi-events-recovery", 15, "calls")
+    _add_leader_job(prune_vapi_events, "vapi-events-prune", 3600, "followups")
+    _add_leader_job(prune_cache_invalidations, "cache-invalidations-prune", 3600, "followups")
+
+    # Not a queue job: reporting must not count towards the numbers it reports
+    scheduler.add_job(
+        report_scheduler_metrics,
+        trigger="interval", seconds=max(5, SCHEDULER_METRICS_REPORT_SECONDS),
+        id="scheduler-metrics-report",
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+        next_run_time=datetime.now(timezone.utc),
+    )
+
 @app.on_event("startup")
 def on_startup():
     if SKIP_SUPABASE_PROBE:
@@ -2675,53 +5467,603 @@ def on_startup():
     # Always log Vapi env presence (booleans only; no secrets)
     print(f"[VAPI][ENV] assistantId set? {bool(VAPI_ASSISTANT_ID)} | phoneNumberId set? {bool(VAPI_PHONE_NUMBER_ID)} | apiKey set? {bool(VAPI_API_KEY)}")
 
+    if WEB_RUNS_SCHEDULER:
+        start_scheduler()
+    else:
+        print("[Scheduler] Not started in web process (WEB_RUNS_SCHEDULER=false); worker.py runs the jobs")
+
+    _start_vapi_event_workers()
+
+SCHEDULER_METRICS_TABLE = os.getenv("SCHEDULER_METRICS_TABLE", "scheduler_queue_metrics")
+SCHEDULER_METRICS_REPORT_SECONDS = int(os.getenv("SCHEDULER_METRICS_REPORT_SECONDS", "30"))
+_scheduler_started_at = datetime.now(timezone.utc).isoformat()
+
+def scheduler_metrics_snapshot() -> dict:
+    return {"instance_id": SCHEDULER_INSTANCE_ID, "role": PROCESS_ROLE,
+            "queues": scheduler_queue_metrics(), "shards": shard_assignments(),
+            "call_heap": call_heap_metrics(), "started_at": _scheduler_started_at,
+            "reported_at": datetime.now(timezone.utc).isoformat()}
+
+def report_scheduler_metrics():
+    """Publish this process's queue snapshot so GET /api/scheduler/queues on any web process shows it."""
+    row = json.loads(json.dumps(scheduler_metrics_snapshot(), default=str))
+    supabase.table(SCHEDULER_METRICS_TABLE).upsert(row, on_conflict="instance_id").execute()
+
+def clear_scheduler_metrics():
+    try:
+        supabase.table(SCHEDULER_METRICS_TABLE).delete().eq("instance_id", SCHEDULER_INSTANCE_ID).execute()
+    except Exception as e:
+        print("[Scheduler] metrics cleanup failed:", e)
+
+def start_scheduler():
     try:
         if not getattr(scheduler, "running", False):
             scheduler.start()
             print("[Scheduler] Started")
         _schedule_jobs()
+        start_shard_heartbeat()
     except SchedulerAlreadyRunningError:
         print("[Scheduler] Already running; refreshing jobs")
         _schedule_jobs()
 
+@app.on_event("shutdown")
+def on_shutdown():
+    # Let running jobs finish first, then hand leases back so another process takes over
+    # without waiting for expiry (and without overlapping a job still running here)
+    if getattr(scheduler, "running", False):
+        scheduler.shutdown(wait=True)
+        clear_scheduler_metrics()
+    release_scheduler_leases()
+    leave_shard_groups()
+
+# ===================================================
+# Vapi webhook: durable inbox + fast ack + bounded queue drained by ordered workers
+# ===================================================
+VAPI_EVENT_WORKERS = int(os.getenv("VAPI_EVENT_WORKERS", "4"))
+VAPI_EVENT_QUEUE_MAX = int(os.getenv("VAPI_EVENT_QUEUE_MAX", "2000"))
+VAPI_EVENTS_TABLE = os.getenv("VAPI_EVENTS_TABLE", "vapi_event_inbox")
+VAPI_EVENT_MAX_ATTEMPTS = int(os.getenv("VAPI_EVENT_MAX_ATTEMPTS", "8"))
+VAPI_EVENT_RETRY_BASE_SECONDS = float(os.getenv("VAPI_EVENT_RETRY_BASE_SECONDS", "5"))
+VAPI_EVENT_RETRY_MAX_SECONDS = 600
+# A "processing" row older than this belongs to a process that died; recovery re-queues it
+VAPI_EVENT_LOCK_SECONDS = int(os.getenv("VAPI_EVENT_LOCK_SECONDS", "300"))
+VAPI_EVENT_RETENTION_HOURS = int(os.getenv("VAPI_EVENT_RETENTION_HOURS", "72"))
+
+# One queue + one thread per shard; events for the same call always hash to the same
+# shard, so they are processed in arrival order.
+_vapi_event_queues: List[queue.Queue] = []
+_vapi_event_workers_lock = threading.Lock()
+_vapi_event_stats_lock = threading.Lock()
+_vapi_event_stats = {
+    "enqueued": 0,
+    "processed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "stored": 0,
+    "store_failed": 0,
+    "retried": 0,
+    "recovered": 0,
+    "dead": 0,
+    "last_queue_wait_ms": 0,
+    "max_queue_wait_ms": 0,
+    "last_processing_ms": 0,
+    "max_processing_ms": 0,
+}
+
+def _vapi_event_key(evt: dict) -> str:
+    # lead_id rides on every event of a call (early status updates may lack the call id),
+    # so it keeps one call's events on one shard; the call id is only the fallback
+    external_call_id, lead_id = _extract_ids(evt)
+    return str(lead_id or external_call_id or "")
+
+def _start_vapi_event_workers():
+    with _vapi_event_workers_lock:
+        if _vapi_event_queues:
+            return
+        n = max(1, VAPI_EVENT_WORKERS)
+        per_shard = max(1, VAPI_EVENT_QUEUE_MAX // n)
+        for i in range(n):
+            q: queue.Queue = queue.Queue(maxsize=per_shard)
+            _vapi_event_queues.append(q)
+            threading.Thread(target=_vapi_event_worker, args=(q,), name=f"vapi-events-{i}", daemon=True).start()
+        print(f"[VAPI][QUEUE] started {n} worker(s), capacity={per_shard * n}")
+
+def _vapi_retry_delay(attempts: int) -> float:
+    return min(VAPI_EVENT_RETRY_MAX_SECONDS, VAPI_EVENT_RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1))
+
+def _vapi_event_count(name: str):
+    with _vapi_event_stats_lock:
+        _vapi_event_stats[name] += 1
+
+def _store_vapi_event(evt: dict) -> Optional[int]:
+    """Write the event to the inbox (claimed by us) before acking. None when the inbox is unavailable."""
+    try:
+        res = supabase.table(VAPI_EVENTS_TABLE).insert({
+            "event_key": _vapi_event_key(evt), "payload": evt, "status": "processing",
+            "locked_by": SCHEDULER_INSTANCE_ID, "locked_at": datetime.now(timezone.utc).isoformat(),
+        }).execute()
+        rows = getattr(res, "data", None) or []
+    except Exception as e:
+        print("[VAPI][INBOX] store failed:", e)
+        rows = []
+    if not rows:
+        _vapi_event_count("store_failed")
+        return None
+    _vapi_event_count("stored")
+    return rows[0]["id"]
+
+def _finish_vapi_event(row_id: int):
+    try:
+        (supabase.table(VAPI_EVENTS_TABLE)
+         .update({"status": "done", "processed_at": datetime.now(timezone.utc).isoformat(),
+                  "locked_by": None, "locked_at": None})
+         .eq("id", row_id).execute())
+    except Exception as e:
+        # Left "processing": recovery re-runs it after the lock lapses; settlement is idempotent
+        print(f"[VAPI][INBOX] could not mark event {row_id} done:", e)
+
+def _release_vapi_event(row_id: int, attempts: int, delay: float = 0.0, error: Optional[str] = None) -> bool:
+    """Hand an inbox row back for recovery after delay seconds (dead once attempts are used up)."""
+    dead = attempts >= VAPI_EVENT_MAX_ATTEMPTS
+    patch = {"status": "dead" if dead else "pending", "attempts": attempts,
+             "next_attempt_at": (datetime.now(timezone.utc) + timedelta(seconds=delay)).isoformat(),
+             "locked_by": None, "locked_at": None}
+    if error is not None:
+        patch["last_error"] = error[:1000]
+    try:
+        supabase.table(VAPI_EVENTS_TABLE).update(patch).eq("id", row_id).execute()
+        return True
+    except Exception as e:
+        print(f"[VAPI][INBOX] could not release event {row_id}; it is retried once its lock lapses:", e)
+        return False
+
+def _retry_vapi_event(evt: dict, row_id: Optional[int], attempts: int, error: Exception):
+    """Schedule another attempt with exponential backoff; dead-letter after VAPI_EVENT_MAX_ATTEMPTS."""
+    delay = _vapi_retry_delay(attempts)
+    if attempts >= VAPI_EVENT_MAX_ATTEMPTS:
+        _vapi_event_count("dead")
+        print(f"[VAPI][INBOX] giving up on event key={_vapi_event_key(evt)!r} after {attempts} attempt(s):", error)
+    else:
+        _vapi_event_count("retried")
+    if row_id is not None:
+        _release_vapi_event(row_id, attempts, delay, str(error))
+        return
+    if attempts >= VAPI_EVENT_MAX_ATTEMPTS:
+        return
+    # Not in the inbox (it was unavailable at ack time): retry from memory
+    timer = threading.Timer(delay, _requeue_vapi_event, args=(evt, attempts, delay))
+    timer.daemon = True
+    timer.start()
+
+def _requeue_vapi_event(evt: dict, attempts: int, delay: float):
+    if not _put_vapi_event(evt, None, attempts):
+        timer = threading.Timer(delay, _requeue_vapi_event, args=(evt, attempts, delay))
+        timer.daemon = True
+        timer.start()
+
+def _vapi_event_worker(q: queue.Queue):
+    while True:
+        enqueued_at, evt, row_id, attempts = q.get()
+        started = time.monotonic()
+        wait_ms = int((started - enqueued_at) * 1000)
+        ok = True
+        try:
+            _process_vapi_event(evt)
+            if row_id is not None:
+                _finish_vapi_event(row_id)
+        except Exception as e:
+            ok = False
+            print("[VAPI][QUEUE] event processing failed:", e)
+            _retry_vapi_event(evt, row_id, attempts + 1, e)
+        finally:
+            with _vapi_event_stats_lock:
+                _vapi_event_stats["processed" if ok else "failed"] += 1
+                proc_ms = int((time.monotonic() - started) * 1000)
+                _vapi_event_stats["last_queue_wait_ms"] = wait_ms
+                _vapi_event_stats["max_queue_wait_ms"] = max(_vapi_event_stats["max_queue_wait_ms"], wait_ms)
+                _vapi_event_stats["last_processing_ms"] = proc_ms
+                _vapi_event_stats["max_processing_ms"] = max(_vapi_event_stats["max_processing_ms"], proc_ms)
+            q.task_done()
+
+def _put_vapi_event(evt: dict, row_id: Optional[int], attempts: int) -> bool:
+    _start_vapi_event_workers()
+    key = _vapi_event_key(evt)
+    q = _vapi_event_queues[zlib.crc32(key.encode("utf-8")) % len(_vapi_event_queues)]
+    try:
+        q.put_nowait((time.monotonic(), evt, row_id, attempts))
+    except queue.Full:
+        with _vapi_event_stats_lock:
+            _vapi_event_stats["rejected"] += 1
+        return False
+    with _vapi_event_stats_lock:
+        _vapi_event_stats["enqueued"] += 1
+    return True
+
+def enqueue_vapi_event(evt: dict, row_id: Optional[int] = None) -> bool:
+    """Hand an event (and its inbox row, if stored) to its shard. Returns False when that shard is full."""
+    return _put_vapi_event(evt, row_id, 0)
+
+def recover_vapi_events(limit: int = 200):
+    """
+    Re-queue inbox events that are due for a retry, or whose process died mid-event
+    (still "processing" after VAPI_EVENT_LOCK_SECONDS). Each row is claimed with a
+    conditional update so only one process picks it up.
+    """
+    now = datetime.now(timezone.utc)
+    stale = (now - timedelta(seconds=VAPI_EVENT_LOCK_SECONDS)).isoformat()
+    res = (supabase.table(VAPI_EVENTS_TABLE)
+           .select("id,payload,attempts,status,locked_at")
+           .or_(f'and(status.eq.pending,next_attempt_at.lte."{now.isoformat()}"),'
+                f'and(status.eq.processing,locked_at.lt."{stale}")')
+           .order("id")
+           .limit(limit)
+           .execute())
+    for r in getattr(res, "data", None) or []:
+        claim = (supabase.table(VAPI_EVENTS_TABLE)
+                 .update({"status": "processing", "locked_by": SCHEDULER_INSTANCE_ID,
+                          "locked_at": datetime.now(timezone.utc).isoformat()})
+                 .eq("id", r["id"]).eq("status", r["status"]))
+        claim = claim.eq("locked_at", r["locked_at"]) if r.get("locked_at") else claim.is_("locked_at", "null")
+        if not (getattr(claim.execute(), "data", None) or []):
+            continue  # another process got it
+        attempts = int(r.get("attempts") or 0)
+        if not _put_vapi_event(r.get("payload") or {}, r["id"], attempts):
+            _release_vapi_event(r["id"], attempts, VAPI_EVENT_RETRY_BASE_SECONDS)
+            break
+        _vapi_event_count("recovered")
+
+def prune_vapi_events():
+    cutoff = (datetime.now(timezone.utc) - timedelta(hours=VAPI_EVENT_RETENTION_HOURS)).isoformat()
+    supabase.table(VAPI_EVENTS_TABLE).delete().eq("status", "done").lt("processed_at", cutoff).execute()
+
+def vapi_event_queue_metrics() -> dict:
+    now = time.monotonic()
+    depths, oldest_ms = [], 0
+    for q in _vapi_event_queues:
+        with q.mutex:
+            depths.append(len(q.queue))
+            if q.queue:
+                oldest_ms = max(oldest_ms, int((now - q.queue[0][0]) * 1000))
+    with _vapi_event_stats_lock:
+        stats = dict(_vapi_event_stats)
+    return {
+        "workers": len(_vapi_event_queues),
+        "capacity": sum(q.maxsize for q in _vapi_event_queues),
+        "depth": sum(depths),
+        "depth_by_worker": depths,
+        "oldest_wait_ms": oldest_ms,
+        **stats,
+    }
+
 @app.post("/vapi/webhook")
 async def vapi_webhook(request: Request):
+    """
+    Store in the durable inbox, enqueue, ack. Processing happens on the event workers;
+    failures are retried from the inbox with backoff (recover_vapi_events).
+    When neither the inbox nor the queue can take the event we answer 503 so Vapi retries.
+    """
     try:
         evt = await request.json()
-        print(f"[VAPI][WEBHOOK] status={(_extract_status(evt) or 'n/a')} lead_id={((_extract_ids(evt) or (None,None))[1])} campaign={((evt.get('call') or {}).get('metadata',{}) or {}).get('campaign_id')}")
     except Exception:
         return JSONResponse({"ok": True}, status_code=200)
+    if not isinstance(evt, dict):
+        return JSONResponse({"ok": True}, status_code=200)
+
+    row_id = await run_blocking(_store_vapi_event, evt)
+    if not enqueue_vapi_event(evt, row_id):
+        if row_id is not None and await run_blocking(_release_vapi_event, row_id, 0):
+            print("[VAPI][QUEUE] full; event left in the inbox for recovery")
+            return JSONResponse({"ok": True, "deferred": True}, status_code=200)
+        print("[VAPI][QUEUE] full; asking provider to retry")
+        return JSONResponse({"ok": False, "error": "event queue full"}, status_code=503)
+    return JSONResponse({"ok": True}, status_code=200)
+
+@app.get("/vapi/webhook/metrics")
+def vapi_webhook_metrics():
+    return JSONResponse(
+        {**vapi_event_queue_metrics(), "call_states": call_state_metrics()},
+        headers={"Cache-Control": "no-store"},
+    )
+
+# ===================================================
+# Call state table (in-memory, keyed by external_call_id)
+# ===================================================
+CALL_STATE_TTL_SECONDS = int(os.getenv("CALL_STATE_TTL_SECONDS", str(6 * 3600)))
+CALL_STATE_MAX_ENTRIES = int(os.getenv("CALL_STATE_MAX_ENTRIES", "20000"))
+CALL_STATE_MAX_FINGERPRINTS = 64
+
+_call_states: "OrderedDict[str, dict]" = OrderedDict()
+_call_states_lock = threading.Lock()
+_call_state_counts = {"ignored": 0, "duplicate": 0, "unchanged": 0, "transition": 0, "settle": 0, "already_settled": 0}
+
+def _event_fingerprint(evt: dict) -> str:
+    return hashlib.sha1(json.dumps(evt, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def classify_call_event(key: str, evt: dict, status: Optional[str]) -> str:
+    """
+    Decide what one webhook event means for its call:
+      ignored         - no status, nothing to write
+      duplicate       - byte-identical to an event already seen for this call
+      unchanged       - same non-terminal status as the current state (e.g. repeated status-update)
+      transition      - new non-terminal status; write it once
+      settle          - terminal status not settled yet; hand to settlement, then mark_call_settled()
+      already_settled - terminal status after the call was already settled
+
+    Nothing here is durable across processes; call_settlements (apply_call_event) is what
+    guarantees a call settles once. This table only saves the round trip in the common case.
+    """
+    if not status:
+        action = "ignored"
+    elif not key:
+        # Nothing to correlate on; fall back to treating each event on its own
+        action = "settle" if status in TERMINAL_STATUSES else "transition"
+    else:
+        fp = _event_fingerprint(evt)
+        now = time.monotonic()
+        with _call_states_lock:
+            st = _call_states.get(key)
+            if st is None or now - st["touched"] > CALL_STATE_TTL_SECONDS:
+                st = {"status": None, "settled": False, "fingerprints": deque(maxlen=CALL_STATE_MAX_FINGERPRINTS)}
+                _call_states[key] = st
+            _call_states.move_to_end(key)
+            st["touched"] = now
+
+            if fp in st["fingerprints"]:
+                action = "duplicate"
+            elif st["settled"]:
+                action = "already_settled"
+            elif status in TERMINAL_STATUSES:
+                # not marked settled (nor fingerprinted) until settlement succeeds, so a
+                # redelivery after a failure is retried instead of dropped
+                action = "settle"
+            elif status == st["status"]:
+                action = "unchanged"
+            else:
+                st["status"] = status
+                action = "transition"
+            if action != "settle":
+                st["fingerprints"].append(fp)
+
+            while len(_call_states) > CALL_STATE_MAX_ENTRIES:
+                _call_states.popitem(last=False)
+
+    with _call_states_lock:
+        _call_state_counts[action] += 1
+    if action not in ("transition", "settle"):
+        print(f"[VAPI][STATE] {action} key={key} status={status or 'n/a'}")
+    return action
+
+def mark_call_settled(key: str, evt: dict, status: str):
+    if not key:
+        return
+    with _call_states_lock:
+        st = _call_states.get(key)
+        if st is None:
+            st = _call_states[key] = {"status": None, "settled": False, "touched": time.monotonic(),
+                                      "fingerprints": deque(maxlen=CALL_STATE_MAX_FINGERPRINTS)}
+        st["settled"] = True
+        st["status"] = status
+        st["fingerprints"].append(_event_fingerprint(evt))
+
+# Durable per-call settlement (call_settlements, see the apply_call_event migration)
+CALL_SETTLEMENTS_TABLE = os.getenv("CALL_SETTLEMENTS_TABLE", "call_settlements")
+
+def _claim_call_settlement(external_call_id: Optional[str], lead_id: str, status: str, duration_seconds: int) -> Optional[dict]:
+    """
+    Multi-step path: insert the settlement row first. Returns None when we own the settlement,
+    or the existing row when the call was already settled.
+    """
+    if not external_call_id:
+        return None
+    try:
+        supabase.table(CALL_SETTLEMENTS_TABLE).insert({
+            "external_call_id": external_call_id, "lead_id": lead_id,
+            "status": status, "duration_seconds": duration_seconds,
+        }).execute()
+        return None
+    except Exception as e:
+        if getattr(e, "code", None) != "23505" and "23505" not in str(e):
+            print("[VAPI][SETTLE] settlement row unavailable; settling without durable dedup:", e)
+            return None
+    res = (supabase.table(CALL_SETTLEMENTS_TABLE).select("*")
+           .eq("external_call_id", external_call_id).limit(1).execute())
+    rows = getattr(res, "data", None) or []
+    return rows[0] if rows else {"external_call_id": external_call_id}
+
+def _release_call_settlement(external_call_id: Optional[str]):
+    if not external_call_id:
+        return
+    try:
+        supabase.table(CALL_SETTLEMENTS_TABLE).delete().eq("external_call_id", external_call_id).execute()
+    except Exception as e:
+        print("[VAPI][SETTLE] could not release settlement row:", e)
+
+def claim_call_billing(external_call_id: Optional[str]) -> bool:
+    """Set billed_at once per call; False when another delivery already billed it."""
+    if not external_call_id:
+        return True
+    try:
+        res = (supabase.table(CALL_SETTLEMENTS_TABLE)
+               .update({"billed_at": datetime.utcnow().isoformat()})
+               .eq("external_call_id", external_call_id)
+               .is_("billed_at", "null")
+               .execute())
+        return bool(getattr(res, "data", None))
+    except Exception as e:
+        print("[CREDITS] billing claim unavailable; billing without dedup:", e)
+        return True
+
+def release_call_billing(external_call_id: Optional[str]):
+    if not external_call_id:
+        return
+    try:
+        (supabase.table(CALL_SETTLEMENTS_TABLE).update({"billed_at": None})
+         .eq("external_call_id", external_call_id).execute())
+    except Exception as e:
+        print("[CREDITS] could not release billing claim:", e)
+
+def call_state_metrics() -> dict:
+    with _call_states_lock:
+        return {"tracked_calls": len(_call_states), **_call_state_counts}
+
+def apply_call_event(
+    lead_id: str,
+    external_call_id: Optional[str],
+    status: str,
+    call_patch: Dict,
+    summary: str = "",
+    name: Optional[str] = None,
+    company: Optional[str] = None,
+    duration_seconds: int = 0,
+) -> Optional[dict]:
+    """
+    Settle a terminal call status in a single round trip via the apply_call_event RPC
+    (supabase/migrations/*_apply_call_event.sql): updates call_logs, patches the lead,
+    computes the retry schedule and returns the follow-up actions.
+    Returns None only when the function isn't installed, so the caller can use the multi-step
+    path. Any other error (e.g. a read timeout after the RPC committed) is raised: retrying the
+    steps by hand would bump attempts and write the status rows a second time.
+    """
+    payload = {
+        "p_lead_id": lead_id,
+        "p_external_call_id": external_call_id,
+        "p_status": status,
+        "p_started_at": call_patch.get("started_at"),
+        "p_ended_at": call_patch.get("ended_at"),
+        "p_duration_seconds": int(duration_seconds or 0) if call_patch.get("duration_seconds") else None,
+        "p_recording_url": call_patch.get("recording_url"),
+        "p_summary": (summary or "")[:1000],
+        "p_provider": VOICE_PROVIDER_NAME,
+        "p_name": name,
+        "p_company": company,
+        "p_default_user_id": DEFAULT_USER_ID,
+        "p_default_max_attempts": MAX_RETRIES,
+        "p_default_retry_minutes": RETRY_MINUTES,
+    }
+    try:
+        res = supabase.rpc("apply_call_event", payload).execute()
+    except Exception as e:
+        if not _is_missing_function_error(e):
+            raise
+        print("[VAPI][APPLY] RPC not installed; using multi-step path:", e)
+        return None
+    data = getattr(res, "data", None)
+    if isinstance(data, list):
+        data = data[0] if data else None
+    if isinstance(data, dict):
+        return data
+    raise RuntimeError(f"apply_call_event returned no result for lead {lead_id}")
+
+def _is_missing_function_error(e: Exception) -> bool:
+    """PostgREST couldn't find the RPC (PGRST202 / 404), as opposed to the call failing."""
+    code = str(getattr(e, "code", "") or "")
+    text = str(e)
+    return code in ("PGRST202", "42883", "404") or "PGRST202" in text or "Could not find the function" in text
+
+def _apply_call_event_multistep(
+    lead_id: str,
+    external_call_id: Optional[str],
+    status: str,
+    call_patch: Dict,
+    summary: str = "",
+    name: Optional[str] = None,
+    company: Optional[str] = None,
+    duration_seconds: int = 0,
+) -> dict:
+    """Client-side equivalent of the apply_call_event RPC (several round trips)."""
+    settled = _claim_call_settlement(external_call_id, lead_id, status, duration_seconds)
+    if settled is not None:
+        actions = []
+        if settled.get("status") == "completed" and not settled.get("billed_at"):
+            actions.append({"type": "bill", "user_id": None})
+        return {"ok": True, "already_settled": True, "actions": actions}
+    try:
+        return _apply_call_event_steps(lead_id, external_call_id, status, call_patch, summary, name, company)
+    except Exception:
+        _release_call_settlement(external_call_id)
+        raise
+
+def _apply_call_event_steps(
+    lead_id: str,
+    external_call_id: Optional[str],
+    status: str,
+    call_patch: Dict,
+    summary: str = "",
+    name: Optional[str] = None,
+    company: Optional[str] = None,
+) -> dict:
+    update_structured_call_log(lead_id, external_call_id, call_patch)
+    log_call_to_supabase(
+        lead_id,
+        status,
+        (summary or f"external_call_id={external_call_id}" or "").strip()
+    )
+
+    actions: List[dict] = []
+    if status == "completed":
+        # Build lead patch for a completed (answered) call
+        lead_patch = {
+            "status": "contacted",
+            "last_call_status": "answered",
+            "next_call_at": None,
+        }
+        # Enrich lead with name/company if present
+        if name:
+            lead_patch["name"] = name
+            lead_patch["first_name"] = name.split()[0].strip()
+        if company:
+            lead_patch["company_name"] = company
+        try:
+            update_lead(lead_id, lead_patch)
+        except Exception as e:
+            print("[VAPI][WEBHOOK] lead update failed:", e)
+        actions.append({"type": "bill", "user_id": None})
+
+    elif status == "failed":
+        update_lead(lead_id, {"last_call_status": status, "next_call_at": None})
+
+    elif status in ("no-answer", "busy"):
+        lead_resp = supabase.table("leads").select("*").eq("id", lead_id).single().execute()
+        lead = getattr(lead_resp, "data", None)
+        if lead:
+            rules = get_campaign_rules(lead.get("campaign_id"))
+            next_time = inc_attempts_and_reschedule(
+                lead,
+                max_attempts=rules["max_attempts"],
+                after_minutes=rules["retry_minutes"]
+            )
+            if next_time:
+                actions.append({"type": "reschedule", "next_call_at": next_time.isoformat()})
+            else:
+                actions.append({"type": "max_retries"})
+
+    return {"ok": True, "actions": actions}
+
+def _process_vapi_event(evt: dict):
+    print(f"[VAPI][WEBHOOK] status={(_extract_status(evt) or 'n/a')} lead_id={((_extract_ids(evt) or (None,None))[1])} campaign={((evt.get('call') or {}).get('metadata',{}) or {}).get('campaign_id')}")
 
     # Extract identifiers and a (possibly non-terminal) status
     external_call_id, lead_id = _extract_ids(evt)
     status = _extract_status(evt)  # may be mid-call like 'ringing'
     summary = evt.get("summary") or (evt.get("message") or {}).get("summary") or ""
 
-    # Lightweight observability row
-    if lead_id:
-        try:
-            uid_for_log = _get_lead_user_id(lead_id) or DEFAULT_USER_ID
-            supabase.table("call_logs").insert({
-                "user_id": uid_for_log,
-                "lead_id": lead_id,
-                "call_status": (status or "event"),
+    # Collapse the event stream: drop duplicates, write non-terminal changes as one
+    # state transition, and settle each call's terminal status exactly once.
+    state_key = external_call_id or lead_id or ""
+    action = classify_call_event(state_key, evt, status)
+    evt_campaign_id = ((evt.get("call") or {}).get("metadata") or {}).get("campaign_id")
+    if action != "settle":
+        if action == "transition" and lead_id:
+            update_structured_call_log(lead_id, external_call_id, {
+                "call_status": status,
                 "provider": VOICE_PROVIDER_NAME,
-                "external_call_id": external_call_id,
-                "notes": (summary or "")[:500],
-            }).execute()
-        except Exception as e:
-            print("Call log (event) insert failed:", e)
-
-    # If no status → ack
-    if not status:
-        return JSONResponse({"ok": True}, status_code=200)
-
-    # Only heavy updates for terminal statuses
-    if status not in TERMINAL_STATUSES:
-        return JSONResponse({"ok": True}, status_code=200)
+            })
+            publish_activity("call_status", lead_id, evt_campaign_id,
+                             status=status, external_call_id=external_call_id)
+        return
 
     if not lead_id:
-        return JSONResponse({"ok": True}, status_code=200)
+        return
 
     # Parse name/company from summary
     try:
@@ -2756,76 +6098,54 @@ async def vapi_webhook(request: Request):
     if recording_url:
         patch["recording_url"] = recording_url
 
-    update_structured_call_log(lead_id, external_call_id, patch)
-    log_call_to_supabase(
-        lead_id,
-        status,
-        (summary or f"external_call_id={external_call_id}" or "").strip()
-    )
-    print(f"[Webhook] {status} for lead {lead_id}")
-
-    # ================================
-    #      FIXED "completed" block
-    # ================================
-    if status == "completed":
-        # Build lead patch for a completed (answered) call
-        lead_patch = {
-            "status": "contacted",
-            "last_call_status": "answered",
-            "next_call_at": None,
-        }
-
-        # Enrich lead with name/company if present
-        if name_from_call:
-            lead_patch["name"] = name_from_call
-            lead_patch["first_name"] = name_from_call.split()[0].strip()
-        if company_from_call:
-            lead_patch["company_name"] = company_from_call
-
-        # Update the lead
-        try:
-            update_lead(lead_id, lead_patch)
-        except Exception as e:
-            print("[VAPI][WEBHOOK] lead update failed:", e)
-
-        # BILL call
+    try:
+        dur = int(float(duration_seconds)) if duration_seconds is not None else 0
+    except Exception:
+        dur = 0
+
+    # One round trip when the apply_call_event RPC is installed; the step-by-step path otherwise
+    result = apply_call_event(lead_id, external_call_id, status, patch, summary,
+                              name_from_call, company_from_call, dur)
+    if result is None:
+        result = _apply_call_event_multistep(lead_id, external_call_id, status, patch, summary,
+                                             name_from_call, company_from_call, dur)
+    actions = result.get("actions") or []
+    already = bool(result.get("already_settled"))
+    print(f"[Webhook] {status} for lead {lead_id} actions={[a.get('type') for a in actions]}"
+          + (" (already settled)" if already else ""))
+    if not already:
+        publish_activity("call_settled", lead_id, evt_campaign_id, status=status,
+                         external_call_id=external_call_id, duration_seconds=dur,
+                         actions=[a.get("type") for a in actions])
+
+    for act in actions:
+        if act.get("type") == "reschedule":
+            # the RPC path rescheduled in the database; mirror it in the dispatcher heap
+            note_next_call(lead_id, act.get("next_call_at"))
+        if act.get("type") != "bill":
+            continue
+        if not claim_call_billing(external_call_id):
+            continue
         try:
-            dur = 0
-            try:
-                dur = int(duration_seconds) if duration_seconds is not None else 0
-            except Exception:
-                dur = 0
-
             bill_call_completion(
                 supabase=supabase,
                 lead_id=lead_id,
                 external_call_id=external_call_id,
-                duration_seconds=dur,
+                duration_seconds=int(act.get("duration_seconds") or dur),
+                user_id=act.get("user_id"),
             )
         except Exception as bill_e:
+            # hand the charge back so a redelivery (or another process) retries it
+            release_call_billing(external_call_id)
             print("[CREDITS] billing error:", bill_e)
-
-    # ================================
-    #          FAILED CALLS
-    # ================================
-    elif status in ("failed",):
-        update_lead(lead_id, {"last_call_status": status, "next_call_at": None})
-                
-    elif status in ("failed",):
-        update_lead(lead_id, {"last_call_status": status, "next_call_at": None})
-
-    elif status in ("no-answer", "busy"):
-        lead_resp = supabase.table("leads").select("*").eq("id", lead_id).single().execute()
-        lead = getattr(lead_resp, "data", None)
-        if lead:
-            rules = get_campaign_rules(lead.get("campaign_id"))
-            inc_attempts_and_reschedule(
-                lead,
-                max_attempts=rules["max_attempts"],
-                after_minutes=rules["retry_minutes"]
-            )
-
-    return JSONResponse({"ok": True}, status_code=200)
+            raise
+        finally:
+            # balance moved; the domain isn't known here, so drop all cached balances
+            read_cache_invalidate("credits")
+    # settlement rewrote the lead row (status, attempts, next_call_at)
+    note_write(lead_id)
+    read_cache_invalidate("lead", lead_id)
+    mark_call_settled(state_key, evt, status)
 
 def _get_lead_user_id(lead_id: str):
     """Look up the lead's user_id (NOT NULL in call_logs)."""
@@ -2888,6 +6208,8 @@ def _upsert_google_tokens(user_id: str, creds: "GCredentials"):
     except Exception as e:
         print("[Google] Token upsert failed:", e)
         raise HTTPException(status_code=500, detail="Unable to store Google tokens.")
+    finally:
+        read_cache_invalidate("oauth_status", user_id)
 
 def _load_google_tokens(user_id: str) -> Optional[dict]:
     try:
@@ -3012,6 +6334,12 @@ def google_auth_callback(request: Request):
     creds = flow.credentials
     _upsert_google_tokens(user_id, creds)
 
+    if GMAIL_PUSH_ENABLED:
+        try:
+            gmail_start_watch(user_id)
+        except Exception as e:
+            print("[Gmail Push] watch on connect failed (poller will cover):", e)
+
     html = "<script>window.close();</script><p>Google connected. You may close this tab.</p>"
     return HTMLResponse(content=html)
 
@@ -3065,7 +6393,7 @@ async def calendar_quick_add(request: Request):
     body = await request.json()
     if "start" not in body or "end" not in body:
         raise HTTPException(status_code=400, detail="Missing 'start'/'end'")
-    created = _calendar_create_event(user_id, body)
+    created = await run_blocking(_calendar_create_event, user_id, body)
     return {"ok": True, "event": created}
 
 # =========================
@@ -3090,10 +6418,11 @@ def oauth_status(request: Request):
     if not user_id:
         return {"connected": False}
 
-    row = _load_google_tokens(user_id)
-    if row and (row.get("access_token") or row.get("refresh_token")):
-        return {"connected": True}
-    return {"connected": False}
+    def load():
+        row = _load_google_tokens(user_id)
+        return {"connected": bool(row and (row.get("access_token") or row.get("refresh_token")))}
+    etag, out = cached_read("oauth_status", user_id, load)
+    return conditional_response(request, etag, out)
 
 @app.get("/api/dev/google-scopes")
 def dev_google_scopes(request: Request):
@@ -3123,6 +6452,7 @@ def oauth_disconnect(request: Request):
             supabase.table(GOOGLE_TOKENS_TABLE).delete().eq("user_id", user_id).execute()
         except Exception as e:
             print("Disconnect failed:", e)
+        read_cache_invalidate("oauth_status", user_id)
     return {"ok": True}
 
 @app.get("/calendar/events")
@@ -3187,7 +6517,7 @@ async def create_event_alias(request: Request):
     }
     if body.get("attendees"):
         event["attendees"] = [{"email": e} if isinstance(e, str) else e for e in body["attendees"]]
-    created = _calendar_create_event(user_id, event)
+    created = await run_blocking(_calendar_create_event, user_id, event)
     return {"ok": True, "event": created}
 
 # ===================================================
@@ -3196,16 +6526,33 @@ async def create_event_alias(request: Request):
 ADMIN_USER_IDS = {u.strip() for u in os.getenv("ADMIN_USER_IDS", "").split(",") if u.strip()}
 
 def user_is_admin(user_id: Optional[str]) -> bool:
+    """
+    profiles.is_admin is authoritative (so demoting an ADMIN_USER_IDS user works); the env
+    list only answers when the user has no profile row or the lookup fails.
+    Answers are cached for ADMIN_CACHE_TTL_SECONDS. Revocations made through any worker
+    reach every process via cache_invalidations; a cached "admin" is only trusted while
+    that poller is current, so it can't outlive a revocation. Edits made directly in the
+    database are picked up once the TTL lapses.
+    """
     if not user_id:
         return False
+    start_cache_invalidation_listener()
+    hit = read_cache_get("admin", user_id)
+    if hit:
+        cached_admin = bool((hit[1] or {}).get("is_admin"))
+        if not cached_admin or cache_invalidations_live():
+            return cached_admin
+    loaded_at = time.monotonic()
     try:
-        res = supabase.table("profiles").select("is_admin").eq("id", user_id).single().execute()
-        row = getattr(res, "data", None)
-        if isinstance(row, dict):
-            return bool(row.get("is_admin"))
+        res = supabase.table("profiles").select("is_admin").eq("id", user_id).limit(1).execute()
+        rows = getattr(res, "data", None) or []
     except Exception as e:
         print("[ADMIN] profiles lookup failed or missing; using env fallback:", e)
-    return user_id in ADMIN_USER_IDS
+        return user_id in ADMIN_USER_IDS
+    is_admin = bool(rows[0].get("is_admin")) if rows else user_id in ADMIN_USER_IDS
+    if not invalidated_since("admin", user_id, loaded_at):
+        read_cache_put("admin", user_id, {"is_admin": is_admin})
+    return is_admin
 
 def _require_admin(request: Request) -> str:
     uid = _get_request_user_id(request)
@@ -3218,6 +6565,7 @@ def _upsert_profile_flag(user_id: str, is_admin: bool):
         supabase.table("profiles").upsert({"id": user_id, "is_admin": is_admin}).execute()
     except Exception as e:
         print("[ADMIN] upsert profiles failed (ensure 'profiles' table exists):", e)
+    publish_cache_invalidation("admin", user_id)
 
 def _auth_admin_headers():
     if not SUPABASE_KEY or "service" not in (_decode_jwt_role(SUPABASE_KEY) or ""):
@@ -3230,7 +6578,7 @@ def _auth_admin_headers():
 
 @app.post("/api/admin/users")
 async def admin_create_user(request: Request):
-    _require_admin(request)
+    await run_blocking(_require_admin, request)
 
     body = await request.json()
     email = (body.get("email") or "").strip().lower()
@@ -3241,6 +6589,9 @@ async def admin_create_user(request: Request):
     if not email or not password:
         raise HTTPException(status_code=400, detail="email and password are required")
 
+    return await run_blocking(_create_auth_user, email, password, name, is_admin_flag)
+
+def _create_auth_user(email: str, password: str, name: str, is_admin_flag: bool):
     url = f"{SUPABASE_URL}/auth/v1/admin/users"
     payload = {
         "email": email,
@@ -3250,7 +6601,7 @@ async def admin_create_user(request: Request):
     }
 
     try:
-        r = requests.post(url, headers=_auth_admin_headers(), json=payload, timeout=20)
+        r = outbound_http.post(url, headers=_auth_admin_headers(), json=payload, timeout=20)
         if r.status_code >= 300:
             try:
                 err = r.json()
@@ -3279,7 +6630,7 @@ def admin_list_users(request: Request, limit: int = 50, page: int = 1, search: O
         params["email"] = search
 
     try:
-        r = requests.get(url, headers=_auth_admin_headers(), params=params, timeout=20)
+        r = outbound_http.get(url, headers=_auth_admin_headers(), params=params, timeout=20)
         if r.status_code >= 300:
             try:
                 err = r.json()
@@ -3294,7 +6645,7 @@ def admin_list_users(request: Request, limit: int = 50, page: int = 1, search: O
 
 @app.post("/api/admin/users/{auth_user_id}/set-admin")
 async def admin_set_admin_flag(request: Request, auth_user_id: str):
-    _require_admin(request)
+    await run_blocking(_require_admin, request)
     try:
         body = await request.json()
     except Exception:
@@ -3302,19 +6653,31 @@ async def admin_set_admin_flag(request: Request, auth_user_id: str):
     is_admin_flag = bool(body.get("is_admin", True))
 
     try:
-        _upsert_profile_flag(auth_user_id, is_admin_flag)
+        await run_blocking(_upsert_profile_flag, auth_user_id, is_admin_flag)
         return {"ok": True, "user_id": auth_user_id, "is_admin": is_admin_flag}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Set admin error: {e}")
 
+def _credits_domain_for(uid: Optional[str]) -> Optional[str]:
+    if not uid:
+        return email_domain_of(supabase, uid)
+    def load():
+        domain = email_domain_of(read_db(uid), uid)
+        return {"domain": domain} if domain else None  # don't pin a miss
+    _, out = cached_read("credits_domain", uid, load)
+    return (out or {}).get("domain")
+
 @app.get("/api/credits")
 def get_credits(request: Request):
     uid = _get_request_user_id(request)
-    domain = email_domain_of(supabase, uid)
+    domain = _credits_domain_for(uid)
     if not domain:
         return {"ok": True, "domain": None, "balance_credits": 0}
     # domain_balance(...) should now return credits (not cents) via credits.py wrapper
-    return {"ok": True, "domain": domain, "balance_credits": domain_balance(supabase, domain)}
+    etag, out = cached_read("credits", domain, lambda: {
+        "ok": True, "domain": domain, "balance_credits": domain_balance(read_db(domain), domain)
+    })
+    return conditional_response(request, etag, out)
 
 @app.post("/api/credits/topup")
 async def post_topup(request: Request):
@@ -3322,7 +6685,7 @@ async def post_topup(request: Request):
     Add credits (INTEGER) to the domain. Aligns with Lovable’s contract.
     """
     uid = _get_request_user_id(request)
-    domain = email_domain_of(supabase, uid)
+    domain = await run_blocking(email_domain_of, supabase, uid)
     if not domain:
         raise HTTPException(status_code=400, detail="Cannot resolve email domain for user")
 
@@ -3335,11 +6698,14 @@ async def post_topup(request: Request):
     if amount_credits <= 0:
         raise HTTPException(status_code=400, detail="amount_credits must be > 0")
 
-    new_balance = domain_add_credits(
+    new_balance = await run_blocking(
+        domain_add_credits,
         supabase,
         domain,
         amount_credits,
         reason="topup",
         meta={"user_id": uid}
     )
+    note_write(domain)
+    read_cache_invalidate("credits", domain)
     return {"ok": True, "domain": domain, "balance_credits": new_balance}
@@ -0,0 +1,162 @@
+# outbound_http.py
+"""
+Shared outbound HTTP layer: one keep-alive requests.Session per host, per-host default
+timeouts, bounded retries and simple per-host metrics.
+
+    import outbound_http
+    r = outbound_http.post("https://api.vapi.ai/call/phone", json=payload, headers=headers)
+
+Retries: connection failures are retried for every method (nothing reached the server);
+read errors and 429/502/503/504 only for idempotent methods, so a POST that might have
+been processed (e.g. placing a call) is never sent twice.
+"""
+import os
+import time
+import threading
+from typing import Dict, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_SECONDS = float(os.getenv("HTTP_BACKOFF_SECONDS", "0.5"))
+HTTP_DEFAULT_TIMEOUT: Tuple[float, float] = (
+    float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5")),
+    float(os.getenv("HTTP_READ_TIMEOUT_SECONDS", "30")),
+)
+
+# host -> (connect, read) seconds; anything not listed gets HTTP_DEFAULT_TIMEOUT
+HOST_TIMEOUTS: Dict[str, Tuple[float, float]] = {
+    "api.vapi.ai": (5, 30),
+    "docs.google.com": (10, 60),
+}
+
+RETRY_STATUSES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+_sessions: Dict[str, requests.Session] = {}
+_lock = threading.Lock()
+_stats: Dict[str, Dict[str, float]] = {}
+
+
+def _host_stats(host: str) -> Dict[str, float]:
+    st = _stats.get(host)
+    if st is None:
+        st = _stats.setdefault(host, {"requests": 0, "errors": 0, "retries": 0,
+                                      "status_5xx": 0, "total_ms": 0.0, "max_ms": 0.0})
+    return st
+
+
+class _CountingRetry(Retry):
+    """Retry that records each retry against the pool's host."""
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        host = getattr(_pool, "host", None)
+        if host:
+            with _lock:
+                _host_stats(host)["retries"] += 1
+        return super().increment(method=method, url=url, response=response, error=error,
+                                 _pool=_pool, _stacktrace=_stacktrace)
+
+
+def _new_session() -> requests.Session:
+    retry = _CountingRetry(
+        total=HTTP_MAX_RETRIES,
+        connect=HTTP_MAX_RETRIES,
+        read=HTTP_MAX_RETRIES,
+        status=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_SECONDS,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=IDEMPOTENT_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, HTTP_POOL_MAXSIZE), max_retries=retry)
+    s = requests.Session()
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+def session_for(url: str) -> requests.Session:
+    host = (urlsplit(url).hostname or "").lower()
+    s = _sessions.get(host)
+    if s is None:
+        with _lock:
+            s = _sessions.get(host)
+            if s is None:
+                s = _sessions[host] = _new_session()
+    return s
+
+
+def set_host_timeout(host: str, connect: float, read: float) -> None:
+    HOST_TIMEOUTS[(host or "").lower()] = (float(connect), float(read))
+
+
+def request(method: str, url: str, timeout=None, **kwargs) -> requests.Response:
+    host = (urlsplit(url).hostname or "").lower()
+    if timeout is None:
+        timeout = HOST_TIMEOUTS.get(host, HTTP_DEFAULT_TIMEOUT)
+    t0 = time.monotonic()
+    try:
+        resp = session_for(url).request(method, url, timeout=timeout, **kwargs)
+    except Exception:
+        with _lock:
+            st = _host_stats(host)
+            st["requests"] += 1
+            st["errors"] += 1
+        raise
+    ms = (time.monotonic() - t0) * 1000.0
+    with _lock:
+        st = _host_stats(host)
+        st["requests"] += 1
+        st["total_ms"] += ms
+        st["max_ms"] = max(st["max_ms"], ms)
+        if resp.status_code >= 500:
+            st["status_5xx"] += 1
+    return resp
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def http_metrics() -> Dict[str, dict]:
+    """Per-host counters plus the urllib3 pool's connection/request counts."""
+    out: Dict[str, dict] = {}
+    with _lock:
+        snapshot = {h: dict(st) for h, st in _stats.items()}
+        sessions = dict(_sessions)
+    for host, st in snapshot.items():
+        n = int(st["requests"]) or 1
+        out[host] = {
+            "requests": int(st["requests"]),
+            "errors": int(st["errors"]),
+            "retries": int(st["retries"]),
+            "status_5xx": int(st["status_5xx"]),
+            "avg_ms": round(st["total_ms"] / n, 1),
+            "max_ms": round(st["max_ms"], 1),
+        }
+    for host, s in sessions.items():
+        conns = reqs = 0
+        try:
+            adapter = s.get_adapter("https://" + host)
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    conns += getattr(pool, "num_connections", 0)
+                    reqs += getattr(pool, "num_requests", 0)
+        except Exception:
+            pass
+        out.setdefault(host, {})
+        out[host]["connections_opened"] = conns
+        out[host]["pool_requests"] = reqs
+    return out
@@ -6,7 +6,7 @@ import stripe
 from typing import Optional, Dict, Any
 
 from fastapi import APIRouter, HTTPException, Request, Body
-from supabase import create_client
+from supabase_pool import pooled_client
 
 # ---------- Environment ----------
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY", "")
@@ -17,10 +17,23 @@ PRICE_CENTS_PER_CREDIT = int(os.getenv("PRICE_CENTS_PER_CREDIT", "30"))
 # Supabase (Lovable Cloud) – use service role for writes/billing
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY", os.getenv("SUPABASE_KEY", ""))  # fallback
-supabase_sr = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase_sr = pooled_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)  # shares main's pool when the key matches
 
 router = APIRouter(tags=["credits"])
 
+# Callbacks run with the domain after a successful top-up (e.g. to drop cached balances)
+_domain_credited_listeners = []
+
+def on_domain_credited(fn) -> None:
+    _domain_credited_listeners.append(fn)
+
+def _notify_domain_credited(domain: str) -> None:
+    for fn in _domain_credited_listeners:
+        try:
+            fn(domain)
+        except Exception as e:
+            print("[CREDITS][TOPUP] listener failed:", e)
+
 # ---------- Helpers ----------
 def _compute_credits(amount_cents: int, price_cents_per_credit: int) -> int:
     if price_cents_per_credit <= 0:
@@ -45,6 +58,7 @@ def _credit_domain(domain: str, credits: int, meta: Dict[str, Any]) -> None:
             "p_meta": meta or {},
         }).execute()
         print(f"[CREDITS][TOPUP] domain={domain} +{credits} RPC -> {getattr(res, 'data', None)}")
+        _notify_domain_credited(domain)
         return
     except Exception as e:
         print("[CREDITS][TOPUP] RPC failed; using fallback:", e)
@@ -74,6 +88,7 @@ def _credit_domain(domain: str, credits: int, meta: Dict[str, Any]) -> None:
             pass
 
         print(f"[CREDITS][TOPUP][FALLBACK] domain={domain} +{credits} -> {new_bal}")
+        _notify_domain_credited(domain)
     except Exception as e2:
         print("[CREDITS][TOPUP][ERROR]", e2)
 
@@ -0,0 +1,16 @@
+-- Gmail push (users.watch) state: which mailbox belongs to which user and the
+-- history cursor the incremental fetch resumes from.
+create table if not exists public.gmail_watch_state (
+    user_id        uuid primary key,
+    email_address  text,
+    history_id     text,
+    expiration     timestamptz,
+    updated_at     timestamptz not null default now()
+);
+
+-- Stored lowercased (gmail_start_watch), so push lookups match the plain column
+create index if not exists gmail_watch_state_email_address_idx
+    on public.gmail_watch_state (email_address);
+
+-- Server-side only (service_role bypasses RLS); no policies, so anon/authenticated get nothing
+alter table public.gmail_watch_state enable row level security;
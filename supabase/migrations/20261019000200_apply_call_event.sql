@@ -0,0 +1,165 @@
+-- apply_call_event: settle one terminal Vapi call status in a single round trip.
+-- Mirrors the webhook's multi-step path in main.py (_apply_call_event_multistep):
+--   1) update the call's structured call_logs row (by external_call_id, else latest queued row)
+--   2) insert the status row that log_call_to_supabase used to write
+--   3) patch the lead and, for no-answer/busy, compute the retry schedule from campaign rules
+-- Returns {"ok", "lead_found", "user_id", "campaign_id", "call_attempts", "next_call_at", "actions": [...]}
+-- where actions tells the caller what is left to do (e.g. {"type": "bill", "user_id": ...}).
+--
+-- Each external_call_id settles once: the call_settlements row is written in the same
+-- transaction, so a redelivered terminal event (to any process) returns already_settled
+-- instead of bumping attempts again. billed_at is claimed by the caller around billing.
+create table if not exists public.call_settlements (
+    external_call_id  text primary key,
+    lead_id           uuid,
+    status            text not null,
+    duration_seconds  integer,
+    settled_at        timestamptz not null default now(),
+    billed_at         timestamptz
+);
+
+create or replace function public.apply_call_event(
+    p_lead_id               uuid,
+    p_external_call_id      text        default null,
+    p_status                text        default null,
+    p_started_at            timestamptz default null,
+    p_ended_at              timestamptz default null,
+    p_duration_seconds      integer     default null,
+    p_recording_url         text        default null,
+    p_summary               text        default null,
+    p_provider              text        default 'voice',
+    p_name                  text        default null,
+    p_company               text        default null,
+    p_default_user_id       uuid        default null,
+    p_default_max_attempts  integer     default 3,
+    p_default_retry_minutes integer     default 30
+) returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_lead       public.leads%rowtype;
+    v_user_id    uuid;
+    v_rules      jsonb;
+    v_call_rules jsonb;
+    v_max        integer;
+    v_retry      integer;
+    v_attempts   integer;
+    v_next       timestamptz;
+    v_first      text;
+    v_actions    jsonb := '[]'::jsonb;
+    v_settled    public.call_settlements%rowtype;
+begin
+    select * into v_lead from public.leads where id = p_lead_id for update;
+    if not found then
+        return jsonb_build_object('ok', false, 'lead_found', false, 'actions', v_actions);
+    end if;
+    v_user_id  := coalesce(v_lead.user_id, p_default_user_id);
+    v_attempts := coalesce(v_lead.call_attempts, 0);
+
+    -- 0) settle each call once; a completed call that was never billed is handed back for billing
+    if p_external_call_id is not null then
+        insert into public.call_settlements (external_call_id, lead_id, status, duration_seconds)
+        values (p_external_call_id, p_lead_id, p_status, p_duration_seconds)
+        on conflict (external_call_id) do nothing;
+        if not found then
+            select * into v_settled from public.call_settlements where external_call_id = p_external_call_id;
+            if v_settled.status = 'completed' and v_settled.billed_at is null then
+                v_actions := jsonb_build_array(jsonb_build_object(
+                    'type', 'bill', 'user_id', v_user_id, 'duration_seconds', coalesce(v_settled.duration_seconds, 0)));
+            end if;
+            return jsonb_build_object('ok', true, 'lead_found', true, 'already_settled', true,
+                                      'user_id', v_user_id, 'actions', v_actions);
+        end if;
+    end if;
+
+    -- 1) structured call log row
+    update public.call_logs set
+        call_status      = p_status,
+        provider         = p_provider,
+        started_at       = coalesce(p_started_at, started_at),
+        ended_at         = coalesce(p_ended_at, ended_at),
+        duration_seconds = coalesce(p_duration_seconds, duration_seconds),
+        recording_url    = coalesce(p_recording_url, recording_url)
+    where case
+        when p_external_call_id is not null then external_call_id = p_external_call_id
+        else id = (select id from public.call_logs
+                   where lead_id = p_lead_id and call_status = 'queued'
+                   order by created_at desc limit 1)
+    end;
+
+    -- 2) status row
+    insert into public.call_logs (lead_id, user_id, call_status, notes)
+    values (p_lead_id, v_user_id, p_status,
+            left(coalesce(nullif(trim(p_summary), ''), 'external_call_id=' || coalesce(p_external_call_id, '')), 1000));
+
+    -- 3) lead patch + follow-ups
+    if p_status = 'completed' then
+        v_first := nullif(split_part(trim(coalesce(p_name, '')), ' ', 1), '');
+        update public.leads set
+            status           = 'contacted',
+            last_call_status = 'answered',
+            next_call_at     = null,
+            name             = coalesce(nullif(p_name, ''), name),
+            first_name       = coalesce(v_first, first_name),
+            company_name     = coalesce(nullif(p_company, ''), company_name),
+            updated_at       = now()
+        where id = p_lead_id;
+        v_actions := v_actions || jsonb_build_array(jsonb_build_object(
+            'type', 'bill', 'user_id', v_user_id, 'duration_seconds', coalesce(p_duration_seconds, 0)));
+
+    elsif p_status = 'failed' then
+        update public.leads set last_call_status = 'failed', next_call_at = null, updated_at = now()
+        where id = p_lead_id;
+
+    elsif p_status in ('no-answer', 'busy') then
+        select delivery_rules into v_rules from public.campaigns where id = v_lead.campaign_id;
+        v_call_rules := case when jsonb_typeof(v_rules -> 'call') = 'object'
+                             then v_rules -> 'call' else coalesce(v_rules, '{}'::jsonb) end;
+        v_max   := coalesce((v_call_rules ->> 'max_attempts')::integer, p_default_max_attempts);
+        v_retry := coalesce((v_call_rules ->> 'retry_minutes')::integer, p_default_retry_minutes);
+        v_attempts := v_attempts + 1;
+
+        if v_attempts >= v_max then
+            update public.leads set
+                call_attempts = v_attempts, last_call_status = 'max-retries', next_call_at = null, updated_at = now()
+            where id = p_lead_id;
+            insert into public.call_logs (lead_id, user_id, call_status, notes)
+            values (p_lead_id, v_user_id, 'max-retries', format('Reached %s attempts', v_max));
+            v_actions := v_actions || jsonb_build_array(jsonb_build_object('type', 'max_retries'));
+        else
+            v_next := now() + make_interval(mins => v_retry);
+            update public.leads set
+                call_attempts = v_attempts, last_call_status = 'no-answer', next_call_at = v_next, updated_at = now()
+            where id = p_lead_id;
+            insert into public.call_logs (lead_id, user_id, call_status, notes)
+            values (p_lead_id, v_user_id, 'scheduled-retry',
+                    'Retry at ' || to_char(v_next at time zone 'utc', 'YYYY-MM-DD"T"HH24:MI:SS') || ' UTC');
+            v_actions := v_actions || jsonb_build_array(jsonb_build_object('type', 'reschedule', 'next_call_at', v_next));
+        end if;
+    end if;
+
+    return jsonb_build_object(
+        'ok', true,
+        'lead_found', true,
+        'user_id', v_user_id,
+        'campaign_id', v_lead.campaign_id,
+        'call_attempts', v_attempts,
+        'next_call_at', v_next,
+        'actions', v_actions
+    );
+end;
+$$;
+
+-- Server-side only: the API calls this with the service_role key. RLS on call_settlements
+-- leaves it to service_role (which bypasses RLS), and the security definer function must
+-- not be callable through the anon/authenticated keys.
+alter table public.call_settlements enable row level security;
+
+revoke execute on function public.apply_call_event(
+    uuid, text, text, timestamptz, timestamptz, integer, text, text, text, text, text, uuid, integer, integer
+) from public, anon, authenticated;
+grant execute on function public.apply_call_event(
+    uuid, text, text, timestamptz, timestamptz, integer, text, text, text, text, text, uuid, integer, integer
+) to service_role;
@@ -0,0 +1,37 @@
+-- Durable accept jobs: POST /api/accept-jobs stores the batch here and returns at once;
+-- workers claim chunks one at a time (run_accept_jobs_tick in main.py).
+create table if not exists public.accept_jobs (
+    id                 uuid primary key,
+    user_id            uuid not null,
+    campaign_id        text,
+    email_template_id  text,
+    status             text not null default 'queued',   -- queued | running | completed
+    total              integer not null default 0,
+    created_at         timestamptz not null default now(),
+    started_at         timestamptz,
+    finished_at        timestamptz
+);
+
+create table if not exists public.accept_job_chunks (
+    id           bigserial primary key,
+    job_id       uuid not null references public.accept_jobs(id) on delete cascade,
+    chunk_index  integer not null,
+    leads        jsonb,                                  -- raw leads; cleared once done
+    size         integer not null default 0,
+    status       text not null default 'pending',        -- pending | running | done | error
+    lock_token   text,
+    claimed_at   timestamptz,
+    finished_at  timestamptz,
+    saved        integer not null default 0,
+    skipped      integer not null default 0,
+    failed       integer not null default 0,
+    error        text,
+    unique (job_id, chunk_index)
+);
+
+create index if not exists accept_job_chunks_pending_idx
+    on public.accept_job_chunks (status, id) where status in ('pending', 'running');
+
+-- Server-side only (service_role bypasses RLS); no policies, so anon/authenticated get nothing
+alter table public.accept_jobs enable row level security;
+alter table public.accept_job_chunks enable row level security;
@@ -0,0 +1,5 @@
+-- Phone resolved once at accept time (and by backfill_phone_fields.py for older rows)
+alter table public.leads
+    add column if not exists phone_e164  text,
+    add column if not exists phone_tz    text,
+    add column if not exists phone_valid boolean;
@@ -0,0 +1,50 @@
+-- One row per scheduled job; whoever holds an unexpired lease is the only process that runs it.
+-- Leaders renew on every run (try_acquire_scheduler_lease in main.py), so a dead leader's
+-- lease lapses after its TTL and another process takes over.
+create table if not exists public.scheduler_leases (
+    job_id       text primary key,
+    holder       text not null,
+    expires_at   timestamptz not null,
+    acquired_at  timestamptz not null default now(),
+    renewed_at   timestamptz not null default now()
+);
+
+-- Atomically take or renew the lease. Returns true when p_holder holds it afterwards.
+create or replace function public.try_acquire_scheduler_lease(
+    p_job_id       text,
+    p_holder       text,
+    p_ttl_seconds  integer
+) returns boolean
+language plpgsql
+as $$
+declare
+    v_holder text;
+begin
+    insert into public.scheduler_leases as l (job_id, holder, expires_at)
+    values (p_job_id, p_holder, now() + make_interval(secs => p_ttl_seconds))
+    on conflict (job_id) do update
+        set holder      = excluded.holder,
+            expires_at  = excluded.expires_at,
+            renewed_at  = now(),
+            acquired_at = case when l.holder = excluded.holder then l.acquired_at else now() end
+        where l.holder = excluded.holder or l.expires_at < now()
+    returning holder into v_holder;
+
+    return v_holder is not null;
+end;
+$$;
+
+create or replace function public.release_scheduler_lease(p_job_id text, p_holder text)
+returns void
+language sql
+as $$
+    delete from public.scheduler_leases where job_id = p_job_id and holder = p_holder;
+$$;
+
+-- Server-side only (service_role bypasses RLS); no policies, so anon/authenticated get nothing
+alter table public.scheduler_leases enable row level security;
+
+revoke execute on function public.try_acquire_scheduler_lease(text, text, integer) from public, anon, authenticated;
+revoke execute on function public.release_scheduler_lease(text, text) from public, anon, authenticated;
+grant execute on function public.try_acquire_scheduler_lease(text, text, integer) to service_role;
+grant execute on function public.release_scheduler_lease(text, text) to service_role;
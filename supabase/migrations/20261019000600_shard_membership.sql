@@ -0,0 +1,113 @@
+-- Hash-sharded pollers. Every process running a sharded job heartbeats a row here on each
+-- tick; the live members of a job (sorted by instance_id) split the shard space 0..1023 into
+-- contiguous ranges. Members also heartbeat every few seconds between ticks, so a crashed
+-- member's row stops counting once its heartbeat is older than the (short) member TTL.
+create table if not exists public.scheduler_members (
+    job_id        text not null,
+    instance_id   text not null,
+    heartbeat_at  timestamptz not null default now(),
+    joined_at     timestamptz not null default now(),
+    shard_lo      integer,
+    shard_hi      integer,
+    primary key (job_id, instance_id)
+);
+
+-- Stable shard keys (0..1023) for the tables the pollers scan. Plain nullable columns so
+-- the ALTERs are catalog-only (no table rewrite under ACCESS EXCLUSIVE); triggers fill new
+-- and changed rows, backfill_shard_keys() fills existing ones in committed batches, and
+-- 20261019000610_shard_keys_backfill.sql runs it and builds the indexes concurrently.
+-- Until then rows with a null shard_key are scanned by the member owning shard 0.
+alter table public.leads add column if not exists shard_key smallint;
+alter table public.email_outbox add column if not exists shard_key smallint;
+
+create or replace function public.leads_set_shard_key() returns trigger
+language plpgsql
+as $$
+begin
+    new.shard_key := hashtext(new.id::text) & 1023;
+    return new;
+end;
+$$;
+
+drop trigger if exists leads_set_shard_key on public.leads;
+create trigger leads_set_shard_key
+    before insert or update of id on public.leads
+    for each row execute function public.leads_set_shard_key();
+
+create or replace function public.email_outbox_set_shard_key() returns trigger
+language plpgsql
+as $$
+begin
+    new.shard_key := hashtext(coalesce(new.lead_id::text, new.id::text)) & 1023;
+    return new;
+end;
+$$;
+
+drop trigger if exists email_outbox_set_shard_key on public.email_outbox;
+create trigger email_outbox_set_shard_key
+    before insert or update of id, lead_id on public.email_outbox
+    for each row execute function public.email_outbox_set_shard_key();
+
+-- Fill shard_key on existing rows, walking the primary key p_batch rows at a time and
+-- committing after each batch so no lock is held for long. Must be CALLed outside a
+-- transaction block. Safe to re-run.
+create or replace procedure public.backfill_shard_keys(p_batch integer default 5000)
+language plpgsql
+as $$
+declare
+    lo_lead    public.leads.id%type;
+    hi_lead    public.leads.id%type;
+    lo_outbox  public.email_outbox.id%type;
+    hi_outbox  public.email_outbox.id%type;
+begin
+    select id into lo_lead from public.leads order by id limit 1;
+    while lo_lead is not null loop
+        select b.id into hi_lead
+        from (select id from public.leads where id >= lo_lead order by id limit p_batch) b
+        order by b.id desc limit 1;
+        update public.leads set shard_key = hashtext(id::text) & 1023
+        where id >= lo_lead and id <= hi_lead and shard_key is null;
+        commit;
+        select id into lo_lead from public.leads where id > hi_lead order by id limit 1;
+    end loop;
+
+    select id into lo_outbox from public.email_outbox order by id limit 1;
+    while lo_outbox is not null loop
+        select b.id into hi_outbox
+        from (select id from public.email_outbox where id >= lo_outbox order by id limit p_batch) b
+        order by b.id desc limit 1;
+        update public.email_outbox set shard_key = hashtext(coalesce(lead_id::text, id::text)) & 1023
+        where id >= lo_outbox and id <= hi_outbox and shard_key is null;
+        commit;
+        select id into lo_outbox from public.email_outbox where id > hi_outbox order by id limit 1;
+    end loop;
+end;
+$$;
+
+-- Heartbeat p_instance_id for p_job_id and return the live members in assignment order.
+create or replace function public.shard_heartbeat(
+    p_job_id       text,
+    p_instance_id  text,
+    p_ttl_seconds  integer
+) returns table (instance_id text)
+language sql
+as $$
+    insert into public.scheduler_members as m (job_id, instance_id, heartbeat_at)
+    values (p_job_id, p_instance_id, now())
+    on conflict (job_id, instance_id) do update set heartbeat_at = now();
+
+    delete from public.scheduler_members
+    where job_id = p_job_id and heartbeat_at < now() - make_interval(secs => p_ttl_seconds * 10);
+
+    select m.instance_id from public.scheduler_members m
+    where m.job_id = p_job_id
+      and m.heartbeat_at >= now() - make_interval(secs => p_ttl_seconds)
+    order by m.instance_id;
+$$;
+
+-- Server-side only (service_role bypasses RLS); no policies, so anon/authenticated get nothing
+alter table public.scheduler_members enable row level security;
+
+revoke execute on function public.shard_heartbeat(text, text, integer) from public, anon, authenticated;
+revoke execute on procedure public.backfill_shard_keys(integer) from public, anon, authenticated;
+grant execute on function public.shard_heartbeat(text, text, integer) to service_role;
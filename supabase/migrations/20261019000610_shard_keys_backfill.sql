@@ -0,0 +1,12 @@
+-- Backfill shard_key and build the shard indexes without blocking writers.
+-- Run outside a transaction block: backfill_shard_keys() commits per batch and
+-- create index concurrently refuses to run inside one (e.g. psql -f, not a wrapped migration).
+call public.backfill_shard_keys(5000);
+
+create index concurrently if not exists leads_shard_next_call_idx
+    on public.leads (shard_key, next_call_at)
+    where next_call_at is not null;
+
+create index concurrently if not exists email_outbox_queued_shard_idx
+    on public.email_outbox (shard_key, send_after)
+    where status = 'queued';
@@ -0,0 +1,31 @@
+-- Scrape jobs (POST /api/scrape-jobs). The process that starts a job runs it; the row lets
+-- any web worker answer status / items / stream requests. Items stay in the Apify dataset.
+-- The running process bumps updated_at as a heartbeat; an unfinished job whose heartbeat
+-- stops (its process died) is marked error by whoever reads it next.
+create table if not exists public.scrape_jobs (
+    id            uuid primary key,
+    user_id       text,
+    prompt        text,
+    count         integer not null,
+    actor_input   jsonb,
+    cache_key     text,
+    cache_hit     boolean not null default false,
+    status        text not null default 'queued',   -- queued | running | done | error
+    apify_status  text,
+    run_id        text,
+    dataset_id    text,
+    error         text,
+    created_at    timestamptz not null default now(),
+    started_at    timestamptz,
+    finished_at   timestamptz,
+    updated_at    timestamptz not null default now()
+);
+
+create index if not exists scrape_jobs_finished_idx
+    on public.scrape_jobs (finished_at) where finished_at is not null;
+
+create index if not exists scrape_jobs_unfinished_idx
+    on public.scrape_jobs (updated_at) where status in ('queued', 'running');
+
+-- Server-side only (service_role bypasses RLS); no policies, so anon/authenticated get nothing
+alter table public.scrape_jobs enable row level security;
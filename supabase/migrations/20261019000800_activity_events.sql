@@ -0,0 +1,26 @@
+-- Live activity fan-out. publish_activity appends a row here from whichever process saw the
+-- event (web worker or worker.py); every web process with SSE subscribers tails new ids and
+-- delivers them locally. Rows are only a short relay buffer and are pruned by the scheduler.
+-- Processes with subscribers heartbeat into activity_listeners; publishers skip the insert
+-- while nobody is listening anywhere.
+create table if not exists public.activity_events (
+    id           bigserial primary key,
+    event_type   text not null,
+    lead_id      text,
+    campaign_id  text,
+    payload      jsonb not null default '{}'::jsonb,
+    created_at   timestamptz not null default now()
+);
+
+create index if not exists activity_events_created_at_idx
+    on public.activity_events (created_at);
+
+create table if not exists public.activity_listeners (
+    instance_id   text primary key,
+    subscribers   integer not null default 0,
+    heartbeat_at  timestamptz not null default now()
+);
+
+-- Server-side only (service_role bypasses RLS); no policies, so anon/authenticated get nothing
+alter table public.activity_events enable row level security;
+alter table public.activity_listeners enable row level security;
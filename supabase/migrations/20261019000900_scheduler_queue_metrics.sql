@@ -0,0 +1,18 @@
+-- Per-process scheduler queue metrics. Each process running the scheduler (worker.py, or a
+-- web process with WEB_RUNS_SCHEDULER=true) upserts its snapshot periodically so
+-- GET /api/scheduler/queues on any web process can show worker utilization.
+create table if not exists public.scheduler_queue_metrics (
+    instance_id  text primary key,
+    role         text not null,
+    queues       jsonb not null default '{}'::jsonb,
+    shards       jsonb not null default '{}'::jsonb,
+    call_heap    jsonb not null default '{}'::jsonb,
+    started_at   timestamptz,
+    reported_at  timestamptz not null default now()
+);
+
+create index if not exists scheduler_queue_metrics_reported_at_idx
+    on public.scheduler_queue_metrics (reported_at);
+
+-- Server-side only (service_role bypasses RLS); no policies, so anon/authenticated get nothing
+alter table public.scheduler_queue_metrics enable row level security;
@@ -0,0 +1,25 @@
+-- Durable inbox for Vapi webhook events. /vapi/webhook writes the event here before it
+-- acks, so an event whose processing fails (or whose process dies) is retried with backoff
+-- by recover_vapi_events in main.py instead of being lost; Vapi never redelivers a 2xx.
+create table if not exists public.vapi_event_inbox (
+    id               bigserial primary key,
+    event_key        text,
+    payload          jsonb not null,
+    status           text not null default 'processing',   -- processing | pending | done | dead
+    attempts         integer not null default 0,
+    next_attempt_at  timestamptz,
+    locked_by        text,
+    locked_at        timestamptz,
+    last_error       text,
+    received_at      timestamptz not null default now(),
+    processed_at     timestamptz
+);
+
+create index if not exists vapi_event_inbox_open_idx
+    on public.vapi_event_inbox (status, next_attempt_at) where status in ('pending', 'processing');
+
+create index if not exists vapi_event_inbox_done_idx
+    on public.vapi_event_inbox (processed_at) where status = 'done';
+
+-- Server-side only (service_role bypasses RLS); no policies, so anon/authenticated get nothing
+alter table public.vapi_event_inbox enable row level security;
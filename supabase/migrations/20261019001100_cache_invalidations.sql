@@ -0,0 +1,15 @@
+-- Cross-process read-cache invalidations. A process that changes cached data (e.g. an
+-- admin grant/revoke in _upsert_profile_flag) appends (ns, key) here; every process polls
+-- new ids and drops its local entry, so cached positives can't outlive a revocation.
+create table if not exists public.cache_invalidations (
+    id          bigserial primary key,
+    ns          text not null,
+    key         text,
+    created_at  timestamptz not null default now()
+);
+
+create index if not exists cache_invalidations_created_at_idx
+    on public.cache_invalidations (created_at);
+
+-- Server-side only (service_role bypasses RLS); no policies, so anon/authenticated get nothing
+alter table public.cache_invalidations enable row level security;
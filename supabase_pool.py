@@ -0,0 +1,160 @@
+# supabase_pool.py
+"""
+A small pool of Supabase clients shared by request threads, BackgroundTasks and
+scheduler jobs, so concurrent work does not queue behind one client's connection.
+
+    from supabase_pool import pooled_client
+    supabase = pooled_client(SUPABASE_URL, SUPABASE_KEY)   # drop-in for create_client(...)
+
+    supabase.table("leads")...            # uses the client pinned to the calling thread
+    with supabase.checkout() as sb:       # explicit unit of work on the least busy client
+        sb.table("leads")...
+
+Each thread is pinned to the least-loaded client the first time it touches the proxy.
+PostgREST sessions get a tuned httpx pool (keep-alive, optional HTTP/2 when `h2` is installed).
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from supabase import create_client, Client
+
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "4"))
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() == "true"
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "10"))
+SUPABASE_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY_SECONDS", "60"))
+
+try:
+    import httpx
+    _HTTPX_AVAILABLE = True
+except Exception:
+    _HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401  (httpx needs it for http2=True)
+    _H2_AVAILABLE = True
+except Exception:
+    _H2_AVAILABLE = False
+
+
+def _tune_postgrest_session(client: Client) -> bool:
+    """Swap the PostgREST httpx session for one with explicit pool limits (and HTTP/2 if possible)."""
+    if not _HTTPX_AVAILABLE:
+        return False
+    try:
+        pg = client.postgrest
+        old = pg.session
+        pg.session = httpx.Client(
+            base_url=old.base_url,
+            headers=old.headers,
+            timeout=old.timeout,
+            http2=SUPABASE_HTTP2 and _H2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+                keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            follow_redirects=True,
+        )
+        old.close()
+        return True
+    except Exception as e:
+        print("[SUPABASE][POOL] could not tune PostgREST session; using defaults:", e)
+        return False
+
+
+class SupabasePool:
+    def __init__(self, url: str, key: str, size: int = SUPABASE_POOL_SIZE):
+        self._clients: List[Client] = []
+        self._stats: List[Dict[str, float]] = []
+        for _ in range(max(1, int(size))):
+            c = create_client(url, key)
+            tuned = _tune_postgrest_session(c)
+            self._clients.append(c)
+            self._stats.append({"ops": 0, "threads": 0, "in_use": 0, "checkouts": 0,
+                                "checkout_ms": 0.0, "tuned": tuned})
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _least_loaded(self) -> int:
+        return min(range(len(self._clients)),
+                   key=lambda i: (self._stats[i]["in_use"], self._stats[i]["threads"], self._stats[i]["ops"]))
+
+    def _current_index(self) -> int:
+        idx = getattr(self._local, "idx", None)
+        if idx is None:
+            with self._lock:
+                idx = self._least_loaded()
+                self._stats[idx]["threads"] += 1
+            self._local.idx = idx
+        return idx
+
+    def current(self) -> Client:
+        idx = self._current_index()
+        with self._lock:
+            self._stats[idx]["ops"] += 1
+        return self._clients[idx]
+
+    @contextmanager
+    def checkout(self):
+        """Pin the calling thread to the least busy client for the duration of the block."""
+        with self._lock:
+            idx = self._least_loaded()
+            st = self._stats[idx]
+            st["in_use"] += 1
+            st["checkouts"] += 1
+        prev = getattr(self._local, "idx", None)
+        self._local.idx = idx
+        t0 = time.monotonic()
+        try:
+            yield self._clients[idx]
+        finally:
+            self._local.idx = prev
+            with self._lock:
+                st["in_use"] -= 1
+                st["checkout_ms"] += (time.monotonic() - t0) * 1000.0
+
+    def metrics(self) -> dict:
+        with self._lock:
+            clients = [{
+                "index": i,
+                "ops": int(st["ops"]),
+                "threads_pinned": int(st["threads"]),
+                "in_use": int(st["in_use"]),
+                "checkouts": int(st["checkouts"]),
+                "avg_checkout_ms": round(st["checkout_ms"] / st["checkouts"], 1) if st["checkouts"] else None,
+                "tuned_session": bool(st["tuned"]),
+            } for i, st in enumerate(self._stats)]
+        return {"size": len(self._clients), "http2": SUPABASE_HTTP2 and _H2_AVAILABLE, "clients": clients}
+
+
+class PooledSupabase:
+    """Client-shaped proxy: attribute access goes to the client pinned to the calling thread."""
+
+    def __init__(self, pool: SupabasePool):
+        self._pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self._pool.current(), name)
+
+    def checkout(self):
+        return self._pool.checkout()
+
+    def pool_metrics(self) -> dict:
+        return self._pool.metrics()
+
+
+_pools: Dict[Tuple[str, str], PooledSupabase] = {}
+_pools_lock = threading.Lock()
+
+
+def pooled_client(url: str, key: str, size: int = SUPABASE_POOL_SIZE) -> PooledSupabase:
+    """One shared pool per (url, key) in the process."""
+    with _pools_lock:
+        proxy = _pools.get((url, key))
+        if proxy is None:
+            proxy = _pools[(url, key)] = PooledSupabase(SupabasePool(url, key, size))
+        return proxy
@@ -0,0 +1,59 @@
+# worker.py
+# Standalone scheduler process: runs the background jobs (calls, outbox, follow-ups,
+# accept jobs, Gmail) on their own per-queue executors without serving the API.
+#
+#   python worker.py
+#
+# Pair it with WEB_RUNS_SCHEDULER=false on the web processes (see fly.toml [processes]).
+# Queue metrics are logged here and reported to scheduler_queue_metrics, which
+# GET /api/scheduler/queues on the web processes reads.
+import os
+import signal
+import threading
+
+# main.py reads the role at import time
+os.environ.setdefault("PROCESS_ROLE", "worker")
+
+import main
+
+WORKER_METRICS_LOG_SECONDS = int(os.getenv("WORKER_METRICS_LOG_SECONDS", "300"))
+
+_stop = threading.Event()
+
+def _log_queue_metrics():
+    for name, q in main.scheduler_queue_metrics().items():
+        print(f"[WORKER][QUEUE] {name}: util={q['utilization']:.1%} running={q['running']}/{q['workers']} "
+              f"runs={q['runs']} failures={q['failures']} skipped_busy={q['skipped_busy']} "
+              f"skipped_not_owner={q['skipped_not_owner']} "
+              f"missed={q['missed']} avg_s={q['avg_seconds']} max_s={q['max_seconds']}")
+
+def _handle_signal(signum, _frame):
+    print(f"[WORKER] signal {signum}; shutting down")
+    _stop.set()
+
+def run():
+    if main.SKIP_SUPABASE_PROBE:
+        print("[Supabase] Probe skipped by SKIP_SUPABASE_PROBE=true")
+    else:
+        main._assert_supabase_ok()
+
+    signal.signal(signal.SIGTERM, _handle_signal)
+    signal.signal(signal.SIGINT, _handle_signal)
+
+    main.start_scheduler()
+    print(f"[WORKER] running as {main.SCHEDULER_INSTANCE_ID}; queues: "
+          + ", ".join(f"{n}={c['workers']}" for n, c in main.SCHEDULER_QUEUES.items()))
+
+    while not _stop.wait(max(5, WORKER_METRICS_LOG_SECONDS)):
+        _log_queue_metrics()
+
+    # Let in-flight jobs finish, then hand leases and shards to the other workers
+    main.scheduler.shutdown(wait=True)
+    main.release_scheduler_leases()
+    main.leave_shard_groups()
+    main.clear_scheduler_metrics()
+    _log_queue_metrics()
+    print("[WORKER] stopped")
+
+if __name__ == "__main__":
+    run()